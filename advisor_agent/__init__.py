@@ -1,5 +1,5 @@
 """Advisor agent module for the FoundryLocal multi-agent workflow."""
 
-from .agent import advisor_agent
+from .agent import advisor_agent, ADVISOR_AGENT_SECTIONS
 
-__all__ = ["advisor_agent"]
\ No newline at end of file
+__all__ = ["advisor_agent", "ADVISOR_AGENT_SECTIONS"]
\ No newline at end of file
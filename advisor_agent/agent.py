@@ -7,6 +7,9 @@ into actionable recommendations and presenting the final outcome to the user.
 import os
 from dotenv import load_dotenv
 
+from agent_runtime.cassette import cassette_client
+from agent_runtime.transport import model_async_client
+
 load_dotenv()
 
 try:
@@ -125,12 +128,31 @@ Always provide a complete, full response. Do not repeat information unnecessaril
 
 Remember: Your role is to be the definitive voice that synthesizes everything into a clear path forward. Users should feel confident they have a complete, actionable plan after reading your response."""
 
+# Ordered headings of the response skeleton above; the last one closes the answer.
+ADVISOR_AGENT_SECTIONS = (
+	"EXECUTIVE SUMMARY",
+	"KEY FINDINGS & ANALYSIS",
+	"PRIORITY RECOMMENDATIONS",
+	"RISK ASSESSMENT & MITIGATION",
+	"SUCCESS METRICS & MONITORING",
+	"NEXT STEPS CHECKLIST",
+	"ADDITIONAL CONSIDERATIONS",
+)
+
 def _build_client() -> OpenAIChatClient:
 	base_url = os.environ.get("FOUNDRYLOCAL_ENDPOINT")
 	model_id = os.environ.get("FOUNDRYLOCAL_MODEL_DEPLOYMENT_NAME") 
 	api_key = "nokey"
+	# MODEL_CASSETTE_MODE=record|replay routes the traffic through a cassette file.
+	async_client = cassette_client("advisor_agent", base_url, api_key)
+	if async_client is not None:
+		return OpenAIChatClient(model_id=model_id or "cassette-model", async_client=async_client)
 	if not base_url:
 		raise RuntimeError("No model endpoint configured. Set FOUNDRYLOCAL_ENDPOINT or GITHUB_ENDPOINT.")
+	# MODEL_HTTP2=true multiplexes all agents' generations over one HTTP/2 connection.
+	async_client = model_async_client(base_url, api_key)
+	if async_client is not None:
+		return OpenAIChatClient(model_id=model_id, async_client=async_client)
 	return OpenAIChatClient(base_url=base_url, api_key=api_key, model_id=model_id)
 
 try:
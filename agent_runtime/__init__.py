@@ -0,0 +1,6 @@
+"""Shared runtime support for the FoundryLocal workflow agents."""
+
+from .sections import SectionTracker
+from .stage import StageAgent
+
+__all__ = ["SectionTracker", "StageAgent"]
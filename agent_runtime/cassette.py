@@ -0,0 +1,224 @@
+"""Record and replay of chat-completion traffic.
+
+`MODEL_CASSETTE_MODE=record` sends each agent's requests to the real model
+and saves every exchange, including the timing of each streamed chunk, to
+`MODEL_CASSETTE_DIR/<agent>.json`. `MODEL_CASSETTE_MODE=replay` answers
+the same requests from those files without any model server, either
+instantly or at a multiple of the recorded pace (`MODEL_CASSETTE_SPEED=1`
+keeps it, `2` replays twice as fast):
+
+	MODEL_CASSETTE_MODE=record python test_workflow.py     # once, with Foundry Local
+	MODEL_CASSETTE_MODE=replay python test_workflow.py     # anywhere, deterministic
+
+Both modes work below the OpenAI SDK, as an httpx transport of the agents'
+`AsyncOpenAI` client, so retries, streaming and parsing run unchanged.
+Requests are matched on their body (messages and options, ignoring the
+model name), and a recording can be replayed any number of times. A request
+that was not recorded verbatim, because an upstream answer differed, for
+example, gets the agent's next exchange in recorded order.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, AsyncIterator, Optional
+
+import httpx
+
+from .config import env_float
+
+logger = logging.getLogger(__name__)
+
+CASSETTE_MODES = ("off", "record", "replay")
+DEFAULT_CASSETTE_DIR = "cassettes/default"
+
+# Not replayed: they describe the original connection, not the answer.
+_DROP_HEADERS = {"content-length", "transfer-encoding", "connection", "date", "keep-alive"}
+
+
+class CassetteMiss(LookupError):
+	"""Raised in replay mode when an agent has no recorded exchanges."""
+
+
+def cassette_mode() -> str:
+	mode = (os.environ.get("MODEL_CASSETTE_MODE") or "off").strip().lower()
+	if mode not in CASSETTE_MODES:
+		logger.warning("Unknown MODEL_CASSETTE_MODE %r; cassettes are off", mode)
+		return "off"
+	return mode
+
+
+def request_key(request: httpx.Request) -> str:
+	"""Stable key of a request: method, path and JSON body without the model name."""
+	try:
+		body = json.loads(request.content or b"null")
+	except ValueError:
+		body = request.content.decode("utf-8", "replace")
+	if isinstance(body, dict):
+		body.pop("model", None)
+	canonical = json.dumps([request.method, request.url.path, body], sort_keys=True, ensure_ascii=False)
+	return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+def _encode(chunk: bytes) -> str:
+	# Chunks may split multi-byte characters; surrogateescape round-trips any bytes.
+	return chunk.decode("utf-8", "surrogateescape")
+
+
+class Cassette:
+	"""The recorded exchanges of one agent, kept in a JSON file."""
+
+	def __init__(self, path: Path) -> None:
+		self.path = path
+		self.exchanges: list[dict[str, Any]] = []
+		if path.exists():
+			self.exchanges = json.loads(path.read_text(encoding="utf-8"))["exchanges"]
+		self._used: set[int] = set()
+
+	def save(self) -> None:
+		self.path.parent.mkdir(parents=True, exist_ok=True)
+		tmp = self.path.with_suffix(".tmp")
+		tmp.write_text(json.dumps({"version": 1, "exchanges": self.exchanges}, indent=1), encoding="utf-8")
+		tmp.replace(self.path)
+
+	def find(self, key: str) -> dict[str, Any]:
+		"""The exchange to replay for a request with `key`.
+
+		Unused exact matches come first, then used ones (so one recording
+		can serve many concurrent sessions in a load test), then the other
+		exchanges in recorded order.
+		"""
+		if not self.exchanges:
+			raise CassetteMiss(f"No recorded exchanges in {self.path} (record them with MODEL_CASSETTE_MODE=record)")
+		matches = [i for i, exchange in enumerate(self.exchanges) if exchange["key"] == key]
+		unused = [i for i in matches if i not in self._used]
+		if unused or matches:
+			index = (unused or matches)[0]
+		else:
+			others = [i for i in range(len(self.exchanges)) if i not in self._used]
+			index = others[0] if others else len(self._used) % len(self.exchanges)
+			logger.warning("No exact match in %s; replaying exchange %d in recorded order", self.path.name, index)
+		self._used.add(index)
+		return self.exchanges[index]
+
+
+class _RecordingStream(httpx.AsyncByteStream):
+	def __init__(self, inner: httpx.AsyncByteStream, exchange: dict[str, Any], started: float, on_close: Any) -> None:
+		self._inner = inner
+		self._exchange = exchange
+		self._started = started
+		self._on_close = on_close
+
+	async def __aiter__(self) -> AsyncIterator[bytes]:
+		async for chunk in self._inner:
+			self._exchange["response"]["chunks"].append([round(time.perf_counter() - self._started, 4), _encode(chunk)])
+			yield chunk
+
+	async def aclose(self) -> None:
+		await self._inner.aclose()
+		await self._on_close(self._exchange)
+
+
+class _ReplayStream(httpx.AsyncByteStream):
+	def __init__(self, chunks: list[list[Any]], speed: float) -> None:
+		self._chunks = chunks
+		self._speed = speed
+
+	async def __aiter__(self) -> AsyncIterator[bytes]:
+		started = time.perf_counter()
+		for offset, text in self._chunks:
+			if self._speed > 0:
+				delay = offset / self._speed - (time.perf_counter() - started)
+				if delay > 0:
+					await asyncio.sleep(delay)
+			yield text.encode("utf-8", "surrogateescape")
+
+
+class CassetteTransport(httpx.AsyncBaseTransport):
+	"""httpx transport that records to, or replays from, one agent's cassette.
+
+	Args:
+		path: Cassette file.
+		mode: `record` or `replay`.
+		speed: Replay pace as a multiple of the recorded one; 1 keeps the
+			recorded chunk timing, 2 halves it, 0 replays instantly
+			(`MODEL_CASSETTE_SPEED`).
+		inner: Transport used while recording.
+	"""
+
+	def __init__(self, path: Path, mode: str, *, speed: Optional[float] = None, inner: Optional[httpx.AsyncBaseTransport] = None) -> None:
+		if mode not in ("record", "replay"):
+			raise ValueError(f"Cassette mode must be 'record' or 'replay', not {mode!r}")
+		self.mode = mode
+		self.speed = speed if speed is not None else env_float("MODEL_CASSETTE_SPEED", 0.0)
+		self.cassette = Cassette(path)
+		if mode == "record":
+			# A new recording replaces the old one instead of growing it.
+			self.cassette.exchanges = []
+		self._inner = inner or httpx.AsyncHTTPTransport()
+		self._lock = threading.Lock()
+
+	async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+		await request.aread()
+		key = request_key(request)
+		if self.mode == "replay":
+			exchange = self.cassette.find(key)
+			response = exchange["response"]
+			return httpx.Response(response["status"], headers=response["headers"], stream=_ReplayStream(response["chunks"], self.speed))
+
+		started = time.perf_counter()
+		response = await self._inner.handle_async_request(request)
+		exchange = {
+			"key": key,
+			"request": {"method": request.method, "path": request.url.path, "body": _encode(request.content)},
+			"response": {
+				"status": response.status_code,
+				"headers": [[k, v] for k, v in response.headers.items() if k.lower() not in _DROP_HEADERS],
+				"chunks": [],
+			},
+		}
+		return httpx.Response(
+			response.status_code,
+			headers=response.headers,
+			stream=_RecordingStream(response.stream, exchange, started, self._append),  # type: ignore[arg-type]
+			extensions=response.extensions,
+		)
+
+	async def _append(self, exchange: dict[str, Any]) -> None:
+		await asyncio.to_thread(self._save, exchange)
+
+	def _save(self, exchange: dict[str, Any]) -> None:
+		with self._lock:
+			self.cassette.exchanges.append(exchange)
+			self.cassette.save()
+
+	async def aclose(self) -> None:
+		await self._inner.aclose()
+
+
+def cassette_client(agent: str, base_url: Optional[str], api_key: str) -> Optional[Any]:
+	"""`AsyncOpenAI` client recording or replaying `agent`'s traffic, or None when off.
+
+	In replay mode no endpoint is needed; a placeholder URL is used if
+	`base_url` is unset.
+	"""
+	mode = cassette_mode()
+	if mode == "off":
+		return None
+	if mode == "record" and not base_url:
+		raise RuntimeError("Recording model traffic needs a model endpoint. Set FOUNDRYLOCAL_ENDPOINT.")
+	from openai import AsyncOpenAI
+
+	directory = Path(os.environ.get("MODEL_CASSETTE_DIR") or DEFAULT_CASSETTE_DIR)
+	transport = CassetteTransport(directory / f"{agent}.json", mode)
+	logger.info("Model traffic of %s: %s %s", agent, mode, transport.cassette.path)
+	return AsyncOpenAI(
+		base_url=base_url or "http://cassette.invalid/v1/",
+		api_key=api_key,
+		http_client=httpx.AsyncClient(transport=transport, timeout=httpx.Timeout(600.0, connect=10.0)),
+	)
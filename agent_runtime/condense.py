@@ -0,0 +1,217 @@
+"""Map-reduce condensing of very long user requests.
+
+A pasted specification or document would reach the planner as one huge
+prompt: slow to prefill and liable to overflow the small context window of
+a local model. A request longer than `INPUT_CONDENSE_THRESHOLD_TOKENS` is
+therefore condensed before the first stage sees it:
+
+1. map: the text is split at paragraph boundaries into chunks of at most
+   `INPUT_CONDENSE_CHUNK_TOKENS`, and each chunk is summarized, at most
+   `INPUT_CONDENSE_CONCURRENCY` at a time;
+2. reduce: the summaries are combined into one brief. If they are still
+   too long for a single call, they are condensed again the same way.
+
+Every call takes a model slot of the request's priority class, like a
+stage does. Summaries are cached on disk under `INPUT_CONDENSE_CACHE_DIR`,
+keyed by the text and the condenser's instructions and model, so
+submitting the same document again (or an edited copy) only summarizes
+the chunks that changed.
+"""
+
+import asyncio
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+from .config import env_int
+from .metrics import REGISTRY
+from .priority import model_scheduler
+from .tokens import Tokenizer, get_tokenizer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = ".cache/chunks"
+
+CONDENSED = REGISTRY.counter("input_condense_total", "Long user requests condensed before planning")
+CHUNKS = REGISTRY.counter("input_condense_chunks_total", "Chunk summaries of long requests, by outcome (cached, summarized)")
+SECONDS = REGISTRY.summary("input_condense_seconds", "Time spent condensing a long user request")
+
+MAP_PROMPT = "Summarize this excerpt of a long user request:\n\n"
+REDUCE_PROMPT = "Combine these summaries of consecutive parts of one user request into a single brief:\n\n"
+
+# Reduce rounds before the summaries are joined as they are.
+_MAX_ROUNDS = 3
+
+_PARAGRAPHS = re.compile(r"\n\s*\n")
+
+
+def split_chunks(text: str, max_tokens: int, tokenizer: Tokenizer) -> Iterator[str]:
+	"""Split `text` into chunks of at most `max_tokens`, keeping paragraphs whole where possible.
+
+	An oversized paragraph is cut into pieces. A model tokenizer's `head`
+	decodes token ids, which may not give back an exact prefix of the text;
+	the approximate tokenizer is used for such a paragraph instead, so no
+	text is repeated or lost.
+	"""
+	chunk: list[str] = []
+	size = 0
+	for paragraph in _PARAGRAPHS.split(text):
+		paragraph = paragraph.strip()
+		if not paragraph:
+			continue
+		tokens = tokenizer.count(paragraph)
+		if chunk and size + tokens > max_tokens:
+			yield "\n\n".join(chunk)
+			chunk, size = [], 0
+		while tokens > max_tokens:
+			piece = tokenizer.head(paragraph, max_tokens)
+			if not paragraph.startswith(piece):
+				piece = Tokenizer().head(paragraph, max_tokens)
+			if not piece:
+				break
+			yield piece.strip()
+			paragraph = paragraph[len(piece):].strip()
+			tokens = tokenizer.count(paragraph)
+		if paragraph:
+			chunk.append(paragraph)
+			size += tokens
+	if chunk:
+		yield "\n\n".join(chunk)
+
+
+@dataclass
+class CondensedInput:
+	"""A request as the first stage receives it, with how it was condensed."""
+
+	text: str
+	report: Optional[dict[str, Any]] = field(default=None)
+
+
+class InputCondenser:
+	"""Condenses long requests with `agent` (any object with an async `run`).
+
+	Args:
+		agent: The agent that writes the summaries; its instructions say how
+			(see `plan_agent.input_condenser`).
+		threshold: Requests longer than this many tokens are condensed
+			(`INPUT_CONDENSE_THRESHOLD_TOKENS`, default 3000; 0 disables).
+		chunk_tokens: Largest chunk sent in one call (`INPUT_CONDENSE_CHUNK_TOKENS`).
+		concurrency: Chunks summarized at the same time (`INPUT_CONDENSE_CONCURRENCY`).
+		cache_dir: Where summaries are kept (`INPUT_CONDENSE_CACHE_DIR`); an
+			empty string disables the cache.
+	"""
+
+	def __init__(
+		self,
+		agent: Any,
+		*,
+		threshold: Optional[int] = None,
+		chunk_tokens: Optional[int] = None,
+		concurrency: Optional[int] = None,
+		cache_dir: Optional[str] = None,
+	) -> None:
+		self.agent = agent
+		self.threshold = threshold if threshold is not None else env_int("INPUT_CONDENSE_THRESHOLD_TOKENS", 3000)
+		self.chunk_tokens = max(64, chunk_tokens if chunk_tokens is not None else env_int("INPUT_CONDENSE_CHUNK_TOKENS", 1500))
+		self.concurrency = max(1, concurrency if concurrency is not None else env_int("INPUT_CONDENSE_CONCURRENCY", 2))
+		if cache_dir is None:
+			cache_dir = os.environ.get("INPUT_CONDENSE_CACHE_DIR", DEFAULT_CACHE_DIR)
+		self.cache_dir = Path(cache_dir) if cache_dir else None
+		client = getattr(agent, "chat_client", None)
+		self.model = getattr(client, "model_id", None)
+		self.tokenizer = get_tokenizer(self.model)
+		options = getattr(agent, "chat_options", None)
+		# Summaries written under other instructions or by another model are not reused.
+		self._version = f"{getattr(options, 'instructions', None)}\0{self.model}"
+
+	def needed(self, text: str) -> bool:
+		"""True when `text` is long enough to be condensed."""
+		return self.threshold > 0 and self.tokenizer.count(text or "") > self.threshold
+
+	async def condense(self, text: str) -> CondensedInput:
+		"""`text` unchanged if it is short, otherwise the brief the summaries reduce to."""
+		if not self.needed(text):
+			return CondensedInput(text)
+		started = time.perf_counter()
+		report = {"tokens": self.tokenizer.count(text), "chunks": 0, "cached": 0}
+		semaphore = asyncio.Semaphore(self.concurrency)
+		parts = list(split_chunks(text, self.chunk_tokens, self.tokenizer))
+		report["chunks"] = len(parts)
+		summaries = await asyncio.gather(*(self._summarize(MAP_PROMPT, part, semaphore, report) for part in parts))
+		brief = ""
+		for _ in range(_MAX_ROUNDS):
+			joined = "\n\n".join(f"[{n}] {summary}" for n, summary in enumerate(summaries, 1))
+			if len(summaries) == 1:
+				brief = summaries[0]
+				break
+			if self.tokenizer.count(joined) <= self.chunk_tokens:
+				brief = await self._summarize(REDUCE_PROMPT, joined, semaphore, report)
+				break
+			# Too long to combine in one call: condense the summaries themselves.
+			groups = list(split_chunks(joined, self.chunk_tokens, self.tokenizer))
+			summaries = await asyncio.gather(*(self._summarize(REDUCE_PROMPT, group, semaphore, report) for group in groups))
+		else:
+			brief = "\n\n".join(summaries)
+		report["brief_tokens"] = self.tokenizer.count(brief)
+		elapsed = time.perf_counter() - started
+		CONDENSED.inc()
+		SECONDS.observe(elapsed)
+		logger.info(
+			"Condensed a %d-token request in %d chunks (%d cached) to %d tokens in %.1fs",
+			report["tokens"], report["chunks"], report["cached"], report["brief_tokens"], elapsed,
+		)
+		return CondensedInput(brief, report)
+
+	async def _summarize(self, task: str, text: str, semaphore: asyncio.Semaphore, report: dict[str, Any]) -> str:
+		key = self._key(task, text)
+		cached = await asyncio.to_thread(self._load, key)
+		if cached is not None:
+			report["cached"] += 1
+			CHUNKS.inc(outcome="cached")
+			return cached
+		async with semaphore, model_scheduler().slot():
+			response = await self.agent.run(task + text)
+		summary = response.text.strip()
+		CHUNKS.inc(outcome="summarized")
+		if summary:
+			await asyncio.to_thread(self._store, key, summary)
+		return summary or text
+
+	def _key(self, task: str, text: str) -> str:
+		return hashlib.sha256(f"{self._version}\0{task}\0{text}".encode("utf-8")).hexdigest()[:32]
+
+	def _load(self, key: str) -> Optional[str]:
+		if self.cache_dir is None:
+			return None
+		try:
+			return json.loads((self.cache_dir / f"{key}.json").read_text(encoding="utf-8"))["summary"]
+		except (OSError, ValueError, KeyError):
+			return None
+
+	def _store(self, key: str, summary: str) -> None:
+		"""Cache a summary; best effort, a failed write only costs a later recomputation."""
+		if self.cache_dir is None:
+			return
+		tmp = None
+		try:
+			self.cache_dir.mkdir(parents=True, exist_ok=True)
+			# A temporary file of its own, as concurrent runs may condense the same part.
+			with tempfile.NamedTemporaryFile(
+				"w", encoding="utf-8", dir=self.cache_dir, prefix=f".{key}.", suffix=".tmp", delete=False
+			) as handle:
+				tmp = handle.name
+				handle.write(json.dumps({"summary": summary}))
+			os.replace(tmp, self.cache_dir / f"{key}.json")
+		except OSError as exc:
+			logger.warning("Could not cache a condensed part in %s: %s", self.cache_dir, exc)
+			if tmp is not None:
+				with contextlib.suppress(OSError):
+					os.unlink(tmp)
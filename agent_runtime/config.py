@@ -0,0 +1,36 @@
+"""Environment helpers shared by the agent runtime modules.
+
+All optional behaviour in this project is switched on through environment
+variables (usually set in `.env`), mirroring how the agents read
+`FOUNDRYLOCAL_ENDPOINT` and `FOUNDRYLOCAL_MODEL_DEPLOYMENT_NAME`.
+"""
+
+import os
+
+_TRUTHY = {"1", "true", "yes", "on"}
+
+
+def env_flag(name: str, default: bool = False) -> bool:
+	"""Return True when the variable is set to a truthy value."""
+	value = os.environ.get(name)
+	if value is None or not value.strip():
+		return default
+	return value.strip().lower() in _TRUTHY
+
+
+def env_int(name: str, default: int) -> int:
+	"""Read an integer variable, falling back to `default` when unset or invalid."""
+	value = os.environ.get(name)
+	try:
+		return int(value) if value not in (None, "") else default
+	except ValueError:
+		return default
+
+
+def env_float(name: str, default: float) -> float:
+	"""Read a float variable, falling back to `default` when unset or invalid."""
+	value = os.environ.get(name)
+	try:
+		return float(value) if value not in (None, "") else default
+	except ValueError:
+		return default
@@ -0,0 +1,160 @@
+"""Pre-flight prompt size checks against the model's context window.
+
+Each stage sends its instructions plus the whole conversation so far (the
+user's request and every upstream stage's answer). Before the request goes
+out, `fit_prompt` counts those tokens locally and compares them with
+`MODEL_CONTEXT_WINDOW` minus the room kept for the answer
+(`CONTEXT_OUTPUT_RESERVE`). An oversized prompt is trimmed according to
+`CONTEXT_TRIM_POLICY`:
+
+	largest  shorten the longest upstream answers first (default)
+	oldest   shorten the earliest upstream answers first
+	fail     never trim
+
+Only upstream answers are trimmed; the instructions and the user's request
+are sent unchanged. A trimmed answer keeps its beginning and end around a
+marker. When the prompt still does not fit, `ContextWindowExceeded` is
+raised instead of starting a generation that would fail or be truncated.
+"""
+
+import logging
+import os
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from agent_framework import ChatMessage, Role
+
+from .config import env_int
+from .metrics import REGISTRY
+from .tokens import Tokenizer
+
+logger = logging.getLogger(__name__)
+
+TRIM_POLICIES = ("largest", "oldest", "fail")
+
+# Role and separator tokens added around every message by chat templates.
+MESSAGE_OVERHEAD = 4
+
+PROMPT_TOKENS = REGISTRY.summary("stage_prompt_tokens", "Prompt tokens counted before each stage's model call")
+TRIMS = REGISTRY.counter("context_trims_total", "Stage prompts trimmed to fit the context window, by policy")
+REJECTIONS = REGISTRY.counter("context_rejections_total", "Stage prompts rejected because they could not fit the context window")
+
+
+class ContextWindowExceeded(ValueError):
+	"""Raised before a model call whose prompt cannot fit the context window."""
+
+
+@dataclass(frozen=True)
+class ContextBudget:
+	"""Token limits for one stage.
+
+	Attributes:
+		window: Context window of the model (`MODEL_CONTEXT_WINDOW`); 0 means
+			unknown, in which case prompts are counted but never trimmed.
+		reserve: Tokens kept free for the answer (`CONTEXT_OUTPUT_RESERVE`).
+		policy: One of `TRIM_POLICIES` (`CONTEXT_TRIM_POLICY`).
+	"""
+
+	window: int = 0
+	reserve: int = 1024
+	policy: str = "largest"
+
+	@classmethod
+	def from_env(cls, reserve: Optional[int] = None) -> "ContextBudget":
+		policy = (os.environ.get("CONTEXT_TRIM_POLICY") or "largest").strip().lower()
+		if policy not in TRIM_POLICIES:
+			logger.warning("Unknown CONTEXT_TRIM_POLICY %r; using 'largest'", policy)
+			policy = "largest"
+		return cls(
+			window=env_int("MODEL_CONTEXT_WINDOW", 0),
+			reserve=reserve if reserve is not None else env_int("CONTEXT_OUTPUT_RESERVE", 1024),
+			policy=policy,
+		)
+
+	@property
+	def limit(self) -> int:
+		"""Prompt tokens allowed."""
+		return self.window - self.reserve
+
+
+def as_messages(messages: Any) -> list[ChatMessage]:
+	"""Normalise the `messages` argument of `run`/`run_stream` to a list."""
+	if messages is None:
+		return []
+	if isinstance(messages, (str, ChatMessage)):
+		messages = [messages]
+	return [ChatMessage(role=Role.USER, text=m) if isinstance(m, str) else m for m in messages]
+
+
+def prompt_tokens(instructions: Optional[str], messages: list[ChatMessage], tokenizer: Tokenizer) -> int:
+	"""Tokens of a chat request made of `instructions` and `messages`."""
+	total = tokenizer.count(instructions) + MESSAGE_OVERHEAD if instructions else 0
+	return total + sum(tokenizer.count(m.text or "") + MESSAGE_OVERHEAD for m in messages)
+
+
+def _shrink(text: str, keep: int, tokenizer: Tokenizer) -> str:
+	removed = tokenizer.count(text) - max(keep, 0)
+	marker = f"\n\n[... {removed} tokens trimmed to fit the context window ...]\n\n"
+	keep -= tokenizer.count(marker)
+	if keep <= 0:
+		return marker.strip()
+	head = tokenizer.head(text, keep * 2 // 3)
+	return head + marker + tokenizer.tail(text, keep - tokenizer.count(head))
+
+
+def fit_prompt(
+	messages: Any,
+	instructions: Optional[str],
+	*,
+	tokenizer: Tokenizer,
+	budget: ContextBudget,
+	stage: str = "",
+) -> tuple[list[ChatMessage], dict[str, Any]]:
+	"""Return `messages`, trimmed if needed, plus a report of the check.
+
+	Raises:
+		ContextWindowExceeded: The prompt is over the limit and the policy
+			is `fail`, or trimming every upstream answer is not enough.
+	"""
+	messages = as_messages(messages)
+	total = prompt_tokens(instructions, messages, tokenizer)
+	PROMPT_TOKENS.observe(total, stage=stage)
+	report = {"prompt_tokens": total, "limit": budget.limit, "trimmed_tokens": 0, "tokenizer": tokenizer.name}
+	if budget.window <= 0 or total <= budget.limit:
+		return messages, report
+
+	upstream = [i for i, m in enumerate(messages) if m.role == Role.ASSISTANT and m.text]
+	if budget.policy == "largest":
+		upstream.sort(key=lambda i: tokenizer.count(messages[i].text), reverse=True)
+	if budget.policy != "fail":
+		messages = list(messages)
+		excess = total - budget.limit
+		for index in upstream:
+			if excess <= 0:
+				break
+			message = messages[index]
+			size = tokenizer.count(message.text)
+			text = _shrink(message.text, size - excess, tokenizer)
+			excess -= size - tokenizer.count(text)
+			messages[index] = ChatMessage(role=message.role, text=text, author_name=message.author_name)
+		trimmed = prompt_tokens(instructions, messages, tokenizer)
+		report.update(prompt_tokens=trimmed, trimmed_tokens=total - trimmed)
+		if trimmed <= budget.limit:
+			TRIMS.inc(stage=stage, policy=budget.policy)
+			logger.warning(
+				"[%s] prompt of %d tokens trimmed to %d to fit the context window (%d tokens, %d reserved for the answer)",
+				stage,
+				total,
+				trimmed,
+				budget.window,
+				budget.reserve,
+			)
+			return messages, report
+
+	REJECTIONS.inc(stage=stage)
+	raise ContextWindowExceeded(
+		f"{stage or 'Stage'} prompt needs ~{report['prompt_tokens']} tokens but the model's context window is "
+		f"{budget.window} tokens with {budget.reserve} reserved for the answer "
+		f"(policy '{budget.policy}'). Shorten the request, raise MODEL_CONTEXT_WINDOW, "
+		f"lower CONTEXT_OUTPUT_RESERVE or choose another CONTEXT_TRIM_POLICY."
+	)
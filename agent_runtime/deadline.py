@@ -0,0 +1,158 @@
+"""End-to-end time budgets for workflow requests.
+
+A request's deadline is held in a context variable, like its priority
+class, so it reaches every stage of the run (and the tasks it creates)
+without being passed along:
+
+	with request_deadline(90):
+		await WorkflowRun(prompt).run()
+
+Each `StageAgent` then plans against what is left when it gets its model
+slot. It may use its share of the remaining time (the last stage may use
+all of it). If the model's decode rate is known from earlier stages, the
+stage's `max_tokens` is lowered so the answer fits. If the model is still
+generating when the stage's time is up, the stream is stopped and the text
+so far is handed on, as with early stopping. An optional stage (the
+researcher) is skipped when its share would be shorter than
+`DEADLINE_MIN_STAGE_SECONDS`. Required stages always get at least that
+long, which bounds how far a run can overshoot its budget.
+
+Default budgets come from `DEADLINE_INTERACTIVE_SECONDS` and
+`DEADLINE_BATCH_SECONDS` (0 = no deadline).
+"""
+
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterable, AsyncIterator, Iterator, Optional, TypeVar
+
+from .config import env_float
+from .metrics import REGISTRY
+from .priority import INTERACTIVE
+
+T = TypeVar("T")
+
+ACTIONS = REGISTRY.counter("deadline_stage_actions_total", "Stages adjusted to fit the request deadline, by action")
+REMAINING = REGISTRY.summary("deadline_remaining_seconds", "Time left of the request deadline when a run finished")
+
+_DEADLINE: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+# Weight of each new observation in the decode-rate estimates.
+_ALPHA = 0.3
+
+
+def default_budget(priority: str = INTERACTIVE) -> float:
+	"""Configured budget in seconds for requests of a priority class (0 = none)."""
+	name = "DEADLINE_INTERACTIVE_SECONDS" if priority == INTERACTIVE else "DEADLINE_BATCH_SECONDS"
+	return max(0.0, env_float(name, 0.0))
+
+
+def min_stage_seconds() -> float:
+	return max(0.0, env_float("DEADLINE_MIN_STAGE_SECONDS", 5.0))
+
+
+@contextmanager
+def request_deadline(seconds: Optional[float]) -> Iterator[None]:
+	"""Run the enclosed code (and tasks it creates) with a deadline `seconds` from now.
+
+	A nested deadline can only make the current one earlier. `None` or 0
+	leaves it unchanged.
+	"""
+	current = _DEADLINE.get()
+	if not seconds or seconds <= 0:
+		yield
+		return
+	at = time.monotonic() + seconds
+	token = _DEADLINE.set(at if current is None else min(current, at))
+	try:
+		yield
+	finally:
+		_DEADLINE.reset(token)
+
+
+def remaining() -> Optional[float]:
+	"""Seconds left until the current request's deadline (may be negative), or None."""
+	at = _DEADLINE.get()
+	return None if at is None else at - time.monotonic()
+
+
+class DecodeRate:
+	"""Moving estimates of a model's time to first token and tokens per second."""
+
+	def __init__(self) -> None:
+		self._estimates: dict[Optional[str], tuple[float, float]] = {}
+
+	def observe(self, model: Optional[str], first_token_seconds: float, tokens: int, generation_seconds: float) -> None:
+		if tokens <= 1 or generation_seconds <= 0:
+			return
+		rate = tokens / generation_seconds
+		previous = self._estimates.get(model)
+		if previous is None:
+			self._estimates[model] = (first_token_seconds, rate)
+		else:
+			self._estimates[model] = (
+				(1 - _ALPHA) * previous[0] + _ALPHA * first_token_seconds,
+				(1 - _ALPHA) * previous[1] + _ALPHA * rate,
+			)
+
+	def estimate(self, model: Optional[str]) -> Optional[tuple[float, float]]:
+		"""(seconds to first token, tokens per second) for `model`, or None if never observed."""
+		return self._estimates.get(model)
+
+	def max_tokens(self, model: Optional[str], seconds: float) -> Optional[int]:
+		"""Tokens `model` can generate in `seconds`, or None if its rate is unknown."""
+		estimate = self._estimates.get(model)
+		if estimate is None:
+			return None
+		first_token, rate = estimate
+		return int(max(0.0, seconds - first_token) * rate)
+
+
+_rate: Optional[DecodeRate] = None
+
+
+def decode_rate() -> DecodeRate:
+	"""The process-wide decode-rate estimates."""
+	global _rate
+	if _rate is None:
+		_rate = DecodeRate()
+	return _rate
+
+
+async def until(items: AsyncIterable[T], cutoff: float) -> AsyncIterator[T]:
+	"""Yield from `items` until the monotonic time `cutoff`, then close it.
+
+	The source is consumed by its own task, so a stalled model call is
+	abandoned on time and its HTTP stream is closed by the task that opened it.
+	"""
+	queue: asyncio.Queue = asyncio.Queue()
+	end = object()
+
+	async def consume() -> None:
+		try:
+			async for item in items:
+				queue.put_nowait(item)
+			queue.put_nowait(end)
+		except Exception as exc:
+			queue.put_nowait(exc)
+
+	task = asyncio.create_task(consume())
+	try:
+		while True:
+			left = cutoff - time.monotonic()
+			if left <= 0:
+				return
+			try:
+				item = await asyncio.wait_for(queue.get(), timeout=left)
+			except asyncio.TimeoutError:
+				return
+			if item is end:
+				return
+			if isinstance(item, Exception):
+				raise item
+			yield item
+	finally:
+		if not task.done():
+			task.cancel()
+			await asyncio.gather(task, return_exceptions=True)
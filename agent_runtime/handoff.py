@@ -0,0 +1,171 @@
+"""Compact structured handoff between workflow stages.
+
+With `STRUCTURED_HANDOFF=true` the planner and researcher answer with one
+JSON object (see `*_COMPACT_INSTRUCTIONS` in the agent modules) instead of
+emoji-decorated markdown, and the next stage reads that object. Only the
+advisor, whose answer is shown to the user, still writes markdown.
+
+Models do not always follow a format, so every stage output goes through
+`to_handoff`: valid JSON is reduced to the expected fields, and markdown is
+converted by splitting it at the known section headings. Either way the
+next stage receives minified JSON.
+"""
+
+import json
+import re
+from typing import Any, Iterable, Optional
+
+from .sections import normalize_heading
+from .tokens import approx_tokens
+
+_THINK = re.compile(r"<think>.*?</think>", re.DOTALL)
+_FENCED_JSON = re.compile(r"```(?:json)?\s*(\{.*\})\s*```", re.DOTALL)
+_HEADING = re.compile(r"^\s{0,3}#{1,6}\s+(.*?)\s*#*\s*$")
+_GROUP = re.compile(r"^\s{0,3}\*\*(.+?)\*\*:?\s*$")
+_ITEM = re.compile(r"^\s*(?:[-*+]|\d+[.)]|- \[[ xX]\])\s+(.*)$")
+_DECORATION = re.compile(r"\*\*|__|`|[\U0001F000-\U0001FAFF\u2600-\u27BF\u2B00-\u2BFF\uFE0F\u200D]")
+
+
+def _clean(text: str) -> str:
+	return " ".join(_DECORATION.sub("", text).split())
+
+
+def _prune(value: Any) -> Any:
+	"""Drop empty strings, lists and objects; collapse whitespace in strings."""
+	if isinstance(value, str):
+		return " ".join(value.split()) or None
+	if isinstance(value, list):
+		items = [v for v in (_prune(v) for v in value) if v is not None]
+		return items or None
+	if isinstance(value, dict):
+		pruned = {str(k): v for k, v in ((k, _prune(v)) for k, v in value.items()) if v is not None}
+		return pruned or None
+	if isinstance(value, (int, float, bool)):
+		return value
+	return None
+
+
+def parse_handoff(text: str, fields: Iterable[str]) -> Optional[dict[str, Any]]:
+	"""Return the expected `fields` of a JSON answer, or None if `text` is not one."""
+	fields = tuple(fields)
+	body = _THINK.sub("", text or "").strip()
+	fenced = _FENCED_JSON.search(body)
+	if fenced:
+		body = fenced.group(1)
+	else:
+		start, end = body.find("{"), body.rfind("}")
+		if start < 0 or end <= start:
+			return None
+		body = body[start:end + 1]
+	try:
+		data = json.loads(body)
+	except ValueError:
+		return None
+	if not isinstance(data, dict):
+		return None
+	result = {f: _prune(data.get(f)) for f in fields}
+	result = {f: v for f, v in result.items() if v is not None}
+	return result or None
+
+
+def markdown_to_handoff(text: str, sections: Iterable[str], fields: Iterable[str]) -> dict[str, Any]:
+	"""Convert a markdown answer that follows the agent's skeleton.
+
+	Section *i* of `sections` becomes field *i* of `fields`. Inside a
+	section, list items become a list of strings and bold-only lines such as
+	`**Phase 1: Discovery**` start a group, giving `{"Phase 1: Discovery": [...]}`.
+	Decoration (emoji, bold markers) is dropped.
+	"""
+	by_heading = dict(zip((normalize_heading(s) for s in sections), fields))
+	result: dict[str, list[Any]] = {}
+	current: Optional[list[Any]] = None
+	group: Optional[list[str]] = None
+	for line in _THINK.sub("", text or "").splitlines():
+		heading = _HEADING.match(line)
+		if heading:
+			field = by_heading.get(normalize_heading(heading.group(1)))
+			current = result.setdefault(field, []) if field else None
+			group = None
+			continue
+		if current is None or not line.strip():
+			continue
+		bold = _GROUP.match(line)
+		if bold:
+			group = []
+			current.append({_clean(bold.group(1)): group})
+			continue
+		item = _ITEM.match(line)
+		value = _clean(item.group(1) if item else line)
+		if not value:
+			continue
+		if group is not None and item:
+			group.append(value)
+		else:
+			group = None
+			current.append(value)
+	compact: dict[str, Any] = {}
+	for field in fields:
+		values = _prune(result.get(field))
+		if values is None:
+			continue
+		if all(isinstance(v, dict) for v in values):
+			# Only groups: merge them into one object keyed by group name.
+			compact[field] = {k: v for group in values for k, v in group.items()}
+		elif len(values) == 1 and isinstance(values[0], str):
+			compact[field] = values[0]
+		else:
+			compact[field] = values
+	return compact
+
+
+def render_markdown(data: dict[str, Any], sections: Iterable[str], fields: Iterable[str]) -> str:
+	"""Render handoff data in the agent's markdown skeleton (used for size comparison)."""
+	lines: list[str] = []
+
+	def emit(value: Any, indent: str = "") -> None:
+		if isinstance(value, dict):
+			for key, item in value.items():
+				lines.append(f"{indent}**{key}**")
+				emit(item, indent)
+		elif isinstance(value, list):
+			for item in value:
+				if isinstance(item, (dict, list)):
+					emit(item, indent)
+				else:
+					lines.append(f"{indent}- {item}")
+		elif value is not None:
+			lines.append(f"{indent}{value}")
+
+	for section, field in zip(sections, fields):
+		if field in data:
+			lines.append(f"\n### {section}")
+			emit(data[field])
+	return "\n".join(lines).strip() + "\n"
+
+
+def to_handoff(text: str, sections: Iterable[str], fields: Iterable[str]) -> tuple[str, dict[str, Any]]:
+	"""Normalize a stage answer to minified JSON and measure the saving.
+
+	Returns the JSON text and a report with `source` (`json` or `markdown`),
+	`compact_tokens`, `markdown_tokens` and `reduction` (fraction saved).
+	For JSON answers the markdown size is that of the same content rendered
+	in the agent's skeleton, without emoji, so the saving is a lower bound.
+	"""
+	sections, fields = tuple(sections), tuple(fields)
+	data = parse_handoff(text, fields)
+	if data is not None:
+		source = "json"
+		markdown_tokens = approx_tokens(render_markdown(data, sections, fields))
+	else:
+		source = "markdown"
+		data = markdown_to_handoff(text, sections, fields)
+		markdown_tokens = approx_tokens(text)
+	compact = json.dumps(data, ensure_ascii=False, separators=(",", ":")) if data else (text or "").strip()
+	compact_tokens = approx_tokens(compact)
+	reduction = 1.0 - compact_tokens / markdown_tokens if markdown_tokens else 0.0
+	return compact, {
+		"source": source,
+		"compact_tokens": compact_tokens,
+		"markdown_tokens": markdown_tokens,
+		"reduction": round(reduction, 3),
+	}
@@ -0,0 +1,170 @@
+"""Graceful degradation of new runs while the model is overloaded.
+
+`LoadShedder` watches two signals of pressure on the model:
+
+- outstanding model calls (stages waiting for or holding a model slot,
+  see `agent_runtime.priority`), against `LOAD_SHED_QUEUE_DEPTH`, and
+- the p95 time to first token of streamed stages over the last
+  `LOAD_SHED_WINDOW_SECONDS`, queueing included, against
+  `LOAD_SHED_LATENCY_SECONDS`. Stages run without streaming return their
+  answer all at once and are not part of this signal.
+
+When either reaches its threshold, new runs are served in a cheaper mode
+(`LOAD_SHED_ACTION`):
+
+- `fast`: the stages in `LOAD_SHED_STAGES` (all by default) use
+  `LOAD_SHED_FAST_MODEL`, a smaller model on the same endpoint;
+- `short`: the researcher stage is skipped and the advisor works from the
+  plan alone.
+
+Runs go back to the full workflow once both signals have stayed below
+`LOAD_SHED_RECOVER_RATIO` of their thresholds for
+`LOAD_SHED_RECOVER_SECONDS`. A run keeps the mode it started in, and the
+mode is reported with its result. Both thresholds default to 0, which
+turns load shedding off.
+"""
+
+import logging
+import os
+import time
+from collections import deque
+from typing import Callable, Optional
+
+from .config import env_float, env_int
+from .metrics import REGISTRY, quantile
+from .priority import model_scheduler
+
+logger = logging.getLogger(__name__)
+
+FULL = "full"
+FAST = "fast"
+SHORT = "short"
+SERVING_MODES = (FULL, FAST, SHORT)
+
+PRESSURE = REGISTRY.gauge("load_shedding_pressure", "Highest ratio of a load signal to its threshold (>= 1 sheds load)")
+CURRENT = REGISTRY.gauge("serving_mode", "1 for the mode new runs are currently served in, by mode")
+ROUTED = REGISTRY.counter("serving_mode_requests_total", "New runs, by the serving mode they were routed to")
+SWITCHES = REGISTRY.counter("serving_mode_switches_total", "Changes of the serving mode, by new mode")
+
+
+class LoadShedder:
+	"""Choose the serving mode of new runs from the current load.
+
+	Args:
+		queue_depth: Outstanding model calls that trigger shedding
+			(`LOAD_SHED_QUEUE_DEPTH`, 0 = ignore).
+		latency: p95 stage time to first token, in seconds, that triggers
+			shedding (`LOAD_SHED_LATENCY_SECONDS`, 0 = ignore).
+		action: `fast` or `short` (`LOAD_SHED_ACTION`). Defaults to `fast`
+			when a fast model is configured, otherwise `short`.
+		fast_model: Model used by degraded stages in `fast` mode
+			(`LOAD_SHED_FAST_MODEL`).
+		stages: Executor ids that switch to the fast model
+			(`LOAD_SHED_STAGES`, comma separated; empty = all).
+		clock: Monotonic time source, replaceable in tests.
+	"""
+
+	def __init__(
+		self,
+		*,
+		queue_depth: Optional[int] = None,
+		latency: Optional[float] = None,
+		action: Optional[str] = None,
+		fast_model: Optional[str] = None,
+		stages: Optional[tuple[str, ...]] = None,
+		clock: Callable[[], float] = time.monotonic,
+	) -> None:
+		self.queue_depth = queue_depth if queue_depth is not None else env_int("LOAD_SHED_QUEUE_DEPTH", 0)
+		self.latency = latency if latency is not None else env_float("LOAD_SHED_LATENCY_SECONDS", 0.0)
+		self.fast_model = fast_model if fast_model is not None else (os.environ.get("LOAD_SHED_FAST_MODEL") or None)
+		if stages is None:
+			stages = tuple(s.strip() for s in os.environ.get("LOAD_SHED_STAGES", "").split(",") if s.strip())
+		self.stages = stages
+		action = (action or os.environ.get("LOAD_SHED_ACTION") or (FAST if self.fast_model else SHORT)).strip().lower()
+		if action not in (FAST, SHORT):
+			raise ValueError(f"LOAD_SHED_ACTION must be '{FAST}' or '{SHORT}', not {action!r}")
+		if action == FAST and not self.fast_model:
+			logger.warning("LOAD_SHED_ACTION=fast needs LOAD_SHED_FAST_MODEL; shedding load with the short workflow instead")
+			action = SHORT
+		self.action = action
+		self.recover_ratio = env_float("LOAD_SHED_RECOVER_RATIO", 0.7)
+		self.recover_seconds = env_float("LOAD_SHED_RECOVER_SECONDS", 30.0)
+		self.window_seconds = env_float("LOAD_SHED_WINDOW_SECONDS", 60.0)
+		self.current = FULL
+		self._clock = clock
+		self._samples: deque[tuple[float, float]] = deque()
+		self._calm_since: Optional[float] = None
+		self._publish()
+
+	@property
+	def enabled(self) -> bool:
+		return self.queue_depth > 0 or self.latency > 0
+
+	def observe(self, seconds: float) -> None:
+		"""Record the time one stage took to produce its first token."""
+		if self.enabled:
+			self._samples.append((self._clock(), seconds))
+
+	def _recent_latency(self) -> float:
+		cutoff = self._clock() - self.window_seconds
+		while self._samples and self._samples[0][0] < cutoff:
+			self._samples.popleft()
+		return quantile([s for _, s in self._samples], 0.95) if self._samples else 0.0
+
+	def pressure(self) -> float:
+		"""Load relative to the thresholds; 1 or more means overloaded."""
+		ratios = [0.0]
+		if self.queue_depth > 0:
+			ratios.append(model_scheduler().pending / self.queue_depth)
+		if self.latency > 0:
+			ratios.append(self._recent_latency() / self.latency)
+		return max(ratios)
+
+	def mode(self) -> str:
+		"""Serving mode for a new run; updates the current mode with hysteresis."""
+		if not self.enabled:
+			return FULL
+		pressure = self.pressure()
+		PRESSURE.set(round(pressure, 3))
+		now = self._clock()
+		if pressure >= 1.0:
+			self._calm_since = None
+			if self.current == FULL:
+				self._switch(self.action, pressure)
+		elif self.current != FULL:
+			if pressure >= self.recover_ratio:
+				self._calm_since = None
+			elif self._calm_since is None:
+				self._calm_since = now
+			elif now - self._calm_since >= self.recover_seconds:
+				self._switch(FULL, pressure)
+		ROUTED.inc(mode=self.current)
+		return self.current
+
+	def _switch(self, mode: str, pressure: float) -> None:
+		logger.warning("Serving mode %s -> %s (load at %.0f%% of the threshold)", self.current, mode, 100 * pressure)
+		self.current = mode
+		self._calm_since = None
+		SWITCHES.inc(mode=mode)
+		self._publish()
+
+	def _publish(self) -> None:
+		for mode in SERVING_MODES:
+			CURRENT.set(1 if mode == self.current else 0, mode=mode)
+
+	def stage_model(self, stage_id: str, mode: str) -> Optional[str]:
+		"""Model override for a stage of a run in `mode`, or None for the agent's own."""
+		if mode == FAST and (not self.stages or stage_id in self.stages):
+			return self.fast_model
+		return None
+
+
+_shedder: Optional[LoadShedder] = None
+
+
+def load_shedder() -> LoadShedder:
+	"""The process-wide policy, configured from the environment on first use."""
+	global _shedder
+	if _shedder is None:
+		_shedder = LoadShedder()
+	return _shedder
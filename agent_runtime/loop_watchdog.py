@@ -0,0 +1,114 @@
+"""Event-loop lag watchdog.
+
+A heartbeat task on the event loop wakes up every `LOOP_WATCHDOG_INTERVAL_MS`
+and records how late it ran (`event_loop_lag_seconds`). A monitor thread
+watches the heartbeat; when the loop has not come back for longer than
+`LOOP_LAG_THRESHOLD_MS` it captures the loop thread's stack *while it is
+still blocked* and logs it, so the synchronous call responsible (a blocking
+client constructor, `load_dotenv()`, sync logging, a large string
+format...) is named directly instead of inferred from latency graphs.
+
+Enabled by default; set `LOOP_WATCHDOG=false` to turn it off.
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from .config import env_flag, env_float
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+LAG = REGISTRY.summary("event_loop_lag_seconds", "Delay of the loop heartbeat beyond its scheduled wake-up")
+LAG_MAX = REGISTRY.gauge("event_loop_lag_max_seconds", "Largest heartbeat delay seen since start")
+BLOCKED = REGISTRY.counter("event_loop_blocked_total", "Times the loop was blocked past the lag threshold")
+
+
+class LoopWatchdog:
+	"""Measure loop lag and report stacks of calls that block the loop.
+
+	Args:
+		interval: Heartbeat period in seconds.
+		threshold: Blocking time in seconds after which the stack is logged.
+	"""
+
+	def __init__(self, interval: Optional[float] = None, threshold: Optional[float] = None) -> None:
+		self.interval = interval if interval is not None else env_float("LOOP_WATCHDOG_INTERVAL_MS", 50.0) / 1000.0
+		self.threshold = threshold if threshold is not None else env_float("LOOP_LAG_THRESHOLD_MS", 100.0) / 1000.0
+		self.blocked_stacks: list[str] = []
+		self._beat = time.monotonic()
+		self._loop_thread: Optional[int] = None
+		self._task: Optional[asyncio.Task] = None
+		self._monitor: Optional[threading.Thread] = None
+		self._stop = threading.Event()
+
+	@property
+	def running(self) -> bool:
+		return self._task is not None and not self._task.done()
+
+	async def _heartbeat(self) -> None:
+		while True:
+			expected = time.monotonic() + self.interval
+			await asyncio.sleep(self.interval)
+			now = time.monotonic()
+			self._beat = now
+			lag = max(0.0, now - expected)
+			LAG.observe(lag)
+			if lag > LAG_MAX.value():
+				LAG_MAX.set(lag)
+
+	def _watch(self) -> None:
+		reported = None
+		while not self._stop.wait(min(self.threshold / 2, self.interval)):
+			beat = self._beat
+			stalled = time.monotonic() - beat - self.interval
+			if stalled < self.threshold or reported == beat:
+				continue
+			reported = beat
+			frame = sys._current_frames().get(self._loop_thread)
+			stack = "".join(traceback.format_stack(frame)) if frame is not None else "<stack unavailable>\n"
+			self.blocked_stacks.append(stack)
+			del self.blocked_stacks[:-20]
+			BLOCKED.inc()
+			logger.warning("Event loop blocked for more than %.0f ms; loop thread stack:\n%s", stalled * 1000, stack)
+
+	def start(self) -> None:
+		"""Start watching the running loop. Must be called from the loop thread."""
+		if self.running:
+			return
+		self._loop_thread = threading.get_ident()
+		self._beat = time.monotonic()
+		self._stop.clear()
+		self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+		self._monitor = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+		self._monitor.start()
+
+	async def stop(self) -> None:
+		self._stop.set()
+		if self._task is not None:
+			self._task.cancel()
+			try:
+				await self._task
+			except asyncio.CancelledError:
+				pass
+		if self._monitor is not None:
+			self._monitor.join()
+
+
+_watchdog: Optional[LoopWatchdog] = None
+
+
+def start_loop_watchdog() -> Optional[LoopWatchdog]:
+	"""Start the process-wide watchdog on the running loop unless `LOOP_WATCHDOG=false`."""
+	global _watchdog
+	if not env_flag("LOOP_WATCHDOG", True):
+		return None
+	if _watchdog is None:
+		_watchdog = LoopWatchdog()
+	_watchdog.start()
+	return _watchdog
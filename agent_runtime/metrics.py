@@ -0,0 +1,200 @@
+"""In-process service metrics with a Prometheus text export.
+
+A deliberately small registry (counters, gauges and windowed summaries) so
+that runtime components can publish numbers without a metrics dependency.
+`install_metrics(app)` adds a `/metrics` route to any Starlette or FastAPI
+app, including the ones behind the DevUI and Chainlit:
+
+	from agent_runtime.metrics import REGISTRY
+	requests_total = REGISTRY.counter("workflow_requests_total", "Workflow runs started")
+	requests_total.inc(entry="chainlit")
+"""
+
+import math
+import threading
+from collections import deque
+from typing import Any, Iterable, Optional
+
+LabelKey = tuple[tuple[str, str], ...]
+
+
+def _key(labels: dict[str, Any]) -> LabelKey:
+	return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+	return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key: LabelKey, extra: Optional[tuple[str, str]] = None) -> str:
+	pairs = list(key) + ([extra] if extra else [])
+	if not pairs:
+		return ""
+	body = ",".join(f'{k}="{_escape(v)}"' for k, v in pairs)
+	return "{" + body + "}"
+
+
+def _format_value(value: float) -> str:
+	if math.isnan(value):
+		return "NaN"
+	return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def quantile(values: Iterable[float], q: float) -> float:
+	"""Nearest-rank quantile (q in 0..1); NaN for no values."""
+	ordered = sorted(values)
+	if not ordered:
+		return math.nan
+	return ordered[max(0, min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1))]
+
+
+class _Metric:
+	kind = "untyped"
+
+	def __init__(self, name: str, help: str) -> None:
+		self.name = name
+		self.help = help
+		self._lock = threading.Lock()
+
+	def _samples(self) -> list[tuple[str, LabelKey, float]]:
+		raise NotImplementedError
+
+	def render(self) -> str:
+		lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+		for suffix, key, value in self._samples():
+			if suffix.startswith("quantile="):
+				labels = _format_labels(key, ("quantile", suffix.split("=", 1)[1]))
+				lines.append(f"{self.name}{labels} {_format_value(value)}")
+			else:
+				lines.append(f"{self.name}{suffix}{_format_labels(key)} {_format_value(value)}")
+		return "\n".join(lines)
+
+
+class Counter(_Metric):
+	"""Monotonically increasing value per label set."""
+
+	kind = "counter"
+
+	def __init__(self, name: str, help: str) -> None:
+		super().__init__(name, help)
+		self._values: dict[LabelKey, float] = {}
+
+	def inc(self, amount: float = 1.0, **labels: Any) -> None:
+		key = _key(labels)
+		with self._lock:
+			self._values[key] = self._values.get(key, 0.0) + amount
+
+	def value(self, **labels: Any) -> float:
+		return self._values.get(_key(labels), 0.0)
+
+	def _samples(self):
+		with self._lock:
+			return [("", key, value) for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+	"""Value that can go up and down."""
+
+	kind = "gauge"
+
+	def set(self, value: float, **labels: Any) -> None:
+		with self._lock:
+			self._values[_key(labels)] = float(value)
+
+	def dec(self, amount: float = 1.0, **labels: Any) -> None:
+		self.inc(-amount, **labels)
+
+
+class Summary(_Metric):
+	"""Quantiles over the most recent `window` observations, plus count and sum."""
+
+	kind = "summary"
+
+	def __init__(self, name: str, help: str, *, window: int = 1024, quantiles: tuple[float, ...] = (0.5, 0.95, 0.99)) -> None:
+		super().__init__(name, help)
+		self.window = window
+		self.quantiles = quantiles
+		self._recent: dict[LabelKey, deque] = {}
+		self._count: dict[LabelKey, int] = {}
+		self._sum: dict[LabelKey, float] = {}
+
+	def observe(self, value: float, **labels: Any) -> None:
+		key = _key(labels)
+		with self._lock:
+			self._recent.setdefault(key, deque(maxlen=self.window)).append(value)
+			self._count[key] = self._count.get(key, 0) + 1
+			self._sum[key] = self._sum.get(key, 0.0) + value
+
+	def percentiles(self, **labels: Any) -> dict[float, float]:
+		with self._lock:
+			recent = list(self._recent.get(_key(labels), ()))
+		return {q: quantile(recent, q) for q in self.quantiles}
+
+	def count(self, **labels: Any) -> int:
+		return self._count.get(_key(labels), 0)
+
+	def _samples(self):
+		with self._lock:
+			snapshot = [(key, list(recent), self._count[key], self._sum[key]) for key, recent in self._recent.items()]
+		samples = []
+		for key, recent, count, total in snapshot:
+			samples.extend((f"quantile={q}", key, quantile(recent, q)) for q in self.quantiles)
+			samples.append(("_count", key, count))
+			samples.append(("_sum", key, total))
+		return samples
+
+
+class MetricsRegistry:
+	"""Named collection of metrics; `counter()` and friends are get-or-create."""
+
+	def __init__(self) -> None:
+		self._metrics: dict[str, _Metric] = {}
+		self._lock = threading.Lock()
+
+	def _get(self, cls: type, name: str, help: str, **kwargs: Any) -> Any:
+		with self._lock:
+			metric = self._metrics.get(name)
+			if metric is None:
+				metric = self._metrics[name] = cls(name, help, **kwargs)
+			elif type(metric) is not cls:
+				raise ValueError(f"Metric '{name}' is already registered as a {metric.kind}")
+			return metric
+
+	def counter(self, name: str, help: str) -> Counter:
+		return self._get(Counter, name, help)
+
+	def gauge(self, name: str, help: str) -> Gauge:
+		return self._get(Gauge, name, help)
+
+	def summary(self, name: str, help: str, **kwargs: Any) -> Summary:
+		return self._get(Summary, name, help, **kwargs)
+
+	def get(self, name: str) -> Optional[_Metric]:
+		return self._metrics.get(name)
+
+	def render(self) -> str:
+		"""All metrics in the Prometheus text exposition format."""
+		with self._lock:
+			metrics = list(self._metrics.values())
+		return "\n".join(m.render() for m in metrics) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+async def metrics_endpoint(request: Any) -> Any:
+	from starlette.responses import PlainTextResponse
+
+	return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+def install_metrics(app: Any, path: str = "/metrics") -> None:
+	"""Serve `REGISTRY` at `path` on a Starlette/FastAPI app.
+
+	The route is placed first so catch-all routes (Chainlit serves its
+	frontend for every unknown path) do not shadow it.
+	"""
+	if any(getattr(route, "path", None) == path for route in app.router.routes):
+		return
+	app.add_route(path, metrics_endpoint, methods=["GET"], include_in_schema=False)
+	app.router.routes.insert(0, app.router.routes.pop())
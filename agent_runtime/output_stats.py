@@ -0,0 +1,205 @@
+"""Rolling completion-length statistics and adaptive `max_tokens`.
+
+Every stage records how many tokens its model generated, per agent and per
+model, in a rolling window of the last `MAX_TOKENS_WINDOW` runs. The
+windows are persisted to `MAX_TOKENS_STATS_FILE`, so they survive restarts.
+Completions recorded within `MAX_TOKENS_SAVE_SECONDS` of each other share one
+save, and whatever is still unsaved is written when the process exits.
+
+With `ADAPTIVE_MAX_TOKENS=true` each stage's generation limit is set to
+`ADAPTIVE_MAX_TOKENS_MULTIPLIER` times the p95 of its window, once the window
+holds `ADAPTIVE_MAX_TOKENS_MIN_SAMPLES` runs and within
+`ADAPTIVE_MAX_TOKENS_FLOOR`/`ADAPTIVE_MAX_TOKENS_CEILING`. A `max_tokens` set
+explicitly on an agent always wins.
+
+The p95 and the current limit of every stage are exported on `/metrics`
+(`stage_completion_tokens_p95`, `stage_max_tokens`), and the headless API
+lists the full statistics at `GET /v1/stats/output-tokens`.
+"""
+
+import asyncio
+import atexit
+import contextlib
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Any, Optional
+
+from .config import env_flag, env_float, env_int
+from .metrics import REGISTRY, quantile
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STATS_FILE = ".stats/output_tokens.json"
+
+P95 = REGISTRY.gauge("stage_completion_tokens_p95", "p95 of recent completion lengths, by stage and model")
+LIMIT = REGISTRY.gauge("stage_max_tokens", "Adaptive generation limit, by stage and model (0 = none yet)")
+
+
+class OutputStats:
+	"""Completion lengths per `(stage, model)`, persisted as JSON.
+
+	Args:
+		path: Statistics file (`MAX_TOKENS_STATS_FILE`).
+		window: Runs kept per stage and model (`MAX_TOKENS_WINDOW`).
+	"""
+
+	def __init__(self, path: Optional[str] = None, *, window: Optional[int] = None) -> None:
+		self.path = Path(path or os.environ.get("MAX_TOKENS_STATS_FILE") or DEFAULT_STATS_FILE)
+		self.window = max(1, window if window is not None else env_int("MAX_TOKENS_WINDOW", 200))
+		self.multiplier = env_float("ADAPTIVE_MAX_TOKENS_MULTIPLIER", 1.5)
+		self.min_samples = env_int("ADAPTIVE_MAX_TOKENS_MIN_SAMPLES", 10)
+		self.floor = env_int("ADAPTIVE_MAX_TOKENS_FLOOR", 256)
+		self.ceiling = env_int("ADAPTIVE_MAX_TOKENS_CEILING", 0)
+		self._samples: dict[tuple[str, str], deque[int]] = {}
+		self._lock = threading.Lock()
+		self._write_lock = threading.Lock()
+		self._dirty = False
+		# Loop a debounced save is scheduled on; one that stopped before it ran is ignored.
+		self._save_loop: Optional[asyncio.AbstractEventLoop] = None
+		self._load()
+
+	def _load(self) -> None:
+		try:
+			data = json.loads(self.path.read_text(encoding="utf-8"))
+		except FileNotFoundError:
+			return
+		except ValueError:
+			# A damaged file only costs the history, never a run.
+			return
+		for model, stages in data.get("models", {}).items():
+			for stage, values in stages.items():
+				self._samples[(stage, model)] = deque((int(v) for v in values), maxlen=self.window)
+		for stage, model in self._samples:
+			self._publish(stage, model)
+
+	def save(self) -> None:
+		"""Write the statistics atomically; call it off the event loop.
+
+		Saves are serialized, each through its own temporary file, so
+		concurrent saves in one process or several never clash. A failed write
+		is logged: it only costs the history, never a run.
+		"""
+		with self._write_lock:
+			with self._lock:
+				models: dict[str, dict[str, list[int]]] = {}
+				for (stage, model), values in self._samples.items():
+					models.setdefault(model, {})[stage] = list(values)
+				payload = json.dumps({"version": 1, "window": self.window, "models": models})
+				self._dirty = False
+			tmp = None
+			try:
+				self.path.parent.mkdir(parents=True, exist_ok=True)
+				with tempfile.NamedTemporaryFile(
+					"w", encoding="utf-8", dir=self.path.parent, prefix=f".{self.path.name}.", suffix=".tmp", delete=False
+				) as handle:
+					tmp = handle.name
+					handle.write(payload)
+				os.replace(tmp, self.path)
+			except OSError as exc:
+				logger.warning("Could not save completion statistics to %s: %s", self.path, exc)
+				self._dirty = True
+				if tmp is not None:
+					with contextlib.suppress(OSError):
+						os.unlink(tmp)
+
+	def flush(self) -> None:
+		"""Save if anything was recorded since the last save."""
+		if self._dirty:
+			self.save()
+
+	def save_soon(self, delay: float) -> None:
+		"""Save on a worker thread after `delay` seconds; completions recorded meanwhile share it.
+
+		Must be called on the event loop (raises RuntimeError otherwise).
+		"""
+		loop = asyncio.get_running_loop()
+		with self._lock:
+			if self._save_loop is loop:
+				return
+			self._save_loop = loop
+		loop.call_later(delay, loop.run_in_executor, None, self._deferred_save)
+
+	def _deferred_save(self) -> None:
+		with self._lock:
+			self._save_loop = None
+		self.flush()
+
+	def observe(self, stage: str, model: Optional[str], tokens: int) -> None:
+		"""Record the completion length of one run."""
+		key = (stage, model or "default")
+		with self._lock:
+			self._samples.setdefault(key, deque(maxlen=self.window)).append(int(tokens))
+			self._dirty = True
+		self._publish(*key)
+
+	def p95(self, stage: str, model: Optional[str]) -> Optional[float]:
+		values = self._samples.get((stage, model or "default"))
+		return quantile(values, 0.95) if values else None
+
+	def limit(self, stage: str, model: Optional[str]) -> Optional[int]:
+		"""Generation limit for the stage, or None while there is too little history."""
+		values = self._samples.get((stage, model or "default"))
+		if not values or len(values) < self.min_samples:
+			return None
+		limit = max(self.floor, math.ceil(quantile(values, 0.95) * self.multiplier))
+		return min(limit, self.ceiling) if self.ceiling > 0 else limit
+
+	def _publish(self, stage: str, model: str) -> None:
+		P95.set(self.p95(stage, model) or 0, stage=stage, model=model)
+		LIMIT.set(self.limit(stage, model) or 0, stage=stage, model=model)
+
+	def snapshot(self) -> list[dict[str, Any]]:
+		"""One row per stage and model, for inspection."""
+		rows = []
+		for (stage, model), values in sorted(self._samples.items()):
+			rows.append({
+				"stage": stage,
+				"model": model,
+				"samples": len(values),
+				"p50": quantile(values, 0.5),
+				"p95": quantile(values, 0.95),
+				"max": max(values),
+				"max_tokens": self.limit(stage, model),
+			})
+		return rows
+
+
+_stats: Optional[OutputStats] = None
+
+
+def output_stats() -> OutputStats:
+	"""The process-wide statistics, loaded from disk on first use."""
+	global _stats
+	if _stats is None:
+		_stats = OutputStats()
+	return _stats
+
+
+def adaptive_max_tokens(stage: str, model: Optional[str]) -> Optional[int]:
+	"""The stage's adaptive limit when `ADAPTIVE_MAX_TOKENS` is on, else None."""
+	if not env_flag("ADAPTIVE_MAX_TOKENS"):
+		return None
+	return output_stats().limit(stage, model)
+
+
+def record_completion(stage: str, model: Optional[str], tokens: int) -> None:
+	"""Record one completion and persist the statistics in the background, debounced."""
+	stats = output_stats()
+	stats.observe(stage, model, tokens)
+	try:
+		stats.save_soon(env_float("MAX_TOKENS_SAVE_SECONDS", 5.0))
+	except RuntimeError:
+		stats.save()
+
+
+@atexit.register
+def _save_at_exit() -> None:
+	# Completions of the last few seconds may still wait for their debounced save.
+	if _stats is not None:
+		_stats.flush()
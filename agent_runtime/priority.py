@@ -0,0 +1,162 @@
+"""Priority classes for model calls.
+
+Interactive chat sessions and bulk jobs share one Foundry Local model. With
+`MODEL_CONCURRENCY` set, every workflow stage takes a slot from the process
+wide `ModelScheduler` before calling the model and gives it back when the
+stage ends. Free slots go to waiting interactive stages first, so a batch run
+is overtaken at its next stage boundary as soon as a user is waiting. Batch
+work still gets at least `BATCH_MIN_SHARE` of the recent grants, so it is
+slowed down but never starved.
+
+The scheduler only orders the stages of its own process. Jobs run by separate
+`service.worker` processes are not preempted by interactive runs elsewhere;
+for that the jobs must run in the API process (`SERVICE_JOB_WORKERS`).
+
+The class of the current request is held in a context variable:
+
+	with priority_class(BATCH):
+		await WorkflowRun(prompt).run()
+
+Requests without a class are interactive.
+"""
+
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Iterator, Optional
+
+from .config import env_float, env_int
+from .metrics import REGISTRY
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+PRIORITY_CLASSES = (INTERACTIVE, BATCH)
+
+WAIT_SECONDS = REGISTRY.summary("model_queue_wait_seconds", "Time stages waited for a model slot, by priority class")
+QUEUE_DEPTH = REGISTRY.gauge("model_queue_depth", "Stages waiting for a model slot, by priority class")
+GRANTS = REGISTRY.counter("model_slots_granted_total", "Model slots granted, by priority class")
+
+_CLASS: ContextVar[str] = ContextVar("priority_class", default=INTERACTIVE)
+
+
+def current_priority() -> str:
+	"""Priority class of the running request."""
+	return _CLASS.get()
+
+
+@contextmanager
+def priority_class(name: str) -> Iterator[None]:
+	"""Run the enclosed code (and tasks it creates) in the given class."""
+	if name not in PRIORITY_CLASSES:
+		raise ValueError(f"Unknown priority class {name!r}; expected one of {', '.join(PRIORITY_CLASSES)}")
+	token = _CLASS.set(name)
+	try:
+		yield
+	finally:
+		_CLASS.reset(token)
+
+
+class ModelScheduler:
+	"""Hand out a fixed number of model slots, interactive work first.
+
+	Args:
+		slots: Concurrent model calls (`MODEL_CONCURRENCY`). 0 disables
+			scheduling and every stage runs straight away.
+		batch_min_share: Minimum fraction of the recent grants that go to
+			batch work while it is waiting (`BATCH_MIN_SHARE`).
+		window: Number of recent grants the share is measured over.
+	"""
+
+	def __init__(self, slots: Optional[int] = None, *, batch_min_share: Optional[float] = None, window: int = 20) -> None:
+		self.slots = max(0, slots if slots is not None else env_int("MODEL_CONCURRENCY", 0))
+		share = batch_min_share if batch_min_share is not None else env_float("BATCH_MIN_SHARE", 0.2)
+		self.batch_min_share = min(max(share, 0.0), 1.0)
+		self.active = 0
+		self._waiters: dict[str, deque[asyncio.Future]] = {name: deque() for name in PRIORITY_CLASSES}
+		self._recent: deque[str] = deque(maxlen=window)
+
+	def waiting(self, name: str) -> int:
+		return len(self._waiters[name])
+
+	@property
+	def pending(self) -> int:
+		"""Model calls running or waiting for a slot."""
+		return self.active + sum(len(waiters) for waiters in self._waiters.values())
+
+	def _next_class(self) -> Optional[str]:
+		interactive, batch = self._waiters[INTERACTIVE], self._waiters[BATCH]
+		if not batch:
+			return INTERACTIVE if interactive else None
+		if not interactive:
+			return BATCH
+		share = self._recent.count(BATCH) / len(self._recent) if self._recent else 0.0
+		return BATCH if share < self.batch_min_share else INTERACTIVE
+
+	def _grant(self, name: str) -> None:
+		self.active += 1
+		self._recent.append(name)
+		GRANTS.inc(priority=name)
+
+	def _wake(self) -> None:
+		while self.active < self.slots:
+			name = self._next_class()
+			if name is None:
+				return
+			waiter = self._waiters[name].popleft()
+			QUEUE_DEPTH.set(len(self._waiters[name]), priority=name)
+			if waiter.done():
+				continue
+			self._grant(name)
+			waiter.set_result(None)
+
+	def _release(self) -> None:
+		self.active -= 1
+		self._wake()
+
+	@asynccontextmanager
+	async def slot(self, priority: Optional[str] = None) -> AsyncIterator[None]:
+		"""Hold a model slot for the enclosed stage."""
+		if not self.slots:
+			# Unscheduled, but still counted for `pending`.
+			self.active += 1
+			try:
+				yield
+			finally:
+				self.active -= 1
+			return
+		name = priority or current_priority()
+		started = time.perf_counter()
+		if self.active < self.slots and not any(self._waiters.values()):
+			self._grant(name)
+		else:
+			waiter = asyncio.get_running_loop().create_future()
+			self._waiters[name].append(waiter)
+			QUEUE_DEPTH.set(len(self._waiters[name]), priority=name)
+			try:
+				await waiter
+			except asyncio.CancelledError:
+				if waiter.done() and not waiter.cancelled():
+					# Granted just before the cancellation arrived; pass the slot on.
+					self._release()
+				elif waiter in self._waiters[name]:
+					self._waiters[name].remove(waiter)
+					QUEUE_DEPTH.set(len(self._waiters[name]), priority=name)
+				raise
+		WAIT_SECONDS.observe(time.perf_counter() - started, priority=name)
+		try:
+			yield
+		finally:
+			self._release()
+
+
+_scheduler: Optional[ModelScheduler] = None
+
+
+def model_scheduler() -> ModelScheduler:
+	"""The process-wide scheduler, configured from the environment on first use."""
+	global _scheduler
+	if _scheduler is None:
+		_scheduler = ModelScheduler()
+	return _scheduler
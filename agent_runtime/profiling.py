@@ -0,0 +1,216 @@
+"""On-demand sampling profiler for the asyncio orchestration layer.
+
+A profile samples the stack of the thread that runs the event loop at a
+fixed interval while one request is in flight, and writes the samples in the
+folded-stack format understood by `flamegraph.pl`, speedscope and most other
+flame-graph tools (`frame;frame;frame count` per line). Samples taken while
+the loop is parked in its selector are tagged `[waiting for I/O]`, so the
+split between Python-side work (message conversion, markdown, websocket
+sends, tracing) and waiting on the model is visible at a glance.
+
+The loop is shared, so concurrent requests show up in each other's profiles;
+profile one request at a time for a clean picture.
+
+Profiling is controlled by `PROFILE_MODE`:
+
+- `off` (default): nothing is installed and no per-request work is done.
+- `header`: requests carrying `X-Profile: 1` are profiled.
+- `always`: every request is profiled.
+"""
+
+import asyncio
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Any, ContextManager, Mapping, Optional
+
+from .config import env_float
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "x-profile"
+IDLE_FRAME = "[waiting for I/O]"
+
+_ROOT = str(Path(__file__).resolve().parent.parent) + os.sep
+
+
+def profiling_mode() -> str:
+	"""Current `PROFILE_MODE` (`off`, `header` or `always`)."""
+	mode = os.environ.get("PROFILE_MODE", "off").strip().lower()
+	return mode if mode in ("header", "always") else "off"
+
+
+def _header(headers: Optional[Mapping[str, Any]]) -> Optional[str]:
+	if not headers:
+		return None
+	for key, value in headers.items():
+		name = key.decode("latin-1") if isinstance(key, bytes) else str(key)
+		name = name.lower().replace("_", "-")
+		if name in (PROFILE_HEADER, "http-" + PROFILE_HEADER):
+			return value.decode("latin-1") if isinstance(value, bytes) else str(value)
+	return None
+
+
+def should_profile(headers: Optional[Mapping[str, Any]] = None) -> bool:
+	"""Decide whether a request with these headers should be profiled.
+
+	Accepts plain header mappings as well as WSGI-style environs
+	(`HTTP_X_PROFILE`), which is what Chainlit keeps per session.
+	"""
+	mode = profiling_mode()
+	if mode == "always":
+		return True
+	if mode == "header":
+		return (_header(headers) or "").strip().lower() in ("1", "true", "yes", "on")
+	return False
+
+
+def _frame_name(frame) -> str:
+	code = frame.f_code
+	filename = code.co_filename
+	if filename.startswith(_ROOT):
+		filename = filename[len(_ROOT):]
+	else:
+		parts = Path(filename).parts
+		filename = "/".join(parts[-2:]) if len(parts) > 1 else filename
+	return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ",")
+
+
+def _is_idle(frame) -> bool:
+	code = frame.f_code
+	return code.co_name == "select" and code.co_filename.endswith("selectors.py")
+
+
+class SamplingProfiler:
+	"""Sample one thread's Python stack from a background thread."""
+
+	def __init__(self, thread_id: Optional[int] = None, interval: Optional[float] = None) -> None:
+		self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+		self.interval = interval if interval is not None else env_float("PROFILE_INTERVAL_MS", 5.0) / 1000.0
+		self.stacks: Counter = Counter()
+		self.samples = 0
+		self.idle_samples = 0
+		self._stop = threading.Event()
+		self._thread: Optional[threading.Thread] = None
+
+	def _sample(self) -> None:
+		frame = sys._current_frames().get(self.thread_id)
+		if frame is None:
+			return
+		idle = _is_idle(frame)
+		names = []
+		while frame is not None:
+			names.append(_frame_name(frame))
+			frame = frame.f_back
+		names.reverse()
+		if idle:
+			names.append(IDLE_FRAME)
+			self.idle_samples += 1
+		self.samples += 1
+		self.stacks[";".join(names)] += 1
+
+	def _run(self) -> None:
+		while not self._stop.wait(self.interval):
+			self._sample()
+
+	def start(self) -> None:
+		self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+		self._thread.start()
+
+	def stop(self) -> None:
+		self._stop.set()
+		if self._thread is not None:
+			self._thread.join()
+
+	def folded(self) -> str:
+		return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class RequestProfile:
+	"""Profile the current thread for the duration of a `with` block.
+
+	On exit the folded stacks are written to `PROFILE_DIR` (default
+	`.profiles`) and the file name plus the busy/idle split are logged.
+	Use `async with` on the event loop, so that stopping the sampler and
+	writing the file happen on a worker thread.
+	"""
+
+	def __init__(self, label: str, *, directory: Optional[str] = None, interval: Optional[float] = None) -> None:
+		self.label = label
+		self.directory = Path(directory or os.environ.get("PROFILE_DIR") or ".profiles")
+		self.profiler = SamplingProfiler(interval=interval)
+		self.path: Optional[Path] = None
+		self._started = 0.0
+
+	def __enter__(self) -> "RequestProfile":
+		self._started = time.perf_counter()
+		self.profiler.start()
+		return self
+
+	def __exit__(self, *exc_info: Any) -> None:
+		self._finish(time.perf_counter() - self._started)
+
+	async def __aenter__(self) -> "RequestProfile":
+		return self.__enter__()
+
+	async def __aexit__(self, *exc_info: Any) -> None:
+		await asyncio.to_thread(self._finish, time.perf_counter() - self._started)
+
+	def _finish(self, elapsed: float) -> None:
+		self.profiler.stop()
+		slug = re.sub(r"[^A-Za-z0-9_.-]+", "-", self.label).strip("-") or "request"
+		name = f"{time.strftime('%Y%m%d-%H%M%S')}-{slug}-{uuid.uuid4().hex[:6]}.folded"
+		try:
+			self.directory.mkdir(parents=True, exist_ok=True)
+			self.path = self.directory / name
+			self.path.write_text(self.profiler.folded(), encoding="utf-8")
+		except OSError as exc:
+			logger.warning("Could not write profile for %s: %s", self.label, exc)
+			return
+		samples = self.profiler.samples or 1
+		logger.info(
+			"Profile %s: %.2fs, %d samples, %.0f%% busy in Python, %.0f%% waiting for I/O -> %s",
+			self.label, elapsed, self.profiler.samples,
+			100.0 * (self.profiler.samples - self.profiler.idle_samples) / samples,
+			100.0 * self.profiler.idle_samples / samples, self.path,
+		)
+
+
+def profile_request(label: str, headers: Optional[Mapping[str, Any]] = None) -> ContextManager:
+	"""Return a `RequestProfile` when this request should be profiled, else a no-op.
+
+	Both can be used with `with` or `async with`.
+	"""
+	return RequestProfile(label) if should_profile(headers) else nullcontext()
+
+
+class ProfilingMiddleware:
+	"""ASGI middleware that profiles HTTP requests according to `PROFILE_MODE`.
+
+	The profile covers the whole response, including streamed bodies.
+	"""
+
+	def __init__(self, app: Any) -> None:
+		self.app = app
+
+	async def __call__(self, scope: dict, receive: Any, send: Any) -> None:
+		if scope["type"] != "http" or not should_profile(dict(scope.get("headers") or ())):
+			await self.app(scope, receive, send)
+			return
+		async with RequestProfile(f"{scope['method']} {scope['path']}"):
+			await self.app(scope, receive, send)
+
+
+def install_profiling(app: Any) -> bool:
+	"""Add `ProfilingMiddleware` to a Starlette/FastAPI app unless profiling is off."""
+	if profiling_mode() == "off":
+		return False
+	app.add_middleware(ProfilingMiddleware)
+	return True
@@ -0,0 +1,446 @@
+"""Local document retrieval for the researcher agent.
+
+The researcher is asked for factual, current information, but on a machine
+without network access it has nothing to draw on. This module builds a BM25
+index over a directory of text documents and exposes it to the agent as a
+`search_documents` tool:
+
+	python -m agent_runtime.retrieval build docs/ --index .index/documents
+	python -m agent_runtime.retrieval search "zero trust network rollout"
+
+Documents are split into chunks of whole paragraphs of about
+`--chunk-words` words. The index is a directory of flat binary arrays (a
+sorted term table, postings with precomputed BM25 weights, chunk offsets)
+that are memory-mapped when it is opened: loading takes no time regardless
+of corpus size, and every worker process on the machine shares one copy in
+the page cache. A query reads only the postings of its own terms, so top-k
+results over hundreds of thousands of chunks take milliseconds. Scoring
+uses NumPy when it is installed and plain Python otherwise.
+
+Set `RESEARCH_INDEX_DIR` to the index directory to give the researcher the
+tool; `RESEARCH_TOP_K` is the default number of passages returned and
+`RESEARCH_MAX_TOKENS` caps their size.
+"""
+
+import argparse
+import array
+import asyncio
+import heapq
+import json
+import logging
+import math
+import mmap
+import os
+import re
+import shutil
+import sys
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Annotated, Any, Iterable, Iterator, Optional
+
+from .config import env_int
+from .metrics import REGISTRY
+from .tokens import Tokenizer, get_tokenizer
+
+try:
+	import numpy as np  # type: ignore[import-not-found]
+except ImportError:  # pragma: no cover - optional, pure-Python scoring is used instead
+	np = None
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+DEFAULT_INDEX_DIR = ".index/documents"
+TEXT_SUFFIXES = (".txt", ".md", ".markdown", ".rst", ".text")
+# A passage cut shorter than this is left out rather than sent as a stub.
+_MIN_PASSAGE_TOKENS = 50
+
+SEARCHES = REGISTRY.counter("retrieval_searches_total", "Document searches made by the researcher's retrieval tool")
+SEARCH_SECONDS = REGISTRY.summary("retrieval_search_seconds", "Time to score and fetch the top passages of a document search")
+
+_WORD = re.compile(r"[^\W_]+")
+_PARAGRAPH = re.compile(r"\n\s*\n")
+_STOPWORDS = frozenset(
+	"a an and are as at be been but by can do does for from had has have how i if in into is it its of on or"
+	" so than that the their them then there these they this to was we were what when where which who will"
+	" with would you your".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+	"""Lower-cased words of `text` without stopwords."""
+	return [w for w in _WORD.findall(text.lower()) if w not in _STOPWORDS]
+
+
+def chunk_text(text: str, chunk_words: int) -> Iterator[str]:
+	"""Split `text` into chunks of whole paragraphs of about `chunk_words` words."""
+	current: list[str] = []
+	size = 0
+	for paragraph in _PARAGRAPH.split(text):
+		words = paragraph.split()
+		if not words:
+			continue
+		# A paragraph longer than a whole chunk is cut into word windows.
+		pieces = [words[i:i + chunk_words] for i in range(0, len(words), chunk_words)] if len(words) > chunk_words else [words]
+		for piece in pieces:
+			if current and size + len(piece) > chunk_words:
+				yield "\n\n".join(current)
+				current, size = [], 0
+			current.append(paragraph.strip() if piece is words else " ".join(piece))
+			size += len(piece)
+	if current:
+		yield "\n\n".join(current)
+
+
+def iter_documents(root: Path, suffixes: Iterable[str] = TEXT_SUFFIXES) -> Iterator[tuple[str, str]]:
+	"""(relative path, text) of every document under `root`, in a stable order."""
+	suffixes = tuple(s.lower() for s in suffixes)
+	for path in sorted(p for p in root.rglob("*") if p.is_file() and p.suffix.lower() in suffixes):
+		try:
+			yield path.relative_to(root).as_posix(), path.read_text(encoding="utf-8", errors="replace")
+		except OSError as exc:
+			logger.warning("Skipping %s: %s", path, exc)
+
+
+def _write(path: Path, typecode: str, values: Iterable[Any]) -> None:
+	with open(path, "wb") as handle:
+		array.array(typecode, values).tofile(handle)
+
+
+def build_index(
+	source: str,
+	index_dir: Optional[str] = None,
+	*,
+	chunk_words: int = 200,
+	suffixes: Iterable[str] = TEXT_SUFFIXES,
+	k1: float = 1.2,
+	b: float = 0.75,
+) -> dict[str, Any]:
+	"""Index every document under `source` into `index_dir` and return its metadata.
+
+	The index is written next to the target and moved into place when it is
+	complete, so processes that have the previous one open keep using it.
+	"""
+	started = time.perf_counter()
+	root = Path(source)
+	target = Path(index_dir or os.environ.get("RESEARCH_INDEX_DIR") or DEFAULT_INDEX_DIR)
+	staging = target.with_name(f"{target.name}.tmp-{os.getpid()}")
+	shutil.rmtree(staging, ignore_errors=True)
+	staging.mkdir(parents=True)
+
+	postings: dict[str, tuple[array.array, array.array]] = {}
+	lengths = array.array("I")
+	chunk_offsets = array.array("Q", [0])
+	documents = 0
+	with open(staging / "chunks.bin", "wb") as chunks:
+		for name, text in iter_documents(root, suffixes):
+			documents += 1
+			for passage in chunk_text(text, chunk_words):
+				chunk_id = len(lengths)
+				terms = tokenize(passage)
+				counts: dict[str, int] = {}
+				for term in terms:
+					counts[term] = counts.get(term, 0) + 1
+				for term, count in counts.items():
+					docs, tfs = postings.setdefault(term, (array.array("I"), array.array("H")))
+					docs.append(chunk_id)
+					tfs.append(min(count, 0xFFFF))
+				lengths.append(len(terms))
+				record = json.dumps({"source": name, "text": passage}, ensure_ascii=False).encode("utf-8")
+				chunks.write(record)
+				chunk_offsets.append(chunk_offsets[-1] + len(record))
+
+	total = len(lengths)
+	avgdl = (sum(lengths) / total) if total else 0.0
+	vocabulary = sorted(postings, key=lambda t: t.encode("utf-8"))
+	term_offsets = array.array("Q", [0])
+	posting_offsets = array.array("Q", [0])
+	with open(staging / "terms.bin", "wb") as terms_out, open(staging / "postings.doc", "wb") as docs_out, \
+			open(staging / "postings.score", "wb") as scores_out:
+		for term in vocabulary:
+			encoded = term.encode("utf-8")
+			terms_out.write(encoded)
+			term_offsets.append(term_offsets[-1] + len(encoded))
+			docs, tfs = postings.pop(term)
+			idf = math.log(1 + (total - len(docs) + 0.5) / (len(docs) + 0.5))
+			# BM25 weights are fixed per posting, so a query only adds them up.
+			weights = array.array("f", (
+				idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * lengths[doc] / avgdl)) for doc, tf in zip(docs, tfs)
+			))
+			docs.tofile(docs_out)
+			weights.tofile(scores_out)
+			posting_offsets.append(posting_offsets[-1] + len(docs))
+	_write(staging / "terms.idx", "Q", term_offsets)
+	_write(staging / "postings.idx", "Q", posting_offsets)
+	_write(staging / "chunks.idx", "Q", chunk_offsets)
+
+	meta = {
+		"version": INDEX_VERSION,
+		"byteorder": sys.byteorder,
+		"source": str(root),
+		"documents": documents,
+		"chunks": total,
+		"terms": len(vocabulary),
+		"postings": posting_offsets[-1],
+		"avgdl": avgdl,
+		"k1": k1,
+		"b": b,
+		"chunk_words": chunk_words,
+		"created_at": time.time(),
+	}
+	(staging / "meta.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+
+	previous = target.with_name(f"{target.name}.old-{os.getpid()}")
+	if target.exists():
+		os.replace(target, previous)
+	os.replace(staging, target)
+	shutil.rmtree(previous, ignore_errors=True)
+	meta["seconds"] = round(time.perf_counter() - started, 3)
+	return meta
+
+
+@dataclass
+class SearchHit:
+	"""A retrieved passage."""
+
+	chunk: int
+	score: float
+	source: str
+	text: str
+
+
+class DocumentIndex:
+	"""A built index, memory-mapped read-only.
+
+	Args:
+		directory: The directory written by `build_index`.
+	"""
+
+	def __init__(self, directory: str) -> None:
+		self.directory = Path(directory)
+		self.meta = json.loads((self.directory / "meta.json").read_text(encoding="utf-8"))
+		if self.meta.get("version") != INDEX_VERSION or self.meta.get("byteorder") != sys.byteorder:
+			raise ValueError(f"Index {directory} was built by an incompatible version; rebuild it")
+		self._maps: list[mmap.mmap] = []
+		self._terms = self._map("terms.bin")
+		self._term_offsets = self._view("terms.idx", "Q")
+		self._posting_offsets = self._view("postings.idx", "Q")
+		self._docs = self._view("postings.doc", "I")
+		self._weights = self._view("postings.score", "f")
+		self._chunks = self._map("chunks.bin")
+		self._chunk_offsets = self._view("chunks.idx", "Q")
+
+	def _map(self, name: str) -> Any:
+		with open(self.directory / name, "rb") as handle:
+			if os.fstat(handle.fileno()).st_size == 0:
+				return b""
+			mapped = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+		self._maps.append(mapped)
+		return mapped
+
+	def _view(self, name: str, typecode: str) -> Any:
+		data = self._map(name)
+		if np is not None:
+			return np.frombuffer(data, dtype={"Q": np.uint64, "I": np.uint32, "f": np.float32}[typecode])
+		return memoryview(data).cast(typecode) if data else memoryview(array.array(typecode))
+
+	def __len__(self) -> int:
+		return self.meta["chunks"]
+
+	def close(self) -> None:
+		self._terms = self._chunks = b""
+		self._term_offsets = self._posting_offsets = self._docs = self._weights = self._chunk_offsets = None
+		for mapped in self._maps:
+			try:
+				mapped.close()
+			except BufferError:  # a view is still alive; the mapping goes with it
+				pass
+		self._maps.clear()
+
+	def _term_id(self, term: str) -> int:
+		"""Position of `term` in the sorted term table, or -1."""
+		key = term.encode("utf-8")
+		offsets = self._term_offsets
+		low, high = 0, self.meta["terms"] - 1
+		while low <= high:
+			middle = (low + high) // 2
+			found = self._terms[int(offsets[middle]):int(offsets[middle + 1])]
+			if found == key:
+				return middle
+			if found < key:
+				low = middle + 1
+			else:
+				high = middle - 1
+		return -1
+
+	def _top(self, ranges: list[tuple[int, int]], top_k: int) -> list[tuple[int, float]]:
+		if np is not None:
+			scores = np.zeros(len(self), dtype=np.float32)
+			for start, end in ranges:
+				# Each chunk appears once per term, so plain fancy-index addition is exact.
+				scores[self._docs[start:end]] += self._weights[start:end]
+			candidates = np.flatnonzero(scores)
+			if len(candidates) > top_k:
+				candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+			return sorted(((int(c), float(scores[c])) for c in candidates), key=lambda hit: -hit[1])
+		totals: dict[int, float] = {}
+		for start, end in ranges:
+			for doc, weight in zip(self._docs[start:end], self._weights[start:end]):
+				totals[doc] = totals.get(doc, 0.0) + weight
+		return heapq.nlargest(top_k, totals.items(), key=lambda hit: hit[1])
+
+	def passage(self, chunk: int) -> dict[str, str]:
+		"""The stored source and text of a chunk."""
+		return json.loads(self._chunks[int(self._chunk_offsets[chunk]):int(self._chunk_offsets[chunk + 1])])
+
+	def search(self, query: str, top_k: int = 5) -> list[SearchHit]:
+		"""The `top_k` chunks with the highest BM25 score for `query`."""
+		started = time.perf_counter()
+		ranges = []
+		for term in set(tokenize(query)):
+			term_id = self._term_id(term)
+			if term_id >= 0:
+				ranges.append((int(self._posting_offsets[term_id]), int(self._posting_offsets[term_id + 1])))
+		hits = []
+		for chunk, score in self._top(ranges, max(1, top_k)) if ranges else []:
+			passage = self.passage(chunk)
+			hits.append(SearchHit(chunk=chunk, score=round(score, 4), source=passage["source"], text=passage["text"]))
+		SEARCHES.inc()
+		SEARCH_SECONDS.observe(time.perf_counter() - started)
+		return hits
+
+
+@lru_cache(maxsize=1)
+def _open_index(directory: str, built_at: float) -> DocumentIndex:
+	return DocumentIndex(directory)
+
+
+def document_index() -> Optional[DocumentIndex]:
+	"""The index at `RESEARCH_INDEX_DIR`, or None when unset, not built or unreadable.
+
+	Reopened when the index is rebuilt, so long-running processes pick up
+	a new corpus on their next search. An index from another version or
+	byte order, or one caught half-swapped by a rebuild, is logged and
+	treated as missing until the next rebuild.
+	"""
+	directory = os.environ.get("RESEARCH_INDEX_DIR")
+	if not directory:
+		return None
+	try:
+		built_at = (Path(directory) / "meta.json").stat().st_mtime
+	except OSError:
+		logger.warning("RESEARCH_INDEX_DIR is set but %s holds no index; build it with python -m agent_runtime.retrieval build", directory)
+		return None
+	try:
+		return _open_index(directory, built_at)
+	except (OSError, ValueError) as exc:
+		logger.warning("Cannot open the document index in %s, researching without it: %s", directory, exc)
+		return None
+
+
+def index_version() -> Optional[float]:
+	"""When the current index was built, or None without a usable index."""
+	index = document_index()
+	return index.meta.get("created_at") if index is not None else None
+
+
+def format_hits(hits: list[SearchHit], max_tokens: int = 0, tokenizer: Optional[Tokenizer] = None) -> str:
+	"""Numbered passages with their sources, as handed to the model.
+
+	With `max_tokens` the passages stop at that many tokens: the one that
+	crosses the budget is cut short and the rest are left out.
+	"""
+	if not hits:
+		return "No matching passages were found in the local document library."
+	tokenizer = tokenizer or get_tokenizer()
+	passages: list[str] = []
+	left = max_tokens
+	for n, hit in enumerate(hits, 1):
+		passage = f"[{n}] {hit.source}\n{hit.text}"
+		if max_tokens > 0:
+			tokens = tokenizer.count(passage)
+			if tokens > left:
+				if left >= _MIN_PASSAGE_TOKENS or not passages:
+					passages.append(tokenizer.head(passage, max(left, 0)) + " [...]")
+				omitted = len(hits) - len(passages)
+				if omitted:
+					passages.append(f"({omitted} more passages left out to stay within the token budget.)")
+				break
+			left -= tokens
+		passages.append(passage)
+	return "\n\n".join(passages)
+
+
+def result_tokens() -> int:
+	"""Token budget of one search result (`RESEARCH_MAX_TOKENS`).
+
+	Tool results join the researcher's conversation after the prompt was
+	fitted to the context window, so with `MODEL_CONTEXT_WINDOW` set a
+	result never takes more than a quarter of it.
+	"""
+	budget = env_int("RESEARCH_MAX_TOKENS", 1500)
+	window = env_int("MODEL_CONTEXT_WINDOW", 0)
+	return min(budget, window // 4) if window > 0 else budget
+
+
+async def search_documents(
+	query: Annotated[str, "Keywords describing the information needed"],
+	top_k: Annotated[int, "Number of passages to return, 1 to 10"] = 0,
+) -> str:
+	"""Search the local document library and return the most relevant passages with their sources."""
+	# Resolved per call: an index built or rebuilt after startup is picked up.
+	index = document_index()
+	if index is None:
+		return "The local document library is not available. Answer without it."
+	limit = min(max(top_k or env_int("RESEARCH_TOP_K", 5), 1), 10)
+	hits = await asyncio.to_thread(index.search, query, limit)
+	return format_hits(hits, result_tokens(), get_tokenizer(os.environ.get("FOUNDRYLOCAL_MODEL_DEPLOYMENT_NAME")))
+
+
+def research_tools() -> list[Any]:
+	"""The retrieval tool when `RESEARCH_INDEX_DIR` is set, otherwise none.
+
+	The index does not have to exist yet: the tool opens it on each search
+	and reports a missing library until it has been built.
+	"""
+	if not os.environ.get("RESEARCH_INDEX_DIR"):
+		return []
+	from agent_framework import ai_function
+
+	return [ai_function(search_documents, name="search_documents")]
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+	parser = argparse.ArgumentParser(prog="python -m agent_runtime.retrieval", description="Build and query the local document index")
+	commands = parser.add_subparsers(dest="command", required=True)
+	build = commands.add_parser("build", help="Index a directory of documents")
+	build.add_argument("source", help="Directory with the documents")
+	build.add_argument("--index", help=f"Index directory (RESEARCH_INDEX_DIR, default {DEFAULT_INDEX_DIR})")
+	build.add_argument("--chunk-words", type=int, default=200, help="Approximate words per chunk")
+	build.add_argument("--suffix", action="append", help=f"File suffix to index; repeatable (default {' '.join(TEXT_SUFFIXES)})")
+	search = commands.add_parser("search", help="Query an index")
+	search.add_argument("query")
+	search.add_argument("--index", help=f"Index directory (RESEARCH_INDEX_DIR, default {DEFAULT_INDEX_DIR})")
+	search.add_argument("-k", "--top-k", type=int, default=5)
+	args = parser.parse_args(argv)
+
+	logging.basicConfig(level=logging.INFO, format="%(message)s")
+	if args.command == "build":
+		meta = build_index(args.source, args.index, chunk_words=args.chunk_words, suffixes=args.suffix or TEXT_SUFFIXES)
+		print(
+			f"Indexed {meta['documents']} documents as {meta['chunks']} chunks "
+			f"({meta['terms']} terms, {meta['postings']} postings) in {meta['seconds']}s"
+		)
+		return
+	index = DocumentIndex(args.index or os.environ.get("RESEARCH_INDEX_DIR") or DEFAULT_INDEX_DIR)
+	started = time.perf_counter()
+	hits = index.search(args.query, args.top_k)
+	for n, hit in enumerate(hits, 1):
+		print(f"[{n}] {hit.score:.3f} {hit.source}\n{hit.text[:300]}\n")
+	print(f"{len(hits)} of {len(index)} chunks in {1000 * (time.perf_counter() - started):.1f} ms")
+
+
+if __name__ == "__main__":  # pragma: no cover
+	main()
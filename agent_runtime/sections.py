@@ -0,0 +1,124 @@
+"""Section tracking for the fixed output skeletons of the workflow agents.
+
+Every agent is instructed to answer with a known sequence of markdown
+headings (the planner ends with "NEXT STEPS", the researcher with
+"VALIDATION & RECOMMENDATIONS", the advisor with "ADDITIONAL
+CONSIDERATIONS"). `SectionTracker` follows those headings while text is
+streamed so the caller can stop generation once the final required section
+has been written instead of waiting for the model to finish rambling.
+"""
+
+import re
+from typing import Iterable, Optional
+
+_MARKDOWN_HEADING = re.compile(r"^\s{0,3}(#{1,6})\s+(.*?)\s*#*\s*$")
+_BOLD_HEADING = re.compile(r"^\s{0,3}\*\*(.+?)\*\*:?\s*$")
+_RULE = re.compile(r"^\s{0,3}([-*_])(\s*\1){2,}\s*$")
+_FENCE = re.compile(r"^\s{0,3}(```|~~~)")
+
+
+def normalize_heading(text: str) -> str:
+	"""Reduce a heading to upper-case words so emoji and markup do not matter."""
+	cleaned = re.sub(r"[^0-9A-Za-z&]+", " ", text)
+	return " ".join(cleaned.upper().split())
+
+
+class SectionTracker:
+	"""Follow streamed markdown and decide where the required skeleton ends.
+
+	Text is fed chunk by chunk. Until the final required heading appears,
+	everything may be released downstream immediately. Inside the final
+	section only complete lines are released, so that a cut can always be
+	placed at a line boundary. The section is considered complete when
+	either another markdown heading (or horizontal rule) starts, or the
+	section body has grown past `grace_chars` and a paragraph break occurs.
+	"""
+
+	def __init__(self, sections: Iterable[str], *, grace_chars: int = 1500) -> None:
+		self.sections = [normalize_heading(s) for s in sections if s]
+		if not self.sections:
+			raise ValueError("SectionTracker needs at least one required section")
+		self.grace_chars = grace_chars
+		self.seen: list[str] = []
+		self.cut: Optional[int] = None
+		self._text = ""
+		self._scanned = 0
+		self._final_start: Optional[int] = None
+		self._final_level: Optional[int] = None
+		self._in_fence = False
+		self._in_think = False
+
+	@property
+	def text(self) -> str:
+		"""All text fed so far."""
+		return self._text
+
+	@property
+	def complete(self) -> bool:
+		"""True once the final required section is finished."""
+		return self.cut is not None
+
+	@property
+	def missing(self) -> list[str]:
+		"""Required sections that were not seen before the final one."""
+		return [s for s in self.sections if s not in self.seen]
+
+	@property
+	def releasable(self) -> int:
+		"""Offset into `text` up to which output can safely be forwarded."""
+		if self.cut is not None:
+			return self.cut
+		if self._final_start is None:
+			return len(self._text)
+		return self._scanned
+
+	def feed(self, chunk: str) -> None:
+		"""Consume the next piece of streamed text."""
+		if self.cut is not None or not chunk:
+			return
+		self._text += chunk
+		while self.cut is None:
+			end = self._text.find("\n", self._scanned)
+			if end < 0:
+				break
+			self._scan_line(self._scanned, self._text[self._scanned:end])
+			if self.cut is None:
+				self._scanned = end + 1
+
+	def _scan_line(self, start: int, line: str) -> None:
+		if "<think>" in line:
+			self._in_think = True
+		if self._in_think:
+			if "</think>" in line:
+				self._in_think = False
+			return
+		if _FENCE.match(line):
+			self._in_fence = not self._in_fence
+			return
+		if self._in_fence:
+			return
+
+		heading = _MARKDOWN_HEADING.match(line)
+		if self._final_start is None:
+			if heading:
+				title, level = heading.group(2), len(heading.group(1))
+			else:
+				bold = _BOLD_HEADING.match(line)
+				if not bold:
+					return
+				title, level = bold.group(1), None
+			name = normalize_heading(title)
+			if name in self.sections and name not in self.seen:
+				self.seen.append(name)
+				if name == self.sections[-1]:
+					self._final_start = start + len(line) + 1
+					self._final_level = level
+			return
+
+		body = start - self._final_start
+		if heading and (self._final_level is None or len(heading.group(1)) <= self._final_level):
+			self.cut = start
+		elif _RULE.match(line) and body > 0:
+			self.cut = start
+		elif not line.strip() and body >= self.grace_chars:
+			self.cut = start
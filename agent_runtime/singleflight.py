@@ -0,0 +1,129 @@
+"""In-flight coalescing of identical concurrent executions.
+
+`SingleFlight` runs an async event stream once per key and fans the events
+out to every caller that asks for the same key while it is running:
+
+	flights = SingleFlight("workflow")
+	flight, leader = flights.join(key, lambda: produce_events(), owner=run)
+	async for event in flight.subscribe():
+		...
+
+Late subscribers first receive the events they missed, so every
+subscriber sees the complete sequence. The execution runs in its own task:
+a subscriber that goes away does not stop it, and it is cancelled only when
+the last subscriber is gone. Once it finishes, the next call for the key
+starts a new execution.
+"""
+
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Callable, Optional
+
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+REQUESTS = REGISTRY.counter("singleflight_requests_total", "Executions requested, by group and role (leader runs, follower shares)")
+SUBSCRIBERS = REGISTRY.gauge("singleflight_subscribers", "Callers currently sharing in-flight executions, by group")
+
+
+class Flight:
+	"""One shared execution and the events it produced so far."""
+
+	def __init__(self, group: "SingleFlight", key: str, owner: Any) -> None:
+		self.group = group
+		self.key = key
+		self.owner = owner
+		self.events: list[Any] = []
+		self.error: Optional[BaseException] = None
+		self.done = False
+		self.subscribers = 0
+		self._signal = asyncio.Event()
+		self._task: Optional[asyncio.Task] = None
+
+	def _wake(self) -> None:
+		signal, self._signal = self._signal, asyncio.Event()
+		signal.set()
+
+	def _start(self, events: AsyncIterator[Any]) -> None:
+		async def produce() -> None:
+			try:
+				async for event in events:
+					self.events.append(event)
+					self._wake()
+			except BaseException as exc:
+				self.error = exc
+			finally:
+				self.done = True
+				self.group._finish(self)
+				self._wake()
+
+		self._task = asyncio.create_task(produce())
+
+	async def subscribe(self) -> AsyncIterator[Any]:
+		"""All events of the execution, from the first; re-raises its error."""
+		self.subscribers += 1
+		self.group._count(1)
+		index = 0
+		try:
+			while True:
+				signal = self._signal
+				if index < len(self.events):
+					index += 1
+					yield self.events[index - 1]
+					continue
+				if self.done:
+					if self.error is not None:
+						raise self.error
+					return
+				await signal.wait()
+		finally:
+			self.subscribers -= 1
+			self.group._count(-1)
+			if not self.subscribers and not self.done and self._task is not None:
+				# Nobody is listening any more: stop the execution.
+				self._task.cancel()
+
+
+class SingleFlight:
+	"""A group of keyed executions that concurrent callers share.
+
+	Args:
+		name: Label of the group in the metrics.
+	"""
+
+	def __init__(self, name: str) -> None:
+		self.name = name
+		self._flights: dict[str, Flight] = {}
+		self._subscribers = 0
+
+	def get(self, key: str) -> Optional[Flight]:
+		return self._flights.get(key)
+
+	def find(self, predicate: Callable[[Flight], bool]) -> Optional[Flight]:
+		"""The first in-flight execution matching `predicate`."""
+		return next((f for f in self._flights.values() if predicate(f)), None)
+
+	def join(self, key: str, start: Callable[[], AsyncIterator[Any]], *, owner: Any = None) -> tuple[Flight, bool]:
+		"""Join the execution for `key`, starting it with `start()` if there is none.
+
+		Returns the flight and whether this caller started it.
+		"""
+		flight = self._flights.get(key)
+		if flight is not None:
+			REQUESTS.inc(group=self.name, role="follower")
+			logger.info("[%s] joining in-flight execution %s (%d events so far)", self.name, key[:12], len(flight.events))
+			return flight, False
+		flight = Flight(self, key, owner)
+		self._flights[key] = flight
+		REQUESTS.inc(group=self.name, role="leader")
+		flight._start(start())
+		return flight, True
+
+	def _finish(self, flight: Flight) -> None:
+		if self._flights.get(flight.key) is flight:
+			del self._flights[flight.key]
+
+	def _count(self, delta: int) -> None:
+		self._subscribers += delta
+		SUBSCRIBERS.set(self._subscribers, group=self.name)
@@ -0,0 +1,476 @@
+"""Stage wrapper applied to each agent inside the workflow.
+
+`StageAgent` sits between an `AgentExecutor` and the underlying
+`ChatAgent`. It forwards everything unchanged by default and is the single
+place where per-stage generation policies are applied, such as stopping the
+model once its output skeleton is complete, converting the answer to the
+compact handoff format read by the next stage, checking the prompt against
+the context window, waiting for a model slot of the request's priority
+class, switching to a faster model while load is shed, continuing an
+answer the model stopped because it reached its token limit, or fitting
+the stage into what is left of the request's deadline.
+"""
+
+import logging
+import time
+from contextlib import aclosing
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterable, Iterable, Optional
+
+from agent_framework import AgentRunResponse, AgentRunResponseUpdate, ChatMessage, Role, TextContent
+
+from .config import env_flag, env_int
+from .context_window import ContextBudget, fit_prompt, prompt_tokens
+from .deadline import ACTIONS as DEADLINE_ACTIONS, decode_rate, min_stage_seconds, remaining, until
+from .handoff import to_handoff
+from .load_shedding import load_shedder
+from .metrics import REGISTRY
+from .output_stats import adaptive_max_tokens, record_completion
+from .priority import model_scheduler
+from .sections import SectionTracker
+from .tokens import approx_tokens, get_tokenizer
+
+logger = logging.getLogger(__name__)
+
+HANDOFF_TOKENS = REGISTRY.counter("handoff_tokens_total", "Estimated tokens handed to the next stage, by format")
+OUTPUT_TOKENS = REGISTRY.summary("stage_output_tokens", "Estimated tokens each stage forwards downstream, by format")
+HANDOFF_REDUCTION = REGISTRY.summary("handoff_token_reduction_ratio", "Fraction of handoff prompt tokens saved by the compact format")
+CONTINUATIONS = REGISTRY.counter("stage_continuations_total", "Continuation requests after answers cut off by the token limit, by outcome")
+
+CONTINUE_PROMPT = (
+	"Your previous answer was cut off by the length limit. Continue it exactly where it stopped, "
+	"without repeating anything already written and without any introduction."
+)
+# How much of the start of a continuation is compared with the end of the
+# answer so far, to drop text the model repeated despite the instruction.
+_OVERLAP_CHARS = 200
+_MIN_OVERLAP = 16
+# Put in place of the start of an answer dropped from a continuation request.
+_OMITTED_MARKER = "[... start of the answer omitted ...]\n\n"
+# Smallest generation limit a deadline may impose on a stage.
+_MIN_DEADLINE_TOKENS = 64
+
+SKIPPED_NOTE = "(This step was skipped to answer within the response time budget.)"
+
+
+def _finish_reason(item: Any) -> Optional[str]:
+	"""The model's finish reason carried by a streamed update or a response, if any."""
+	reason = getattr(getattr(item, "raw_representation", None), "finish_reason", None)
+	return getattr(reason, "value", reason)
+
+
+def _overlap(text: str, continuation: str) -> int:
+	"""Length of the longest start of `continuation` that `text` already ends with."""
+	for size in range(min(len(text), len(continuation)), _MIN_OVERLAP - 1, -1):
+		if text.endswith(continuation[:size]):
+			return size
+	return 0
+
+
+def _continuation_messages(messages: Any, partial: str) -> list[ChatMessage]:
+	"""The original prompt, the truncated answer so far and the request to go on."""
+	history = [] if messages is None else [messages] if isinstance(messages, (str, ChatMessage)) else list(messages)
+	return [
+		*(ChatMessage(role=Role.USER, text=m) if isinstance(m, str) else m for m in history),
+		ChatMessage(role=Role.ASSISTANT, text=partial),
+		ChatMessage(role=Role.USER, text=CONTINUE_PROMPT),
+	]
+
+
+def _other_contents(update: AgentRunResponseUpdate) -> list[Any]:
+	return [c for c in update.contents if not isinstance(c, TextContent)]
+
+
+def _with_text(update: AgentRunResponseUpdate, text: str, *, keep_other: bool = True) -> AgentRunResponseUpdate:
+	"""Copy an update, replacing its text contents with `text`."""
+	contents = _other_contents(update) if keep_other else []
+	if text:
+		contents.insert(0, TextContent(text=text))
+	return AgentRunResponseUpdate(
+		contents=contents,
+		role=update.role,
+		author_name=update.author_name,
+		response_id=update.response_id,
+		message_id=update.message_id,
+		created_at=update.created_at,
+		additional_properties=update.additional_properties,
+		raw_representation=update.raw_representation,
+	)
+
+
+@dataclass
+class _StageCall:
+	"""Timing and deadline state of one call of a stage.
+
+	Kept per call rather than on the `StageAgent`, which is shared by every
+	run of a workflow that is built once (the DevUI one, for example).
+	"""
+
+	started: float = field(default_factory=time.perf_counter)
+	generating: float = field(default_factory=time.perf_counter)
+	cutoff: Optional[float] = None
+	limited: bool = False
+	report: Optional[dict[str, Any]] = None
+
+	def cut(self) -> bool:
+		"""True once the stage's share of the deadline is used up."""
+		return self.cutoff is not None and time.monotonic() >= self.cutoff
+
+
+class StageAgent:
+	"""Delegate to a workflow agent while applying per-stage policies.
+
+	Attributes that are not defined here (name, id, chat_options,
+	get_new_thread, ...) are looked up on the wrapped agent, so the wrapper
+	can be handed to `AgentExecutor` in place of the agent itself.
+
+	Args:
+		agent: The agent to wrap.
+		required_sections: Ordered headings of the agent's output skeleton.
+		early_stop: Stop generating once the last required section is complete.
+			Defaults to the `EARLY_STOP_SECTIONS` environment variable.
+		handoff_fields: JSON fields of the compact handoff format, in the order
+			of `required_sections`. When given, the answer is buffered and
+			forwarded as minified JSON (see `agent_runtime.handoff`).
+		model_id: Model to call instead of the agent's own, e.g. the fast
+			model of a run served in degraded mode (see `agent_runtime.load_shedding`).
+		max_continuations: Continuation requests made when the model stops at
+			its token limit (`finish_reason == "length"`) before the answer
+			is handed on as it is. Defaults to `LENGTH_CONTINUATION_ROUNDS`.
+		budget_share: Fraction of the request's remaining time this stage may
+			use when a deadline is set (see `agent_runtime.deadline`).
+		optional: The stage may be skipped when too little time is left.
+	"""
+
+	def __init__(
+		self,
+		agent: Any,
+		*,
+		required_sections: Iterable[str] = (),
+		early_stop: Optional[bool] = None,
+		handoff_fields: Iterable[str] = (),
+		model_id: Optional[str] = None,
+		max_continuations: Optional[int] = None,
+		budget_share: float = 1.0,
+		optional: bool = False,
+	) -> None:
+		self._agent = agent
+		self.required_sections = tuple(required_sections)
+		self.early_stop = env_flag("EARLY_STOP_SECTIONS") if early_stop is None else early_stop
+		self.grace_chars = env_int("EARLY_STOP_GRACE_CHARS", 1500)
+		self.handoff_fields = tuple(handoff_fields)
+		self.model_id = model_id
+		self.max_continuations = max(0, env_int("LENGTH_CONTINUATION_ROUNDS", 2) if max_continuations is None else max_continuations)
+		self.budget_share = min(max(budget_share, 0.0), 1.0)
+		self.optional = optional
+
+	def __getattr__(self, name: str) -> Any:
+		return getattr(self._agent, name)
+
+	@property
+	def agent(self) -> Any:
+		"""The wrapped agent."""
+		return self._agent
+
+	def _tracking(self) -> bool:
+		# JSON answers have no markdown headings to track.
+		return self.early_stop and bool(self.required_sections) and not self.handoff_fields
+
+	@property
+	def _model(self) -> Optional[str]:
+		if self.model_id:
+			return self.model_id
+		return getattr(getattr(self._agent, "chat_client", None), "model_id", None)
+
+	@property
+	def _stats_key(self) -> str:
+		# Compact JSON answers are much shorter than the markdown ones.
+		return f"{self.name}/json" if self.handoff_fields else str(self.name)
+
+	def _options(self, kwargs: dict[str, Any]) -> dict[str, Any]:
+		"""Add the model override and the adaptive `max_tokens` unless one is set explicitly."""
+		if self.model_id and not kwargs.get("model_id"):
+			kwargs = {**kwargs, "model_id": self.model_id}
+		options = getattr(self._agent, "chat_options", None)
+		if kwargs.get("max_tokens") is None and getattr(options, "max_tokens", None) is None:
+			limit = adaptive_max_tokens(self._stats_key, self._model)
+			if limit:
+				return {**kwargs, "max_tokens": limit}
+		return kwargs
+
+	def _fit(self, messages: Any, max_tokens: Optional[int]) -> Any:
+		"""Check the prompt against the context window, trimming it if the policy allows."""
+		options = getattr(self._agent, "chat_options", None)
+		fitted, report = fit_prompt(
+			messages,
+			getattr(options, "instructions", None),
+			tokenizer=get_tokenizer(self._model),
+			budget=ContextBudget.from_env(max_tokens or getattr(options, "max_tokens", None)),
+			stage=self.name,
+		)
+		return fitted if report["trimmed_tokens"] else messages
+
+	def _continuation_prompt(self, messages: Any, partial: str, max_tokens: Optional[int]) -> Any:
+		"""Continuation messages fitted into the context window.
+
+		The answer so far is about as long as the generation limit, so the
+		request often overflows the window where the original prompt did not.
+		The start of the answer is dropped first, as the model needs its end to
+		go on; whatever is still over is trimmed by `_fit`.
+		"""
+		prompt = _continuation_messages(messages, partial)
+		budget = ContextBudget.from_env(max_tokens or getattr(getattr(self._agent, "chat_options", None), "max_tokens", None))
+		if budget.window > 0:
+			tokenizer = get_tokenizer(self._model)
+			instructions = getattr(getattr(self._agent, "chat_options", None), "instructions", None)
+			excess = prompt_tokens(instructions, prompt, tokenizer) - budget.limit
+			if excess > 0:
+				keep = tokenizer.count(partial) - excess - tokenizer.count(_OMITTED_MARKER)
+				if keep > 0:
+					prompt = _continuation_messages(messages, _OMITTED_MARKER + tokenizer.tail(partial, keep))
+		return self._fit(prompt, max_tokens)
+
+	def _record(self, text: str) -> int:
+		tokens = get_tokenizer(self._model).count(text) if text else 0
+		if tokens:
+			record_completion(self._stats_key, self._model, tokens)
+		return tokens
+
+	def _plan_deadline(self, call: _StageCall, kwargs: dict[str, Any]) -> dict[str, Any]:
+		"""Fit the stage into what is left of the request deadline, if there is one."""
+		left = remaining()
+		if left is None:
+			return kwargs
+		seconds = left * self.budget_share
+		report: dict[str, Any] = {"remaining_s": round(left, 1), "budget_s": round(seconds, 1)}
+		call.report = report
+		if self.optional and seconds < min_stage_seconds():
+			report["skipped"] = True
+			DEADLINE_ACTIONS.inc(stage=self.name, action="skipped")
+			logger.info("[%s] skipped: %.1fs of the request deadline left", self.name, left)
+			return kwargs
+		# Required stages always get a minimum, so the run still produces an answer.
+		seconds = max(seconds, min_stage_seconds())
+		call.cutoff = time.monotonic() + seconds
+		limit = decode_rate().max_tokens(self._model, seconds)
+		current = kwargs.get("max_tokens") or getattr(getattr(self._agent, "chat_options", None), "max_tokens", None)
+		if limit is not None and (current is None or limit < current):
+			limit = max(limit, _MIN_DEADLINE_TOKENS)
+			kwargs = {**kwargs, "max_tokens": limit}
+			report["max_tokens"] = limit
+			call.limited = True
+			DEADLINE_ACTIONS.inc(stage=self.name, action="limited")
+		return kwargs
+
+	def _stream(self, call: _StageCall, messages: Any = None, **kwargs: Any) -> AsyncIterable[AgentRunResponseUpdate]:
+		stream = self._agent.run_stream(messages, **kwargs)
+		return until(stream, call.cutoff) if call.cutoff is not None else stream
+
+	async def _continue(
+		self, call: _StageCall, messages: Any, partial: str, **kwargs: Any
+	) -> AsyncIterable[AgentRunResponseUpdate]:
+		"""Ask the model to go on with an answer it stopped at its token limit.
+
+		Each round sends the original messages, the answer so far and
+		`CONTINUE_PROMPT`, without the stage's thread, fitted into the context
+		window, and streams only the new text: anything the model repeats from
+		the end of the answer so far is dropped. Stops after `max_continuations` rounds or when the model
+		finishes for another reason. A failed round leaves the answer as it is.
+		"""
+		for round_number in range(1, self.max_continuations + 1):
+			logger.info("[%s] answer hit the token limit after %d chars; continuation %d", self.name, len(partial), round_number)
+			reason = None
+			head = ""
+			checked = False
+			try:
+				prompt = self._continuation_prompt(messages, partial, kwargs.get("max_tokens"))
+				async for update in self._stream(call, prompt, **kwargs):
+					reason = _finish_reason(update) or reason
+					text = update.text
+					if not checked:
+						# Hold the start back until it can be compared with the end of the answer.
+						head += text
+						if len(head) < _OVERLAP_CHARS:
+							if _other_contents(update):
+								yield _with_text(update, "")
+							continue
+						checked = True
+						text = head[_overlap(partial, head):]
+					partial += text
+					yield _with_text(update, text)
+				if not checked and head:
+					text = head[_overlap(partial, head):]
+					partial += text
+					yield AgentRunResponseUpdate(text=text, role="assistant")
+			except Exception as exc:
+				logger.warning("[%s] continuation %d failed, keeping the truncated answer: %s", self.name, round_number, exc)
+				CONTINUATIONS.inc(stage=self.name, outcome="failed")
+				return
+			if call.cut():
+				return
+			if reason != "length":
+				CONTINUATIONS.inc(stage=self.name, outcome="completed")
+				return
+			CONTINUATIONS.inc(stage=self.name, outcome="truncated")
+		if self.max_continuations:
+			logger.warning("[%s] answer is still cut off after %d continuations", self.name, self.max_continuations)
+
+	async def _generate(
+		self, call: _StageCall, messages: Any = None, *, thread: Any = None, **kwargs: Any
+	) -> AsyncIterable[AgentRunResponseUpdate]:
+		"""Stream the wrapped agent, continuing truncated answers and recording how many tokens it generated."""
+		parts: list[str] = []
+		reason = None
+		first: Optional[float] = None
+		try:
+			async for update in self._stream(call, messages, thread=thread, **kwargs):
+				if first is None:
+					first = time.perf_counter()
+					# Time to the first token, queueing included: the load signal of load shedding.
+					load_shedder().observe(first - call.started)
+				reason = _finish_reason(update) or reason
+				parts.append(update.text)
+				yield update
+			cut = call.cut()
+			if first is not None and not cut:
+				# The pace of a complete answer tells later stages how much fits in their time.
+				tokens = get_tokenizer(self._model).count("".join(parts))
+				decode_rate().observe(self._model, first - call.generating, tokens, time.perf_counter() - first)
+			# A limit lowered to meet the deadline is meant to cut the answer short.
+			if reason == "length" and self.max_continuations and not call.limited and not cut:
+				async with aclosing(self._continue(call, messages, "".join(parts), **kwargs)) as continuation:
+					async for update in continuation:
+						parts.append(update.text)
+						yield update
+		except GeneratorExit:
+			# Closed early (early stop): what was generated so far is what the stage needed.
+			self._record("".join(parts))
+			raise
+		self._record("".join(parts))
+
+	async def run(self, messages: Any = None, *, thread: Any = None, **kwargs: Any) -> AgentRunResponse:
+		"""Run the stage and return the complete response."""
+		if not self._tracking() and not self.handoff_fields and remaining() is None:
+			kwargs = self._options(kwargs)
+			messages = self._fit(messages, kwargs.get("max_tokens"))
+			# No time to first token here: the load-shedding latency signal
+			# comes from streamed stages only (see `_generate`).
+			async with model_scheduler().slot():
+				response = await self._agent.run(messages, thread=thread, **kwargs)
+				if _finish_reason(response) == "length" and self.max_continuations and response.messages:
+					extra = "".join([u.text async for u in self._continue(_StageCall(), messages, response.text, **kwargs)])
+					texts = [c for c in response.messages[-1].contents if isinstance(c, TextContent)]
+					if extra and texts:
+						# Message text joins contents with spaces, so extend the last one instead.
+						texts[-1].text += extra
+			self._record(response.text)
+			return response
+		# Early stop, handoff conversion and deadlines work on the streamed text.
+		updates = [u async for u in self.run_stream(messages, thread=thread, **kwargs)]
+		return AgentRunResponse.from_agent_run_response_updates(updates)
+
+	async def run_stream(
+		self, messages: Any = None, *, thread: Any = None, **kwargs: Any
+	) -> AsyncIterable[AgentRunResponseUpdate]:
+		"""Stream the stage, applying the configured policies."""
+		stream = self._handoff_stream if self.handoff_fields else self._section_stream
+		parts: list[str] = []
+		kwargs = self._options(kwargs)
+		# Fail before queueing for a model slot if the prompt cannot fit.
+		messages = self._fit(messages, kwargs.get("max_tokens"))
+		call = _StageCall()
+		# One slot per stage: higher-priority work can take over between stages.
+		async with model_scheduler().slot():
+			kwargs = self._plan_deadline(call, kwargs)
+			report = call.report
+			if report is not None and report.get("skipped"):
+				yield AgentRunResponseUpdate(text=SKIPPED_NOTE, role="assistant", additional_properties={"deadline": report})
+				return
+			call.generating = time.perf_counter()
+			last: Optional[AgentRunResponseUpdate] = None
+			async for update in stream(call, messages, thread=thread, **kwargs):
+				parts.append(update.text)
+				last = update
+				yield update
+			if call.cut():
+				report["cut"] = True
+				DEADLINE_ACTIONS.inc(stage=self.name, action="cut")
+				logger.info("[%s] stopped at its share of the request deadline (%d chars kept)", self.name, len("".join(parts)))
+			if report is not None and (report.get("cut") or "max_tokens" in report):
+				# Carries the deadline report to the runner without adding text.
+				yield AgentRunResponseUpdate(
+					contents=[],
+					role="assistant",
+					message_id=last.message_id if last else None,
+					response_id=last.response_id if last else None,
+					additional_properties={"deadline": report},
+				)
+		OUTPUT_TOKENS.observe(
+			approx_tokens("".join(parts)), stage=self.name, format="json" if self.handoff_fields else "markdown"
+		)
+
+	async def _section_stream(
+		self, call: _StageCall, messages: Any = None, *, thread: Any = None, **kwargs: Any
+	) -> AsyncIterable[AgentRunResponseUpdate]:
+		"""Stream the stage, cutting the output once the skeleton is complete."""
+		if not self._tracking():
+			async for update in self._generate(call, messages, thread=thread, **kwargs):
+				yield update
+			return
+
+		tracker = SectionTracker(self.required_sections, grace_chars=self.grace_chars)
+		emitted = 0
+		last: Optional[AgentRunResponseUpdate] = None
+		async with aclosing(self._generate(call, messages, thread=thread, **kwargs)) as stream:
+			async for update in stream:
+				last = update
+				text = update.text
+				if text:
+					tracker.feed(text)
+				release = tracker.text[emitted:tracker.releasable]
+				emitted += len(release)
+				if release or _other_contents(update):
+					yield _with_text(update, release)
+				if tracker.complete:
+					logger.info(
+						"[%s] early stop after final section (%d chars kept, %d missing sections)",
+						self.name,
+						tracker.cut,
+						len(tracker.missing),
+					)
+					# Leaving the context closes the underlying stream and the HTTP request.
+					return
+
+		# The stream ended on its own; flush whatever was held back.
+		if last is not None and emitted < len(tracker.text):
+			yield _with_text(last, tracker.text[emitted:], keep_other=False)
+
+	async def _handoff_stream(
+		self, call: _StageCall, messages: Any = None, *, thread: Any = None, **kwargs: Any
+	) -> AsyncIterable[AgentRunResponseUpdate]:
+		"""Buffer the answer and forward it once, as compact JSON."""
+		parts: list[str] = []
+		other: list[Any] = []
+		last: Optional[AgentRunResponseUpdate] = None
+		async for update in self._generate(call, messages, thread=thread, **kwargs):
+			last = update
+			parts.append(update.text)
+			other.extend(_other_contents(update))
+		if last is None:
+			return
+		compact, report = to_handoff("".join(parts), self.required_sections, self.handoff_fields)
+		HANDOFF_TOKENS.inc(report["compact_tokens"], stage=self.name, format="compact")
+		HANDOFF_TOKENS.inc(report["markdown_tokens"], stage=self.name, format="markdown")
+		HANDOFF_REDUCTION.observe(report["reduction"], stage=self.name)
+		logger.info(
+			"[%s] compact handoff from %s: ~%d tokens instead of ~%d (%.0f%% fewer prompt tokens downstream)",
+			self.name,
+			report["source"],
+			report["compact_tokens"],
+			report["markdown_tokens"],
+			100 * report["reduction"],
+		)
+		result = _with_text(last, compact, keep_other=False)
+		result.contents.extend(other)
+		result.additional_properties = {**(last.additional_properties or {}), "handoff": report}
+		yield result
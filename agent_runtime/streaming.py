@@ -0,0 +1,104 @@
+"""Coalesced, rate-limited forwarding of streamed text to a UI.
+
+Models stream one token per chunk, and forwarding every chunk as its own
+websocket message (Chainlit's `stream_token`) floods the socket and makes the
+browser re-render markdown thousands of times per answer. `CoalescingStream`
+buffers the text and hands it to `send` in batches:
+
+	stream = CoalescingStream(message.stream_token)
+	async for text in chunks:
+		await stream.push(text)
+	await stream.aclose()   # at the stage boundary
+
+A batch goes out once `STREAM_FLUSH_INTERVAL_MS` has passed since the last
+one, or earlier when `STREAM_FLUSH_CHARS` characters are waiting. With the
+defaults a session sends about ten updates per second, however fast the
+model is.
+"""
+
+import asyncio
+import time
+from typing import Awaitable, Callable, Optional
+
+from .config import env_int
+from .metrics import REGISTRY
+
+CHUNKS = REGISTRY.counter("ui_stream_chunks_total", "Streamed text chunks received for the UI")
+UPDATES = REGISTRY.counter("ui_stream_updates_total", "Coalesced updates sent to the UI")
+
+
+class CoalescingStream:
+	"""Batch streamed text and forward it at a bounded rate.
+
+	Args:
+		send: Coroutine function that delivers one batch of text.
+		interval: Seconds between updates (`STREAM_FLUSH_INTERVAL_MS`).
+		max_chars: Buffered characters that trigger an early update
+			(`STREAM_FLUSH_CHARS`, 0 = never early).
+		label: Label for the metrics, such as the frontend name.
+	"""
+
+	def __init__(
+		self,
+		send: Callable[[str], Awaitable[object]],
+		*,
+		interval: Optional[float] = None,
+		max_chars: Optional[int] = None,
+		label: str = "chainlit",
+	) -> None:
+		self._send = send
+		self.interval = interval if interval is not None else env_int("STREAM_FLUSH_INTERVAL_MS", 100) / 1000
+		self.max_chars = max_chars if max_chars is not None else env_int("STREAM_FLUSH_CHARS", 2000)
+		self.label = label
+		self.updates = 0
+		self._buffer: list[str] = []
+		self._size = 0
+		self._last = time.monotonic()
+		self._timer: Optional[asyncio.Task] = None
+		self._lock = asyncio.Lock()
+
+	async def push(self, text: str) -> None:
+		"""Queue text; it is sent with the next batch."""
+		if not text:
+			return
+		CHUNKS.inc(frontend=self.label)
+		self._buffer.append(text)
+		self._size += len(text)
+		if self.interval <= 0 or (self.max_chars and self._size >= self.max_chars):
+			await self.flush()
+		elif time.monotonic() - self._last >= self.interval:
+			await self.flush()
+		elif self._timer is None:
+			# Make sure the tail of a burst is shown even if no more text arrives.
+			self._timer = asyncio.create_task(self._flush_later())
+
+	async def _flush_later(self) -> None:
+		await asyncio.sleep(max(0.0, self.interval - (time.monotonic() - self._last)))
+		self._timer = None
+		await self.flush()
+
+	async def flush(self) -> None:
+		"""Send everything buffered now."""
+		async with self._lock:
+			if not self._buffer:
+				return
+			text = "".join(self._buffer)
+			self._buffer.clear()
+			self._size = 0
+			self._last = time.monotonic()
+			self.updates += 1
+			UPDATES.inc(frontend=self.label)
+			await self._send(text)
+
+	async def aclose(self) -> None:
+		"""Flush the rest, for example at a stage boundary."""
+		if self._timer is not None:
+			self._timer.cancel()
+			self._timer = None
+		await self.flush()
+
+	async def __aenter__(self) -> "CoalescingStream":
+		return self
+
+	async def __aexit__(self, *exc_info: object) -> None:
+		await self.aclose()
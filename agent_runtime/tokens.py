@@ -0,0 +1,122 @@
+"""Prompt-size estimates for comparing how much text a stage forwards.
+
+`approx_tokens` follows the shape of BPE tokenizers closely enough for
+before/after comparisons without loading a tokenizer: words and numbers
+count as one token per ~4 characters, runs of ASCII punctuation (`":["`,
+`**`, `###`) as one token per three characters, and characters outside ASCII
+(emoji, box drawing) as two tokens each.
+
+`get_tokenizer(model)` returns an exact tokenizer when one is available and
+falls back to the estimate otherwise. It is loaded once per model:
+
+1. `MODEL_TOKENIZER_FILE`, a Hugging Face `tokenizer.json` such as the one in
+   the Foundry Local model cache (needs the optional `tokenizers` package).
+2. `tiktoken` (optional) with the model's encoding, or `o200k_base`.
+3. `approx_tokens`.
+"""
+
+import logging
+import os
+import re
+from functools import lru_cache
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+_PIECE = re.compile(r"[A-Za-z]+|\d+|[!-/:-@\[-`{-~]+|\S")
+
+
+def approx_tokens(text: str) -> int:
+	"""Estimated token count of `text`."""
+	total = 0
+	for piece in _PIECE.findall(text or ""):
+		if piece[0].isascii() and piece[0].isalnum():
+			total += (len(piece) + 3) // 4
+		elif piece[0].isascii():
+			total += (len(piece) + 2) // 3
+		else:
+			total += 2
+	return total
+
+
+class Tokenizer:
+	"""Token counting and truncation based on `approx_tokens`."""
+
+	name = "approx"
+
+	def count(self, text: str) -> int:
+		return approx_tokens(text)
+
+	def head(self, text: str, max_tokens: int) -> str:
+		"""Longest prefix of `text` within `max_tokens`."""
+		total, end = 0, 0
+		for match in _PIECE.finditer(text or ""):
+			total += approx_tokens(match.group())
+			if total > max_tokens:
+				return text[:end]
+			end = match.end()
+		return text
+
+	def tail(self, text: str, max_tokens: int) -> str:
+		"""Longest suffix of `text` within `max_tokens`."""
+		total, start = 0, len(text or "")
+		for match in reversed(list(_PIECE.finditer(text or ""))):
+			total += approx_tokens(match.group())
+			if total > max_tokens:
+				return text[start:]
+			start = match.start()
+		return text
+
+
+class _EncodingTokenizer(Tokenizer):
+	def __init__(self, name: str, encode: Callable[[str], list[int]], decode: Callable[[list[int]], str]) -> None:
+		self.name = name
+		self._encode = encode
+		self._decode = decode
+
+	def count(self, text: str) -> int:
+		return len(self._encode(text or ""))
+
+	def head(self, text: str, max_tokens: int) -> str:
+		ids = self._encode(text or "")
+		return text if len(ids) <= max_tokens else self._decode(ids[:max(max_tokens, 0)])
+
+	def tail(self, text: str, max_tokens: int) -> str:
+		ids = self._encode(text or "")
+		if len(ids) <= max_tokens:
+			return text
+		return self._decode(ids[len(ids) - max_tokens:]) if max_tokens > 0 else ""
+
+
+@lru_cache(maxsize=None)
+def get_tokenizer(model: Optional[str] = None) -> Tokenizer:
+	"""Best available tokenizer for `model`, cached per model."""
+	path = os.environ.get("MODEL_TOKENIZER_FILE")
+	if path:
+		try:
+			from tokenizers import Tokenizer as HFTokenizer  # type: ignore[import-not-found]
+
+			hf = HFTokenizer.from_file(path)
+			return _EncodingTokenizer(
+				f"tokenizers:{os.path.basename(path)}",
+				lambda text: hf.encode(text, add_special_tokens=False).ids,
+				hf.decode,
+			)
+		except ImportError:
+			logger.warning("MODEL_TOKENIZER_FILE is set but the 'tokenizers' package is not installed")
+		except Exception as exc:
+			logger.warning("Could not load tokenizer %s: %s", path, exc)
+	try:
+		import tiktoken  # type: ignore[import-not-found]
+	except ImportError:
+		return Tokenizer()
+	try:
+		encoding = tiktoken.encoding_for_model(model or "")
+	except KeyError:
+		# Local models are unknown to tiktoken; the newest encoding is the closest match.
+		encoding = tiktoken.get_encoding("o200k_base")
+	return _EncodingTokenizer(
+		f"tiktoken:{encoding.name}",
+		lambda text: encoding.encode(text, disallowed_special=()),
+		encoding.decode,
+	)
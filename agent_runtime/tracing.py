@@ -0,0 +1,298 @@
+"""Sampled, bounded OpenTelemetry tracing for long-running processes.
+
+The DevUI records a span for every workflow, executor and model call, with
+the message payloads attached (`ENABLE_SENSITIVE_DATA`). `install_tracing`
+installs a tracer provider that keeps the cost of that flat:
+
+- **Sampling**: spans are held per trace until its root span ends. Then the
+  whole trace is kept with probability `TRACE_SAMPLE_RATE`, or always if any
+  of its spans failed. Dropped traces are never exported or shown.
+- **Truncation**: attribute values, which carry the prompts and answers, are
+  cut to `TRACE_MAX_ATTRIBUTE_CHARS` when they are recorded.
+- **Retention**: kept traces go to a ring buffer of the last
+  `TRACE_BUFFER_SIZE` traces, served at `/traces`. Traces pushed out of it
+  are appended to `TRACE_SPILL_FILE` (JSON lines) when set, which rotates to
+  `<file>.1` at `TRACE_SPILL_MAX_MB`. A background thread writes the file,
+  as spans mostly end on the event loop.
+- **Processors** added later (the DevUI's per-request trace collector, the
+  OTLP exporter) only receive kept traces, and are detached again when they
+  are shut down instead of accumulating for the life of the process.
+
+Unfinished traces are capped at `TRACE_MAX_PENDING` traces of at most
+`TRACE_MAX_SPANS` spans each, so memory stays bounded however long the
+process runs.
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+from collections import OrderedDict, deque
+from pathlib import Path
+from typing import Any, Optional
+
+from opentelemetry import trace
+from opentelemetry.sdk.trace import ReadableSpan, SpanLimits, SpanProcessor, SynchronousMultiSpanProcessor, TracerProvider
+from opentelemetry.trace import StatusCode
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+from .config import env_float, env_int
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+KEPT = REGISTRY.counter("traces_kept_total", "Traces retained, by reason (sampled or error)")
+DROPPED = REGISTRY.counter("traces_dropped_total", "Traces or spans discarded, by reason")
+BUFFERED = REGISTRY.gauge("trace_buffer_traces", "Traces held in the in-memory ring buffer")
+SPILLED = REGISTRY.counter("traces_spilled_total", "Traces written to the spill file")
+
+# Sampling decisions remembered for spans that end after their root span.
+_DECISIONS = 1024
+
+
+def _truncate(value: Any, limit: int) -> Any:
+	if isinstance(value, str) and limit and len(value) > limit:
+		return value[:limit] + f"... [{len(value) - limit} chars truncated]"
+	return value
+
+
+def span_record(span: ReadableSpan, limit: int = 0) -> dict[str, Any]:
+	"""Compact JSON form of a finished span."""
+	record: dict[str, Any] = {
+		"name": span.name,
+		"span_id": format(span.context.span_id, "016x"),
+		"parent_span_id": format(span.parent.span_id, "016x") if span.parent else None,
+		"start_time": span.start_time / 1e9 if span.start_time else None,
+		"duration_ms": round((span.end_time - span.start_time) / 1e6, 3) if span.end_time and span.start_time else None,
+		"status": span.status.status_code.name,
+		"attributes": {k: _truncate(v, limit) for k, v in (span.attributes or {}).items()},
+	}
+	if span.status.description:
+		record["error"] = span.status.description
+	if span.events:
+		record["events"] = [
+			{"name": e.name, "attributes": {k: _truncate(v, limit) for k, v in (e.attributes or {}).items()}}
+			for e in span.events
+		]
+	return record
+
+
+class TraceBuffer:
+	"""The last `capacity` kept traces, spilling evicted ones to a JSON-lines file.
+
+	Args:
+		capacity: Traces kept in memory (`TRACE_BUFFER_SIZE`).
+		spill_path: File that receives evicted traces (`TRACE_SPILL_FILE`), or None.
+		spill_max_bytes: Size at which the spill file is rotated to `<file>.1`.
+	"""
+
+	def __init__(self, capacity: int, spill_path: Optional[str] = None, spill_max_bytes: int = 0) -> None:
+		self.capacity = max(1, capacity)
+		self.spill_path = Path(spill_path) if spill_path else None
+		self.spill_max_bytes = spill_max_bytes
+		self._traces: deque[dict[str, Any]] = deque()
+		self._lock = threading.Lock()
+		self._spilled: "queue.Queue[dict[str, Any]]" = queue.Queue()
+		self._writer: Optional[threading.Thread] = None
+
+	def __len__(self) -> int:
+		return len(self._traces)
+
+	def add(self, record: dict[str, Any]) -> None:
+		with self._lock:
+			self._traces.append(record)
+			evicted = self._traces.popleft() if len(self._traces) > self.capacity else None
+			BUFFERED.set(len(self._traces))
+			if evicted is not None and self.spill_path is not None:
+				self._spill(evicted)
+
+	def _spill(self, record: dict[str, Any]) -> None:
+		"""Hand an evicted trace to the writer thread, starting it on first use."""
+		self._spilled.put(record)
+		if self._writer is None:
+			self._writer = threading.Thread(target=self._write_spilled, name="trace-spill", daemon=True)
+			self._writer.start()
+
+	def _write_spilled(self) -> None:
+		while True:
+			record = self._spilled.get()
+			try:
+				self._append(record)
+			finally:
+				self._spilled.task_done()
+
+	def flush(self) -> None:
+		"""Wait until every evicted trace is in the spill file."""
+		self._spilled.join()
+
+	def _append(self, record: dict[str, Any]) -> None:
+		line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+		try:
+			self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+			if self.spill_max_bytes and self.spill_path.exists() and self.spill_path.stat().st_size + len(line) > self.spill_max_bytes:
+				os.replace(self.spill_path, self.spill_path.with_name(self.spill_path.name + ".1"))
+			with open(self.spill_path, "a", encoding="utf-8") as handle:
+				handle.write(line)
+			SPILLED.inc()
+		except OSError as exc:
+			logger.warning("Could not spill trace to %s: %s", self.spill_path, exc)
+
+	def snapshot(self, limit: Optional[int] = None) -> list[dict[str, Any]]:
+		"""Kept traces, newest first."""
+		with self._lock:
+			traces = list(reversed(self._traces))
+		return traces[:limit] if limit else traces
+
+
+class SamplingSpanProcessor(SynchronousMultiSpanProcessor):
+	"""Hold spans per trace and forward whole traces that are sampled or failed.
+
+	Processors added with `add_span_processor` receive `on_start` for every
+	span but `on_end` only for spans of kept traces.
+
+	Args:
+		buffer: Where kept traces are retained.
+		rate: Fraction of traces kept (`TRACE_SAMPLE_RATE`); failed traces
+			are always kept.
+		max_pending: Unfinished traces held at once (`TRACE_MAX_PENDING`).
+		max_spans: Spans held per unfinished trace (`TRACE_MAX_SPANS`).
+		attribute_chars: Length attribute values are cut to in the buffer.
+	"""
+
+	def __init__(self, buffer: TraceBuffer, *, rate: float, max_pending: int, max_spans: int, attribute_chars: int = 0) -> None:
+		super().__init__()
+		self.buffer = buffer
+		self.rate = min(max(rate, 0.0), 1.0)
+		self.max_pending = max(1, max_pending)
+		self.max_spans = max(1, max_spans)
+		self.attribute_chars = attribute_chars
+		self._pending: OrderedDict[int, list[ReadableSpan]] = OrderedDict()
+		self._decided: OrderedDict[int, bool] = OrderedDict()
+
+	def add_span_processor(self, span_processor: SpanProcessor) -> None:
+		super().add_span_processor(span_processor)
+		shutdown = span_processor.shutdown
+
+		def detach_and_shutdown() -> None:
+			# The DevUI adds a processor per request and shuts it down afterwards.
+			self.remove_span_processor(span_processor)
+			shutdown()
+
+		span_processor.shutdown = detach_and_shutdown  # type: ignore[method-assign]
+
+	def remove_span_processor(self, span_processor: SpanProcessor) -> None:
+		with self._lock:
+			self._span_processors = tuple(p for p in self._span_processors if p is not span_processor)
+
+	def sampled(self, trace_id: int) -> bool:
+		"""Deterministic per trace, so every process agrees on the decision."""
+		return (trace_id & 0xFFFFFFFF) < self.rate * 0x100000000
+
+	def on_end(self, span: ReadableSpan) -> None:
+		trace_id = span.context.trace_id
+		with self._lock:
+			decided = self._decided.get(trace_id)
+			if decided is None:
+				spans = self._pending.get(trace_id)
+				if spans is None:
+					spans = self._pending[trace_id] = []
+					if len(self._pending) > self.max_pending:
+						self._pending.popitem(last=False)
+						DROPPED.inc(reason="pending_overflow")
+				if len(spans) < self.max_spans or span.parent is None:
+					spans.append(span)
+				else:
+					DROPPED.inc(reason="span_overflow")
+				if span.parent is not None:
+					return
+				# The root span ended: decide for the whole trace.
+				spans = self._pending.pop(trace_id, spans)
+				failed = any(s.status.status_code == StatusCode.ERROR for s in spans)
+				decided = failed or self.sampled(trace_id)
+				self._decided[trace_id] = decided
+				if len(self._decided) > _DECISIONS:
+					self._decided.popitem(last=False)
+				if not decided:
+					DROPPED.inc(reason="unsampled")
+					return
+				KEPT.inc(reason="error" if failed else "sampled")
+			elif not decided:
+				return
+			else:
+				spans = [span]
+			processors = self._span_processors
+		if span.parent is None:
+			self.buffer.add({
+				"trace_id": format(trace_id, "032x"),
+				"root": span.name,
+				"status": "ERROR" if any(s.status.status_code == StatusCode.ERROR for s in spans) else "OK",
+				"spans": [span_record(s, self.attribute_chars) for s in spans],
+			})
+		for processor in processors:
+			for kept in spans:
+				processor.on_end(kept)
+
+
+_buffer: Optional[TraceBuffer] = None
+
+
+def install_tracing() -> Optional[TracerProvider]:
+	"""Install the sampled, bounded tracer provider as the global one.
+
+	Must run before anything else sets the global tracer provider (the
+	DevUI server adopts it); returns None, changing nothing, if one is
+	already set.
+	"""
+	global _buffer
+	if isinstance(trace.get_tracer_provider(), TracerProvider):
+		logger.warning("A tracer provider is already installed; trace sampling and retention are not applied")
+		return None
+	attribute_chars = env_int("TRACE_MAX_ATTRIBUTE_CHARS", 2000)
+	_buffer = TraceBuffer(
+		env_int("TRACE_BUFFER_SIZE", 100),
+		os.environ.get("TRACE_SPILL_FILE") or None,
+		int(env_float("TRACE_SPILL_MAX_MB", 50.0) * 1024 * 1024),
+	)
+	processor = SamplingSpanProcessor(
+		_buffer,
+		rate=env_float("TRACE_SAMPLE_RATE", 1.0),
+		max_pending=env_int("TRACE_MAX_PENDING", 256),
+		max_spans=env_int("TRACE_MAX_SPANS", 512),
+		attribute_chars=attribute_chars,
+	)
+	provider = TracerProvider(
+		active_span_processor=processor,
+		span_limits=SpanLimits(max_attribute_length=attribute_chars or None),
+	)
+	trace.set_tracer_provider(provider)
+	logger.info("Tracing: sample rate %.2f (errors always), %d traces kept in memory", processor.rate, _buffer.capacity)
+	return provider
+
+
+@atexit.register
+def _flush_at_exit() -> None:
+	# The spill writer is a daemon thread: let it finish the traces evicted last.
+	if _buffer is not None:
+		_buffer.flush()
+
+
+def install_trace_endpoint(app: Any, path: str = "/traces") -> None:
+	"""Serve the kept traces at `path` on a Starlette/FastAPI app."""
+	if any(getattr(route, "path", None) == path for route in app.router.routes):
+		return
+	app.add_route(path, traces_endpoint, methods=["GET"], include_in_schema=False)
+	app.router.routes.insert(0, app.router.routes.pop())
+
+
+async def traces_endpoint(request: Request) -> JSONResponse:
+	"""The kept traces, newest first (`?limit=N`)."""
+	if _buffer is None:
+		return JSONResponse({"traces": [], "capacity": 0})
+	try:
+		limit = int(request.query_params.get("limit", "0"))
+	except ValueError:
+		limit = 0
+	return JSONResponse({"capacity": _buffer.capacity, "traces": _buffer.snapshot(limit or None)})
@@ -0,0 +1,180 @@
+"""Optional HTTP/2 transport for the agents' model clients.
+
+By default each agent's `OpenAIChatClient` talks HTTP/1.1 through the
+OpenAI SDK's own connection pool, so every concurrent streaming generation
+holds a TCP connection of its own. With `MODEL_HTTP2=true` the three agents
+share one `httpx` client that speaks HTTP/2 instead: concurrent generations
+are multiplexed as streams over a few connections to the endpoint.
+
+- Each connection carries up to `MODEL_HTTP2_MAX_STREAMS` concurrent
+  streams (at most 100, the limit of the client library; a lower limit
+  announced by the server is honoured too). More concurrent requests open
+  further connections, up to `MODEL_HTTP2_MAX_CONNECTIONS`, and then wait.
+- `http://` endpoints such as Foundry Local are spoken to with HTTP/2
+  "prior knowledge" (h2c), so the server must support it. `https://`
+  endpoints negotiate the protocol and fall back to HTTP/1.1.
+- HTTP/2 needs the optional `h2` package (`pip install "httpx[http2]"`).
+  Without it a warning is logged and the default transport is used.
+
+`python -m loadtest.http2_bench` compares both transports against the
+mock model server.
+"""
+
+import logging
+from typing import Any, AsyncIterator, Callable, Optional
+
+import httpx
+
+from .config import env_flag, env_int
+
+logger = logging.getLogger(__name__)
+
+# Timeouts of the OpenAI SDK's default client.
+_TIMEOUT = httpx.Timeout(600.0, connect=5.0)
+
+# httpcore runs at most this many streams on one HTTP/2 connection and
+# queues the rest, whatever the server allows.
+_CLIENT_STREAM_LIMIT = 100
+
+
+def max_streams() -> int:
+	return min(_CLIENT_STREAM_LIMIT, max(1, env_int("MODEL_HTTP2_MAX_STREAMS", _CLIENT_STREAM_LIMIT)))
+
+
+def max_connections() -> int:
+	return max(1, env_int("MODEL_HTTP2_MAX_CONNECTIONS", 8))
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+	"""Response body that calls `release` once it is closed."""
+
+	def __init__(self, stream: httpx.AsyncByteStream, release: Callable[[], None]) -> None:
+		self._stream = stream
+		self._release: Optional[Callable[[], None]] = release
+
+	async def __aiter__(self) -> AsyncIterator[bytes]:
+		async for chunk in self._stream:
+			yield chunk
+
+	async def aclose(self) -> None:
+		try:
+			await self._stream.aclose()
+		finally:
+			if self._release is not None:
+				self._release()
+				self._release = None
+
+
+class _Lane:
+	"""One HTTP/2 connection (a single-connection pool) and its open streams."""
+
+	def __init__(self, transport: httpx.AsyncHTTPTransport) -> None:
+		self.transport = transport
+		self.streams = 0
+
+	def release(self) -> None:
+		self.streams -= 1
+
+
+class MultiplexedTransport(httpx.AsyncBaseTransport):
+	"""HTTP/2 transport that keeps at most `max_streams` streams on each connection.
+
+	Requests go to the least busy connection. A new connection is opened
+	when every connection has `max_streams` open streams, up to
+	`max_connections`; after that the least busy one queues the request. A
+	request's stream stays open until its response body is closed, which
+	for a streamed chat completion is when the generation ends.
+	"""
+
+	def __init__(self, base_url: str, max_streams: int, max_connections: int) -> None:
+		self.base_url = base_url
+		self.max_streams = max_streams
+		self.max_connections = max_connections
+		self.lanes: list[_Lane] = []
+
+	def _open_lane(self) -> _Lane:
+		lane = _Lane(httpx.AsyncHTTPTransport(
+			http2=True,
+			# Without TLS there is no protocol negotiation: speak HTTP/2 from the start.
+			http1=not self.base_url.startswith("http://"),
+			limits=httpx.Limits(max_connections=1),
+		))
+		self.lanes.append(lane)
+		return lane
+
+	def _lane(self) -> _Lane:
+		lane = min(self.lanes, key=lambda lane: lane.streams, default=None)
+		if lane is None or (lane.streams >= self.max_streams and len(self.lanes) < self.max_connections):
+			lane = self._open_lane()
+		return lane
+
+	async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+		lane = self._lane()
+		lane.streams += 1
+		try:
+			response = await lane.transport.handle_async_request(request)
+		except BaseException:
+			lane.release()
+			raise
+		response.stream = _ReleasingStream(response.stream, lane.release)  # type: ignore[arg-type]
+		return response
+
+	async def aclose(self) -> None:
+		for lane in self.lanes:
+			await lane.transport.aclose()
+
+
+def http2_transport(
+	base_url: str, max_streams_per_connection: Optional[int] = None, connections: Optional[int] = None
+) -> Optional[MultiplexedTransport]:
+	"""HTTP/2 transport for `base_url`, or None when the `h2` package is missing."""
+	try:
+		# httpx only imports it when the first connection is opened.
+		import h2  # type: ignore[import-not-found]  # noqa: F401
+	except ImportError:
+		logger.warning('MODEL_HTTP2 needs the h2 package (pip install "httpx[http2]"); using HTTP/1.1')
+		return None
+	return MultiplexedTransport(
+		base_url,
+		max_streams_per_connection if max_streams_per_connection is not None else max_streams(),
+		connections if connections is not None else max_connections(),
+	)
+
+
+def http2_client(
+	base_url: str, max_streams_per_connection: Optional[int] = None, connections: Optional[int] = None
+) -> Optional[httpx.AsyncClient]:
+	"""New `httpx` client on the HTTP/2 transport, or None when the `h2` package is missing."""
+	transport = http2_transport(base_url, max_streams_per_connection, connections)
+	return httpx.AsyncClient(transport=transport, timeout=_TIMEOUT) if transport is not None else None
+
+
+_clients: dict[str, httpx.AsyncClient] = {}
+
+
+def model_http_client(base_url: str) -> Optional[httpx.AsyncClient]:
+	"""The process-wide HTTP/2 client for `base_url`, or None when MODEL_HTTP2 is off or unavailable."""
+	if not env_flag("MODEL_HTTP2"):
+		return None
+	client = _clients.get(base_url)
+	if client is None:
+		client = http2_client(base_url)
+		if client is None:
+			return None
+		# Shared by all agents, so their generations multiplex over one connection.
+		_clients[base_url] = client
+		logger.info(
+			"Model traffic to %s uses HTTP/2 (%d streams per connection, up to %d connections)",
+			base_url, max_streams(), max_connections(),
+		)
+	return client
+
+
+def model_async_client(base_url: str, api_key: str) -> Optional[Any]:
+	"""`AsyncOpenAI` client on the shared HTTP/2 transport, or None for the SDK default."""
+	http_client = model_http_client(base_url)
+	if http_client is None:
+		return None
+	from openai import AsyncOpenAI
+
+	return AsyncOpenAI(base_url=base_url, api_key=api_key, http_client=http_client)
@@ -8,7 +8,12 @@ import chainlit as cl
 import asyncio
 import logging
 from dotenv import load_dotenv
-from workflow import workflow
+from agent_runtime.deadline import default_budget, request_deadline
+from agent_runtime.loop_watchdog import start_loop_watchdog
+from agent_runtime.metrics import install_metrics
+from agent_runtime.profiling import profile_request
+from workflow import WorkflowRun
+from workflow.progress import finish_notes, resume_hint, start_notes, stream_workflow
 
 # Load environment variables
 load_dotenv()
@@ -18,6 +23,15 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+@cl.on_app_startup
+async def app_startup():
+    """Attach the loop-lag watchdog and expose /metrics on the Chainlit server."""
+    from chainlit.server import app
+
+    install_metrics(app)
+    start_loop_watchdog()
+
+
 @cl.on_chat_start
 async def start():
     """Initialize the chat session with workflow information."""
@@ -34,39 +48,54 @@ async def start():
 @cl.on_message
 async def main(message: cl.Message):
     """Process user messages through the multi-agent workflow."""
-    user_input = message.content
+    # Profiled when PROFILE_MODE=always, or PROFILE_MODE=header and the
+    # websocket was opened with an "X-Profile: 1" header.
+    # The response time budget (DEADLINE_INTERACTIVE_SECONDS) starts when the message arrives.
+    async with profile_request("chainlit-message", cl.context.session.environ):
+        with request_deadline(default_budget()):
+            await _handle_message(message)
+
+
+async def _handle_message(message: cl.Message):
+    user_input = message.content.strip()
     
     # Show initial processing message
     processing_msg = cl.Message(content="🔄 Processing your request through the multi-agent workflow...")
     await processing_msg.send()
     
+    run = None
     try:
-        # Execute the workflow using the run method
-        result = await workflow.run(user_input)
+        # "/resume <run id>" continues a checkpointed run; sending the same
+        # request again after a failure resumes it automatically.
+        # Finding the checkpoint or cached answer reads files: keep it off the event loop.
+        if user_input.startswith("/resume"):
+            run = await asyncio.to_thread(WorkflowRun, run_id=user_input[len("/resume"):].strip())
+        else:
+            run = await asyncio.to_thread(WorkflowRun, user_input)
+        for note in start_notes(run):
+            await cl.Message(content=note).send()
         
-        # Show agent progress
-        await cl.Message(content="📋 **Planning Agent** is analyzing your request...").send()
+        # Execute the workflow, streaming each agent as it works; each
+        # completed stage is checkpointed to disk
+        header = "## 🎯 Multi-Agent Analysis Complete\n\n"
+        streamed = await stream_workflow(run, header)
         
         # Update processing message to show completion
         processing_msg.content = "✅ Workflow completed! Here are the results:"
         await processing_msg.update()
         
-        # Display the final result from the advisor agent
-        if isinstance(result, str):
-            final_content = result
-        else:
-            final_content = str(result)
-        
-        # Send the comprehensive response
-        await cl.Message(
-            content=f"## 🎯 Multi-Agent Analysis Complete\n\n{final_content}"
-        ).send()
+        # The advisor's answer was streamed above unless it came from a saved run
+        if not streamed:
+            await cl.Message(content=f"{header}{run.final_text}").send()
+        for note in finish_notes(run):
+            await cl.Message(content=note).send()
         
     except Exception as e:
         logger.error(f"Workflow execution error: {e}")
         await cl.Message(
             content=f"❌ **Error occurred during workflow execution:**\n\n"
             f"```\n{str(e)}\n```\n\n"
+            f"{resume_hint(run)}"
             f"Please check that:\n"
             f"- FoundryLocal is running at the configured endpoint\n"
             f"- Your .env file is properly configured\n"
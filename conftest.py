@@ -0,0 +1,15 @@
+"""Shared fixtures for the offline tests."""
+
+import pytest
+
+import agent_runtime.output_stats as output_stats_module
+
+
+@pytest.fixture(autouse=True)
+def isolated_output_stats(monkeypatch, tmp_path):
+    """Keep completions of fake agents out of the real `.stats/output_tokens.json`.
+
+    Those samples would otherwise feed ADAPTIVE_MAX_TOKENS on real runs.
+    """
+    monkeypatch.setenv("MAX_TOKENS_STATS_FILE", str(tmp_path / "output_tokens.json"))
+    monkeypatch.setattr(output_stats_module, "_stats", None)
@@ -0,0 +1 @@
+"""Load-testing tools: a mock model server and a concurrent-session harness."""
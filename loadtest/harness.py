@@ -0,0 +1,533 @@
+"""Concurrent-session load generator for the DevUI, Chainlit and API entry points.
+
+Each simulated session sends one or more requests through the real entry
+point (the DevUI `/v1/responses` API, the Chainlit websocket protocol or the
+headless service's SSE endpoint) and
+records end-to-end latency, time-to-first-token and errors. Sessions start
+according to a ramp-up profile. While the test runs, two event-loop lag
+signals are sampled: the harness' own loop (to prove the generator is not
+the bottleneck) and the latency of a trivial endpoint on the target, which
+grows with the target's loop lag when handlers block it. When the target
+exposes `/metrics`, its own loop-lag watchdog figures are added at the end.
+
+With `--launch` the harness starts the mock model server and the target
+itself, pointing the agents at the mock via `FOUNDRYLOCAL_ENDPOINT`, so a
+full run needs nothing but this repository.
+
+Usage:
+	python -m loadtest --target devui --launch --sessions 20 --profile linear --ramp-up 30
+	python -m loadtest --target chainlit --url http://localhost:8001 --sessions 10
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Optional
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+
+DEFAULT_PROMPTS = (
+	"Create a plan for building a web application",
+	"Help me design a marketing strategy for a new product",
+	"Plan a machine learning project for customer segmentation",
+	"Develop a cybersecurity implementation roadmap",
+)
+
+TARGETS = {
+	"devui": {"url": "http://127.0.0.1:8093", "probe": "/health"},
+	"chainlit": {"url": "http://127.0.0.1:8001", "probe": "/auth/config"},
+	"service": {"url": "http://127.0.0.1:8095", "probe": "/health"},
+}
+
+
+@dataclass
+class RequestResult:
+	"""Outcome of one request sent by one session."""
+
+	session: int
+	started: float
+	latency: Optional[float] = None
+	ttft: Optional[float] = None
+	ui_updates: int = 0
+	serving_mode: Optional[str] = None
+	ok: bool = False
+	error: Optional[str] = None
+
+
+@dataclass
+class LoadReport:
+	target: str
+	profile: str
+	sessions: int
+	requests: int = 0
+	errors: int = 0
+	duration: float = 0.0
+	latency: dict[str, Optional[float]] = field(default_factory=dict)
+	ttft: dict[str, Optional[float]] = field(default_factory=dict)
+	ui_updates_per_s: dict[str, Optional[float]] = field(default_factory=dict)
+	harness_loop_lag_ms: dict[str, Optional[float]] = field(default_factory=dict)
+	target_probe_ms: dict[str, Optional[float]] = field(default_factory=dict)
+	target_loop_lag_ms: dict[str, Optional[float]] = field(default_factory=dict)
+	target_loop_blocked: Optional[int] = None
+	serving_modes: dict[str, int] = field(default_factory=dict)
+	error_samples: list[str] = field(default_factory=list)
+
+	@property
+	def error_rate(self) -> float:
+		return self.errors / self.requests if self.requests else 0.0
+
+
+def percentile(values: list[float], q: float) -> Optional[float]:
+	"""Nearest-rank percentile (q in 0..100) or None for no samples."""
+	if not values:
+		return None
+	ordered = sorted(values)
+	rank = max(0, min(len(ordered) - 1, math.ceil(q / 100.0 * len(ordered)) - 1))
+	return ordered[rank]
+
+
+def _summary(values: list[float], scale: float = 1.0) -> dict[str, Optional[float]]:
+	scaled = [v * scale for v in values]
+	return {
+		"p50": percentile(scaled, 50),
+		"p95": percentile(scaled, 95),
+		"p99": percentile(scaled, 99),
+		"max": max(scaled) if scaled else None,
+	}
+
+
+def start_offsets(profile: str, sessions: int, ramp_up: float, steps: int = 4) -> list[float]:
+	"""Seconds after test start at which each session begins.
+
+	constant: everyone at once. linear: evenly spread over `ramp_up`.
+	step: `steps` equal batches across `ramp_up`. spike: half the sessions
+	ramp linearly, the other half arrive together at the end of the ramp.
+	"""
+	if sessions <= 0:
+		return []
+	if profile == "constant" or ramp_up <= 0:
+		return [0.0] * sessions
+	if profile == "linear":
+		return [ramp_up * i / sessions for i in range(sessions)]
+	if profile == "step":
+		steps = max(1, min(steps, sessions))
+		return [ramp_up * (i * steps // sessions) / steps for i in range(sessions)]
+	if profile == "spike":
+		base = sessions // 2
+		return [ramp_up * i / max(base, 1) for i in range(base)] + [ramp_up] * (sessions - base)
+	raise ValueError(f"Unknown profile '{profile}'")
+
+
+class LoopLagSampler:
+	"""Measure how late `asyncio.sleep` wakes up on the current loop."""
+
+	def __init__(self, interval: float = 0.05) -> None:
+		self.interval = interval
+		self.samples: list[float] = []
+		self._task: Optional[asyncio.Task] = None
+
+	async def _run(self) -> None:
+		loop = asyncio.get_running_loop()
+		while True:
+			before = loop.time()
+			await asyncio.sleep(self.interval)
+			self.samples.append(max(0.0, loop.time() - before - self.interval))
+
+	def start(self) -> None:
+		self._task = asyncio.create_task(self._run())
+
+	async def stop(self) -> None:
+		if self._task is not None:
+			self._task.cancel()
+			try:
+				await self._task
+			except asyncio.CancelledError:
+				pass
+
+
+class TargetProbe:
+	"""Periodically time a trivial endpoint of the target server."""
+
+	def __init__(self, url: str, interval: float = 0.5) -> None:
+		self.url = url
+		self.interval = interval
+		self.samples: list[float] = []
+		self._task: Optional[asyncio.Task] = None
+
+	async def _run(self) -> None:
+		async with httpx.AsyncClient(timeout=30) as client:
+			while True:
+				started = time.perf_counter()
+				try:
+					await client.get(self.url)
+					self.samples.append(time.perf_counter() - started)
+				except httpx.HTTPError:
+					pass
+				await asyncio.sleep(self.interval)
+
+	def start(self) -> None:
+		self._task = asyncio.create_task(self._run())
+
+	async def stop(self) -> None:
+		if self._task is not None:
+			self._task.cancel()
+			try:
+				await self._task
+			except asyncio.CancelledError:
+				pass
+
+
+async def scrape_loop_lag(base_url: str) -> tuple[dict[str, Optional[float]], Optional[int]]:
+	"""Read the target's own loop-lag watchdog metrics from `/metrics`, if exposed."""
+	stats: dict[str, Optional[float]] = {}
+	blocked = None
+	try:
+		async with httpx.AsyncClient(timeout=10) as client:
+			response = await client.get(f"{base_url}/metrics")
+		if response.status_code != 200 or "event_loop_lag_seconds" not in response.text:
+			return stats, blocked
+	except httpx.HTTPError:
+		return stats, blocked
+	names = {'quantile="0.5"': "p50", 'quantile="0.95"': "p95", 'quantile="0.99"': "p99"}
+	for line in response.text.splitlines():
+		if line.startswith("#") or " " not in line:
+			continue
+		metric, value = line.rsplit(" ", 1)
+		try:
+			number = float(value)
+		except ValueError:
+			continue
+		if metric.startswith("event_loop_lag_seconds{"):
+			key = names.get(metric[len("event_loop_lag_seconds{"):-1])
+			if key:
+				stats[key] = number * 1000.0
+		elif metric == "event_loop_lag_max_seconds":
+			stats["max"] = number * 1000.0
+		elif metric == "event_loop_blocked_total":
+			blocked = int(number)
+	return stats, blocked
+
+
+async def _devui_entity(client: httpx.AsyncClient, base_url: str) -> str:
+	response = await client.get(f"{base_url}/v1/entities")
+	response.raise_for_status()
+	entities = response.json().get("entities", [])
+	workflows = [e for e in entities if e.get("type") == "workflow"] or entities
+	if not workflows:
+		raise RuntimeError("DevUI has no registered entities")
+	return workflows[0]["id"]
+
+
+async def devui_request(client: httpx.AsyncClient, base_url: str, entity_id: str, prompt: str, result: RequestResult) -> None:
+	"""Send one streaming request to the DevUI responses API."""
+	body = {"model": entity_id, "input": prompt, "stream": True}
+	async with client.stream("POST", f"{base_url}/v1/responses", json=body) as response:
+		if response.status_code != 200:
+			await response.aread()
+			raise RuntimeError(f"HTTP {response.status_code}: {response.text[:200]}")
+		async for line in response.aiter_lines():
+			if not line.startswith("data: "):
+				continue
+			data = line[6:]
+			if data == "[DONE]":
+				break
+			try:
+				event = json.loads(data)
+			except ValueError:
+				continue
+			if not isinstance(event, dict):
+				continue
+			kind = event.get("type") or event.get("object")
+			if kind == "response.output_text.delta" and result.ttft is None:
+				result.ttft = time.perf_counter() - result.started
+			elif kind == "error":
+				error = event.get("error") or event
+				raise RuntimeError(str(error.get("message") if isinstance(error, dict) else error))
+
+
+async def service_request(client: httpx.AsyncClient, base_url: str, prompt: str, result: RequestResult) -> None:
+	"""Send one streaming run to the headless API (`python -m service`)."""
+	# Sessions reuse the same prompts; every one of them must run the workflow.
+	body = {"prompt": prompt, "stream": True, "resume": False, "coalesce": False, "cache": False}
+	async with client.stream("POST", f"{base_url}/v1/workflow/runs", json=body) as response:
+		if response.status_code != 200:
+			await response.aread()
+			raise RuntimeError(f"HTTP {response.status_code}: {response.text[:200]}")
+		event = None
+		async for line in response.aiter_lines():
+			if line.startswith("event: "):
+				event = line[7:]
+			elif line.startswith("data: "):
+				if event == "delta" and result.ttft is None:
+					result.ttft = time.perf_counter() - result.started
+				elif event == "error":
+					raise RuntimeError(json.loads(line[6:]).get("error", "run failed"))
+				elif event == "completed":
+					result.serving_mode = json.loads(line[6:]).get("serving_mode")
+					return
+	raise RuntimeError("Stream ended before the run completed")
+
+
+class ChainlitSession:
+	"""Minimal Chainlit websocket client (python-socketio) for one chat session."""
+
+	def __init__(self, base_url: str) -> None:
+		try:
+			import socketio  # type: ignore
+		except ImportError as exc:  # pragma: no cover
+			raise RuntimeError("The chainlit target needs python-socketio[asyncio_client]") from exc
+		self.base_url = base_url
+		self.sio = socketio.AsyncClient(reconnection=False)
+		self._events: asyncio.Queue = asyncio.Queue()
+		for name in ("new_message", "update_message", "stream_start", "stream_token", "task_start", "task_end"):
+			self.sio.on(name, self._handler(name))
+
+	def _handler(self, name: str):
+		async def handle(data: Any = None) -> None:
+			await self._events.put((name, data, time.perf_counter()))
+		return handle
+
+	async def connect(self) -> None:
+		auth = {"sessionId": str(uuid.uuid4()), "clientType": "webapp", "userEnv": "{}", "threadId": ""}
+		await self.sio.connect(self.base_url, socketio_path="/ws/socket.io", transports=["websocket"], auth=auth)
+		await self.sio.emit("connection_successful")
+		# Wait for the welcome message so it is not mistaken for a response.
+		try:
+			while True:
+				name, _, _ = await asyncio.wait_for(self._events.get(), timeout=10)
+				if name == "new_message":
+					break
+		except asyncio.TimeoutError:
+			pass
+
+	async def request(self, prompt: str, result: RequestResult, timeout: float) -> None:
+		message = {
+			"id": str(uuid.uuid4()),
+			"threadId": "",
+			"name": "User",
+			"type": "user_message",
+			"output": prompt,
+			"createdAt": datetime.now(timezone.utc).isoformat(),
+		}
+		await self.sio.emit("client_message", {"message": message, "fileReferences": None})
+		started = False
+		deadline = result.started + timeout
+		while True:
+			remaining = deadline - time.perf_counter()
+			if remaining <= 0:
+				raise asyncio.TimeoutError()
+			name, data, at = await asyncio.wait_for(self._events.get(), timeout=remaining)
+			if name == "task_start":
+				started = True
+			elif name in ("stream_start", "stream_token"):
+				# The first streamed token arrives with `stream_start`.
+				result.ui_updates += 1
+				if result.ttft is None:
+					result.ttft = at - result.started
+			elif name == "new_message" and isinstance(data, dict) and str(data.get("output", "")).startswith("❌"):
+				raise RuntimeError(str(data.get("output"))[:200])
+			elif name == "task_end" and started:
+				return
+
+	async def close(self) -> None:
+		await self.sio.disconnect()
+
+
+async def run_session(
+	index: int,
+	delay: float,
+	args: argparse.Namespace,
+	results: list[RequestResult],
+	entity_id: Optional[str],
+) -> None:
+	await asyncio.sleep(delay)
+	prompts = args.prompt or list(DEFAULT_PROMPTS)
+	chainlit = None
+	async with httpx.AsyncClient(timeout=httpx.Timeout(args.timeout, connect=10)) as client:
+		try:
+			for n in range(args.requests_per_session):
+				prompt = prompts[(index + n) % len(prompts)]
+				result = RequestResult(session=index, started=time.perf_counter())
+				results.append(result)
+				try:
+					if args.target == "devui":
+						await asyncio.wait_for(devui_request(client, args.url, entity_id or "", prompt, result), args.timeout)
+					elif args.target == "service":
+						await asyncio.wait_for(service_request(client, args.url, prompt, result), args.timeout)
+					else:
+						if chainlit is None:
+							chainlit = ChainlitSession(args.url)
+							await chainlit.connect()
+							result.started = time.perf_counter()
+						await chainlit.request(prompt, result, args.timeout)
+					result.ok = True
+				except Exception as exc:
+					result.error = f"{type(exc).__name__}: {exc}"[:300]
+				finally:
+					result.latency = time.perf_counter() - result.started
+				if args.think_time and n + 1 < args.requests_per_session:
+					await asyncio.sleep(args.think_time)
+		finally:
+			if chainlit is not None:
+				await chainlit.close()
+
+
+async def run_load(args: argparse.Namespace) -> LoadReport:
+	"""Run the configured load and return the aggregated report."""
+	entity_id = None
+	if args.target == "devui":
+		async with httpx.AsyncClient(timeout=30) as client:
+			entity_id = args.entity or await _devui_entity(client, args.url)
+
+	results: list[RequestResult] = []
+	lag = LoopLagSampler()
+	probe = TargetProbe(args.url + TARGETS[args.target]["probe"])
+	lag.start()
+	probe.start()
+	started = time.perf_counter()
+	offsets = start_offsets(args.profile, args.sessions, args.ramp_up, args.steps)
+	try:
+		await asyncio.gather(*(run_session(i, d, args, results, entity_id) for i, d in enumerate(offsets)))
+	finally:
+		await lag.stop()
+		await probe.stop()
+
+	report = LoadReport(target=args.target, profile=args.profile, sessions=args.sessions)
+	report.duration = time.perf_counter() - started
+	report.requests = len(results)
+	report.errors = sum(1 for r in results if not r.ok)
+	report.latency = _summary([r.latency for r in results if r.ok and r.latency is not None])
+	report.ttft = _summary([r.ttft for r in results if r.ok and r.ttft is not None])
+	report.ui_updates_per_s = _summary([r.ui_updates / r.latency for r in results if r.ok and r.ui_updates and r.latency])
+	for r in results:
+		if r.ok and r.serving_mode:
+			report.serving_modes[r.serving_mode] = report.serving_modes.get(r.serving_mode, 0) + 1
+	report.harness_loop_lag_ms = _summary(lag.samples, 1000.0)
+	report.target_probe_ms = _summary(probe.samples, 1000.0)
+	report.target_loop_lag_ms, report.target_loop_blocked = await scrape_loop_lag(args.url)
+	report.error_samples = sorted({r.error for r in results if r.error})[:5]
+	return report
+
+
+def _fmt(stats: dict[str, Optional[float]], unit: str) -> str:
+	def one(key: str) -> str:
+		value = stats.get(key)
+		return f"{key}={value:.2f}{unit}" if value is not None else f"{key}=n/a"
+	return "  ".join(one(k) for k in ("p50", "p95", "p99", "max"))
+
+
+def print_report(report: LoadReport) -> None:
+	print("=" * 70)
+	print(f"Load test: target={report.target} profile={report.profile} sessions={report.sessions}")
+	print("=" * 70)
+	print(f"Requests:            {report.requests} in {report.duration:.1f}s "
+		f"({report.requests / report.duration if report.duration else 0:.2f} req/s)")
+	print(f"Error rate:          {report.error_rate:.1%} ({report.errors} errors)")
+	print(f"End-to-end latency:  {_fmt(report.latency, 's')}")
+	print(f"Time to first token: {_fmt(report.ttft, 's')}")
+	if report.ui_updates_per_s.get("max") is not None:
+		print(f"UI updates/session:  {_fmt(report.ui_updates_per_s, '/s')}")
+	if set(report.serving_modes) - {"full"}:
+		print("Serving modes:       " + "  ".join(f"{mode}={count}" for mode, count in sorted(report.serving_modes.items())))
+	print(f"Target probe:        {_fmt(report.target_probe_ms, 'ms')}")
+	if report.target_loop_lag_ms:
+		print(f"Target loop lag:     {_fmt(report.target_loop_lag_ms, 'ms')}  blocked={report.target_loop_blocked}")
+	print(f"Harness loop lag:    {_fmt(report.harness_loop_lag_ms, 'ms')}")
+	for sample in report.error_samples:
+		print(f"  error: {sample}")
+
+
+def _wait_ready(url: str, timeout: float = 60.0) -> None:
+	deadline = time.time() + timeout
+	while time.time() < deadline:
+		try:
+			if httpx.get(url, timeout=2).status_code < 500:
+				return
+		except httpx.HTTPError:
+			pass
+		time.sleep(0.5)
+	raise RuntimeError(f"Timed out waiting for {url}")
+
+
+def launch(args: argparse.Namespace) -> list[subprocess.Popen]:
+	"""Start the mock model server and the target entry point."""
+	mock_url = f"http://127.0.0.1:{args.mock_port}"
+	processes = [subprocess.Popen(
+		[sys.executable, "-m", "loadtest.mock_server", "--port", str(args.mock_port),
+			"--ttft", str(args.mock_ttft), "--tps", str(args.mock_tps), "--tokens", str(args.mock_tokens),
+			"--max-concurrency", str(args.mock_concurrency)],
+		cwd=ROOT,
+	)]
+	_wait_ready(mock_url + "/v1/models")
+
+	env = dict(os.environ)
+	env["FOUNDRYLOCAL_ENDPOINT"] = mock_url + "/v1/"
+	env["FOUNDRYLOCAL_MODEL_DEPLOYMENT_NAME"] = "mock-model"
+	# Sessions send the same prompts; unless asked for, do not let them share runs
+	# or answer from the response cache.
+	env.setdefault("WORKFLOW_SINGLE_FLIGHT", "false")
+	env.setdefault("RESPONSE_CACHE", "off")
+	if args.target == "devui":
+		command = [sys.executable, "main.py"]
+	elif args.target == "service":
+		port = httpx.URL(args.url).port or 8095
+		command = [sys.executable, "-m", "service", "--port", str(port), "--workers", str(args.service_workers)]
+	else:
+		port = httpx.URL(args.url).port or 8001
+		command = [sys.executable, "-m", "chainlit", "run", "chainlit_app_simple.py", "--headless", "--port", str(port)]
+	processes.append(subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+	_wait_ready(args.url + TARGETS[args.target]["probe"])
+	return processes
+
+
+def build_parser() -> argparse.ArgumentParser:
+	parser = argparse.ArgumentParser(prog="python -m loadtest", description=__doc__.split("\n\n")[0])
+	parser.add_argument("--target", choices=sorted(TARGETS), default="devui")
+	parser.add_argument("--url", help="Base URL of the target (defaults per target)")
+	parser.add_argument("--entity", help="DevUI entity id (default: first registered workflow)")
+	parser.add_argument("--sessions", type=int, default=10, help="Concurrent simulated users")
+	parser.add_argument("--requests-per-session", type=int, default=1)
+	parser.add_argument("--profile", choices=("constant", "linear", "step", "spike"), default="linear")
+	parser.add_argument("--ramp-up", type=float, default=10.0, help="Seconds over which sessions start")
+	parser.add_argument("--steps", type=int, default=4, help="Batches for the step profile")
+	parser.add_argument("--think-time", type=float, default=0.0, help="Pause between requests of a session")
+	parser.add_argument("--timeout", type=float, default=600.0, help="Per-request timeout in seconds")
+	parser.add_argument("--prompt", action="append", help="Prompt to send (repeatable)")
+	parser.add_argument("--json", help="Also write the report to this JSON file")
+	parser.add_argument("--launch", action="store_true", help="Start the mock model server and the target")
+	parser.add_argument("--service-workers", type=int, default=1, help="Worker processes when launching the service target")
+	parser.add_argument("--mock-port", type=int, default=58200)
+	parser.add_argument("--mock-ttft", type=float, default=0.3)
+	parser.add_argument("--mock-tps", type=float, default=40.0)
+	parser.add_argument("--mock-tokens", type=int, default=400)
+	parser.add_argument("--mock-concurrency", type=int, default=1, help="Concurrent generations the mock allows")
+	return parser
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+	args = build_parser().parse_args(argv)
+	args.url = (args.url or TARGETS[args.target]["url"]).rstrip("/")
+	processes = launch(args) if args.launch else []
+	try:
+		report = asyncio.run(run_load(args))
+	finally:
+		for process in reversed(processes):
+			process.terminate()
+			try:
+				process.wait(timeout=10)
+			except subprocess.TimeoutExpired:
+				process.kill()
+	print_report(report)
+	if args.json:
+		Path(args.json).write_text(json.dumps(asdict(report) | {"error_rate": report.error_rate}, indent=2))
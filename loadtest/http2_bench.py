@@ -0,0 +1,198 @@
+"""HTTP/1.1 versus HTTP/2 benchmark of the model clients.
+
+Starts the mock model server under hypercorn (which speaks both protocols)
+and sends the same batch of concurrent streaming chat completions once per
+transport: the OpenAI SDK's default HTTP/1.1 client the agents use by
+default, and the shared HTTP/2 client of `MODEL_HTTP2=true` (see
+`agent_runtime.transport`). Each transport runs in a fresh client process so
+their memory does not mix. The report compares:
+
+- connections: client connections the mock server saw requests arrive on;
+- peak RSS and CPU time of the client process;
+- time to first token and end-to-end latency per request.
+
+Needs the optional `h2` and `hypercorn` packages:
+
+	pip install "httpx[http2]" hypercorn
+	python -m loadtest.http2_bench --concurrency 200 --requests 400
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+import httpx
+
+from .harness import ROOT, _fmt, _summary, _wait_ready
+
+PROTOCOLS = ("http1", "http2")
+
+_SYSTEM = "You are a strategic planning agent."
+
+
+def _peak_rss_mb() -> Optional[float]:
+	try:
+		import resource
+	except ImportError:  # Windows
+		return None
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	# Kilobytes on Linux, bytes on macOS.
+	return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _client(protocol: str, base_url: str, max_streams: int, max_connections: int) -> Any:
+	from openai import AsyncOpenAI
+
+	from agent_runtime.transport import http2_client
+
+	if protocol == "http1":
+		return AsyncOpenAI(base_url=base_url, api_key="nokey")
+	http_client = http2_client(base_url, max_streams, max_connections)
+	if http_client is None:
+		raise SystemExit('The HTTP/2 benchmark needs the h2 package (pip install "httpx[http2]").')
+	return AsyncOpenAI(base_url=base_url, api_key="nokey", http_client=http_client)
+
+
+async def measure(
+	protocol: str, base_url: str, concurrency: int, requests: int, max_streams: int = 100, max_connections: int = 8
+) -> dict[str, Any]:
+	"""Send `requests` streaming completions, `concurrency` at a time, and time them."""
+	client = _client(protocol, base_url, max_streams, max_connections)
+	gate = asyncio.Semaphore(concurrency)
+	ttft: list[float] = []
+	latency: list[float] = []
+	errors: list[str] = []
+
+	async def one(n: int) -> None:
+		async with gate:
+			started = time.perf_counter()
+			first: Optional[float] = None
+			try:
+				stream = await client.chat.completions.create(
+					model="mock-model",
+					messages=[{"role": "system", "content": _SYSTEM}, {"role": "user", "content": f"Plan project {n}"}],
+					stream=True,
+				)
+				async for chunk in stream:
+					if first is None and chunk.choices and chunk.choices[0].delta.content:
+						first = time.perf_counter()
+			except Exception as exc:
+				errors.append(f"{type(exc).__name__}: {exc}")
+				return
+			if first is not None:
+				ttft.append(first - started)
+			latency.append(time.perf_counter() - started)
+
+	cpu = time.process_time()
+	wall = time.perf_counter()
+	await asyncio.gather(*(one(n) for n in range(requests)))
+	wall = time.perf_counter() - wall
+	await client.close()
+	return {
+		"protocol": protocol,
+		"requests": requests,
+		"errors": len(errors),
+		"error_samples": errors[:3],
+		"wall_s": wall,
+		"cpu_s": time.process_time() - cpu,
+		"peak_rss_mb": _peak_rss_mb(),
+		"ttft_s": _summary(ttft),
+		"latency_s": _summary(latency),
+	}
+
+
+def _mock_stats(url: str) -> dict[str, Any]:
+	return httpx.get(url + "/mock/stats", timeout=10).json()
+
+
+def run_protocol(args: argparse.Namespace, protocol: str) -> dict[str, Any]:
+	"""Benchmark one transport in a fresh client process."""
+	before = _mock_stats(args.url)
+	worker = subprocess.run(
+		[sys.executable, "-m", "loadtest.http2_bench", "--worker", protocol, "--url", args.url,
+			"--concurrency", str(args.concurrency), "--requests", str(args.requests), "--max-streams", str(args.max_streams),
+			"--max-connections", str(args.max_connections)],
+		cwd=ROOT, capture_output=True, text=True,
+	)
+	if worker.returncode != 0:
+		raise SystemExit(f"The {protocol} benchmark failed:\n{worker.stderr}")
+	result = json.loads(worker.stdout.strip().splitlines()[-1])
+	result["connections"] = _mock_stats(args.url)["connections"] - before["connections"]
+	return result
+
+
+def print_report(results: list[dict[str, Any]], args: argparse.Namespace) -> None:
+	print("=" * 70)
+	print(f"HTTP transport benchmark: {args.requests} streaming requests, {args.concurrency} concurrent")
+	for result in results:
+		rss = result["peak_rss_mb"]
+		print("-" * 70)
+		print(f"{result['protocol']}:")
+		print(f"  Connections:   {result['connections']}")
+		print(f"  Peak RSS:      {f'{rss:.1f} MB' if rss is not None else 'n/a'}")
+		print(f"  CPU time:      {result['cpu_s']:.2f}s  (wall {result['wall_s']:.2f}s)")
+		print(f"  TTFT:          {_fmt(result['ttft_s'], 's')}")
+		print(f"  Latency:       {_fmt(result['latency_s'], 's')}")
+		print(f"  Errors:        {result['errors']}")
+		for sample in result["error_samples"]:
+			print(f"    error: {sample}")
+
+
+def build_parser() -> argparse.ArgumentParser:
+	parser = argparse.ArgumentParser(prog="python -m loadtest.http2_bench", description=__doc__.split("\n\n")[0])
+	parser.add_argument("--concurrency", type=int, default=200, help="Requests in flight at once")
+	parser.add_argument("--requests", type=int, help="Requests per transport (default: 2 x concurrency)")
+	parser.add_argument("--protocol", action="append", choices=PROTOCOLS, help="Transport to run (repeatable; default: both)")
+	parser.add_argument("--max-streams", type=int, default=100, help="HTTP/2 streams per connection (MODEL_HTTP2_MAX_STREAMS)")
+	parser.add_argument("--max-connections", type=int, default=8, help="HTTP/2 connections (MODEL_HTTP2_MAX_CONNECTIONS)")
+	parser.add_argument("--url", help="Base URL of a running mock server (HTTP/2 needs --server hypercorn) instead of starting one")
+	parser.add_argument("--json", help="Also write the results to this JSON file")
+	parser.add_argument("--mock-port", type=int, default=58210)
+	parser.add_argument("--mock-ttft", type=float, default=0.3)
+	parser.add_argument("--mock-tps", type=float, default=100.0)
+	parser.add_argument("--mock-tokens", type=int, default=200)
+	parser.add_argument("--worker", choices=PROTOCOLS, help=argparse.SUPPRESS)
+	return parser
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+	args = build_parser().parse_args(argv)
+	args.requests = args.requests or 2 * args.concurrency
+	if args.worker:
+		result = asyncio.run(measure(args.worker, args.url + "/v1/", args.concurrency, args.requests, args.max_streams, args.max_connections))
+		print(json.dumps(result))
+		return
+
+	process = None
+	if args.url:
+		args.url = args.url.rstrip("/")
+	else:
+		args.url = f"http://127.0.0.1:{args.mock_port}"
+		process = subprocess.Popen(
+			[sys.executable, "-m", "loadtest.mock_server", "--server", "hypercorn", "--port", str(args.mock_port),
+				"--ttft", str(args.mock_ttft), "--tps", str(args.mock_tps), "--tokens", str(args.mock_tokens)],
+			cwd=ROOT, env=dict(os.environ),
+		)
+	try:
+		_wait_ready(args.url + "/v1/models")
+		results = [run_protocol(args, protocol) for protocol in args.protocol or PROTOCOLS]
+	finally:
+		if process is not None:
+			process.terminate()
+			try:
+				process.wait(timeout=10)
+			except subprocess.TimeoutExpired:
+				process.kill()
+	print_report(results, args)
+	if args.json:
+		Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":  # pragma: no cover
+	main()
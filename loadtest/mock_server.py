@@ -0,0 +1,237 @@
+"""OpenAI-compatible mock of the Foundry Local chat completions endpoint.
+
+Serves `/v1/models` and `/v1/chat/completions` (streaming and non-streaming)
+with configurable time-to-first-token, tokens per second and output length,
+so the entry points can be load tested without a real model. Answers follow
+the output skeleton of whichever agent sent the request (detected from its
+system prompt), which keeps section-aware features such as early stopping
+realistic; prompts asking for a JSON object (structured handoff) get one.
+`--max-concurrency` models a single accelerator that can only
+decode a limited number of requests at a time. `/mock/stats` also counts
+the client connections requests arrived on. Served with
+`--server hypercorn` (optional package) the mock also speaks HTTP/2,
+including cleartext HTTP/2 with prior knowledge.
+
+Usage:
+	python -m loadtest.mock_server --port 58200 --ttft 0.3 --tps 40 --tokens 400
+	python -m loadtest.mock_server --server hypercorn
+"""
+
+import argparse
+import asyncio
+import json
+import re
+import time
+import uuid
+from typing import Any, Optional
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+MOCK_MODEL_ID = "mock-model"
+
+_SKELETONS = {
+	"strategic planning agent": [
+		"### 📋 PLAN OVERVIEW", "### 🎯 KEY OBJECTIVES", "### 📅 STRUCTURED APPROACH",
+		"### 🔍 RESEARCH PRIORITIES", "### ⚡ NEXT STEPS",
+	],
+	"research agent": [
+		"### 🔍 RESEARCH SUMMARY", "### 📊 DETAILED FINDINGS", "### 💡 ADDITIONAL INSIGHTS",
+		"### 📚 RESOURCES & REFERENCES", "### ✅ VALIDATION & RECOMMENDATIONS",
+	],
+	"senior advisor": [
+		"### 🎯 EXECUTIVE SUMMARY", "### 📊 KEY FINDINGS & ANALYSIS", "### 🔥 PRIORITY RECOMMENDATIONS",
+		"### ⚠️ RISK ASSESSMENT & MITIGATION", "### 📈 SUCCESS METRICS & MONITORING",
+		"### 💡 NEXT STEPS CHECKLIST", "### 💡 ADDITIONAL CONSIDERATIONS",
+	],
+}
+_FILLER = (
+	"- Define the scope, owners and a measurable success criterion for this item before work starts.",
+	"- Validate the assumption with a small experiment and record the outcome for the next review.",
+	"- Keep the deliverable small enough to finish within one week and demo it to stakeholders.",
+)
+
+
+def _system_prompt(messages: list[dict[str, Any]]) -> str:
+	for message in messages:
+		if message.get("role") in ("system", "developer"):
+			content = message.get("content")
+			if isinstance(content, list):
+				return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+			return str(content or "")
+	return ""
+
+
+def _json_answer(system: str, tokens: int) -> list[str]:
+	"""Fill every key of the JSON template in a compact-handoff prompt."""
+	template = next((line for line in system.splitlines() if line.strip().startswith('{"')), "")
+	keys = list(dict.fromkeys(re.findall(r'"(\w+)":', template))) or ["answer"]
+	per_key = max(1, tokens // (len(keys) * 12))
+	answer = {key: [_FILLER[i % len(_FILLER)][2:] for i in range(per_key)] for key in keys}
+	return [w + " " for w in json.dumps(answer).split(" ")]
+
+
+def build_answer(messages: list[dict[str, Any]], tokens: int) -> list[str]:
+	"""Return the answer as a list of whitespace-delimited tokens."""
+	system = _system_prompt(messages)
+	if "json object" in system.lower():
+		return _json_answer(system, tokens)
+	system = system.lower()
+	headings = next((h for key, h in _SKELETONS.items() if key in system), ["### RESPONSE"])
+	per_section = max(1, tokens // len(headings))
+	words: list[str] = []
+	for heading in headings:
+		section = [f"\n\n{heading}\n"]
+		i = 0
+		while len(section) < per_section:
+			section.extend(w + " " for w in _FILLER[i % len(_FILLER)].split(" "))
+			section.append("\n")
+			i += 1
+		words.extend(section[:per_section])
+	return words
+
+
+class MockModel:
+	"""Timing model shared by all requests served by one mock server."""
+
+	def __init__(self, ttft: float, tokens_per_second: float, output_tokens: int, max_concurrency: int) -> None:
+		self.ttft = ttft
+		self.tokens_per_second = tokens_per_second
+		self.output_tokens = output_tokens
+		self.slots = asyncio.Semaphore(max_concurrency) if max_concurrency > 0 else None
+		self.active = 0
+		self.served = 0
+		# (host, port) of every client connection a request arrived on
+		self.peers: set[tuple[str, int]] = set()
+
+	def _limit(self, body: dict[str, Any]) -> Optional[int]:
+		return body.get("max_completion_tokens") or body.get("max_tokens")
+
+	async def generate(self, body: dict[str, Any]):
+		"""Yield (token, finish_reason) pairs with the configured pacing."""
+		words = build_answer(body.get("messages") or [], self.output_tokens)
+		limit = self._limit(body)
+		finish = "stop"
+		if limit is not None and len(words) > limit:
+			words, finish = words[:limit], "length"
+		if self.slots is not None:
+			await self.slots.acquire()
+		self.active += 1
+		try:
+			await asyncio.sleep(self.ttft)
+			delay = 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+			for index, word in enumerate(words):
+				if index and delay:
+					await asyncio.sleep(delay)
+				yield word, (finish if index == len(words) - 1 else None)
+		finally:
+			self.active -= 1
+			self.served += 1
+			if self.slots is not None:
+				self.slots.release()
+
+
+def create_app(
+	*, ttft: float = 0.3, tokens_per_second: float = 40.0, output_tokens: int = 400, max_concurrency: int = 0
+) -> Starlette:
+	"""Build the mock server application."""
+	model = MockModel(ttft, tokens_per_second, output_tokens, max_concurrency)
+
+	async def models(_: Request) -> JSONResponse:
+		return JSONResponse({"object": "list", "data": [{"id": MOCK_MODEL_ID, "object": "model", "owned_by": "mock"}]})
+
+	async def stats(_: Request) -> JSONResponse:
+		return JSONResponse({"active": model.active, "served": model.served, "connections": len(model.peers)})
+
+	async def chat_completions(request: Request):
+		if request.client is not None:
+			model.peers.add((request.client.host, request.client.port))
+		body = await request.json()
+		completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+		created = int(time.time())
+		model_id = body.get("model") or MOCK_MODEL_ID
+		prompt_tokens = sum(len(str(m.get("content") or "").split()) for m in body.get("messages") or [])
+
+		if not body.get("stream"):
+			text, finish, count = "", "stop", 0
+			async for word, reason in model.generate(body):
+				text += word
+				count += 1
+				finish = reason or finish
+			return JSONResponse({
+				"id": completion_id,
+				"object": "chat.completion",
+				"created": created,
+				"model": model_id,
+				"choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": finish}],
+				"usage": {"prompt_tokens": prompt_tokens, "completion_tokens": count, "total_tokens": prompt_tokens + count},
+			})
+
+		include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+
+		async def events():
+			def chunk(delta: Optional[dict[str, Any]], finish: Optional[str] = None, usage: Any = None) -> str:
+				choices = [] if delta is None else [{"index": 0, "delta": delta, "finish_reason": finish}]
+				payload = {
+					"id": completion_id, "object": "chat.completion.chunk", "created": created,
+					"model": model_id, "choices": choices,
+				}
+				if usage is not None:
+					payload["usage"] = usage
+				return f"data: {json.dumps(payload)}\n\n"
+
+			count = 0
+			first = True
+			async for word, finish in model.generate(body):
+				delta = {"role": "assistant", "content": word} if first else {"content": word}
+				first = False
+				count += 1
+				yield chunk(delta, finish)
+			if include_usage:
+				yield chunk(None, usage={"prompt_tokens": prompt_tokens, "completion_tokens": count, "total_tokens": prompt_tokens + count})
+			yield "data: [DONE]\n\n"
+
+		return StreamingResponse(events(), media_type="text/event-stream")
+
+	return Starlette(routes=[
+		Route("/v1/models", models),
+		Route("/v1/chat/completions", chat_completions, methods=["POST"]),
+		Route("/mock/stats", stats),
+	])
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+	parser = argparse.ArgumentParser(description="OpenAI-compatible mock model server for load tests")
+	parser.add_argument("--host", default="127.0.0.1")
+	parser.add_argument("--port", type=int, default=58200)
+	parser.add_argument("--ttft", type=float, default=0.3, help="Seconds before the first token")
+	parser.add_argument("--tps", type=float, default=40.0, help="Tokens per second per request")
+	parser.add_argument("--tokens", type=int, default=400, help="Output tokens per answer")
+	parser.add_argument("--max-concurrency", type=int, default=0, help="Concurrent generations (0 = unlimited)")
+	parser.add_argument("--server", choices=("uvicorn", "hypercorn"), default="uvicorn", help="hypercorn adds HTTP/2")
+	args = parser.parse_args(argv)
+
+	app = create_app(ttft=args.ttft, tokens_per_second=args.tps, output_tokens=args.tokens, max_concurrency=args.max_concurrency)
+	if args.server == "hypercorn":
+		try:
+			from hypercorn.asyncio import serve
+			from hypercorn.config import Config
+		except ImportError:
+			raise SystemExit("--server hypercorn needs the hypercorn package (pip install hypercorn).")
+		config = Config()
+		config.bind = [f"{args.host}:{args.port}"]
+		config.loglevel = "WARNING"
+		# Room for every stream of a high-concurrency benchmark on one connection.
+		config.h2_max_concurrent_streams = 1000
+		asyncio.run(serve(app, config))
+		return
+
+	import uvicorn
+
+	uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":  # pragma: no cover
+	main()
@@ -4,16 +4,59 @@ This mirrors the structure of `multi_workflow_ghmodel_devui/main.py` but
 uses the locally defined planning + research workflow found in
 `workflow/workflow.py`.
 """
-from agent_framework.devui import serve
+from agent_framework.devui import DevServer
 from dotenv import load_dotenv
+from agent_runtime.config import env_flag
+from agent_runtime.loop_watchdog import start_loop_watchdog
+from agent_runtime.metrics import install_metrics
+from agent_runtime.profiling import install_profiling
+from agent_runtime.tracing import install_trace_endpoint, install_tracing
 from workflow import workflow 
+import asyncio
 import logging
+import os
+import threading
+import webbrowser
 
 # Load .env early so that any provider specific environment variables are present
 load_dotenv()
  # noqa: E402  (import after dotenv)
 
 
+HOST = "127.0.0.1"
+PORT = 8093
+
+
+def create_app():
+	"""Build the DevUI FastAPI app with the workflow registered.
+
+	Equivalent to what `agent_framework.devui.serve` builds, plus the
+	`/metrics` endpoint, on-demand profiling (see `PROFILE_MODE`) and, with
+	`ENABLE_OTEL`, sampled tracing with bounded retention served at `/traces`
+	(see `agent_runtime.tracing`).
+	"""
+	tracing = env_flag("ENABLE_OTEL")
+	if tracing:
+		# Before the DevUI server, which adopts an existing tracer provider.
+		install_tracing()
+	server = DevServer(port=PORT, host=HOST)
+	server.register_entities([workflow])
+	app = server.get_app()
+	install_metrics(app)
+	install_profiling(app)
+	if tracing:
+		install_trace_endpoint(app)
+	return app
+
+
+async def _serve(app) -> None:
+	"""Run uvicorn on the current loop with the loop-lag watchdog attached."""
+	import uvicorn
+
+	start_loop_watchdog()
+	await uvicorn.Server(uvicorn.Config(app, host=HOST, port=PORT, log_level="info")).serve()
+
+
 def main() -> None:
 	"""Launch the planning/research workflow in the DevUI."""
 	
@@ -31,8 +74,17 @@ def main() -> None:
 	logger.info("• Try scrolling with mouse wheel or arrow keys in the response area")
 	logger.info("")
 
-	# Serve the composed workflow with tracing enabled for full output visibility
-	serve(entities=[workflow], port=8093, auto_open=True, tracing_enabled=True)
+	# Serve the composed workflow with tracing enabled for full output visibility;
+	# TRACE_SAMPLE_RATE and TRACE_BUFFER_SIZE bound what is kept
+	os.environ.setdefault("ENABLE_OTEL", "true")
+	os.environ.setdefault("ENABLE_SENSITIVE_DATA", "true")
+	os.environ.setdefault("OTLP_ENDPOINT", "http://localhost:4317")
+
+	app = create_app()
+	opener = threading.Timer(2.0, webbrowser.open, args=(f"http://{HOST}:{PORT}",))
+	opener.daemon = True
+	opener.start()
+	asyncio.run(_serve(app))
 
 
 if __name__ == "__main__":  # pragma: no cover
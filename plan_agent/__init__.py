@@ -1,3 +1,3 @@
-from .agent import plan_agent
+from .agent import plan_agent, plan_agent_compact, input_condenser, PLAN_AGENT_SECTIONS, PLAN_AGENT_HANDOFF_FIELDS
 
-__all__ = ["plan_agent"]
\ No newline at end of file
+__all__ = ["plan_agent", "plan_agent_compact", "input_condenser", "PLAN_AGENT_SECTIONS", "PLAN_AGENT_HANDOFF_FIELDS"]
\ No newline at end of file
@@ -8,6 +8,9 @@ research agent can expand.
 import os
 from dotenv import load_dotenv
 
+from agent_runtime.cassette import cassette_client
+from agent_runtime.transport import model_async_client
+
 load_dotenv()
 
 try:
@@ -58,12 +61,64 @@ Immediate actions to begin implementation
 IMPORTANT: Always complete your response fully. Do not repeat information unnecessarily. Focus on delivering a complete, actionable plan in a single response.
 """
 
+# Ordered headings of the response skeleton above; the last one closes the answer.
+PLAN_AGENT_SECTIONS = (
+	"PLAN OVERVIEW",
+	"KEY OBJECTIVES",
+	"STRUCTURED APPROACH",
+	"RESEARCH PRIORITIES",
+	"NEXT STEPS",
+)
+
+# Structured handoff mode (STRUCTURED_HANDOFF=true): same role, but the plan is
+# returned as compact JSON for the research agent instead of decorated markdown.
+PLAN_AGENT_COMPACT_INSTRUCTIONS = """
+You are a strategic planning agent. Analyze the user's request and produce a structured plan that a research agent will expand.
+
+Respond with ONE JSON object and nothing else (no markdown, no code fences, no commentary):
+{"overview":"<1-2 sentences>","objectives":["<objective>",...],"phases":{"<phase name>":["<specific action>",...],...},"research_priorities":["<area to investigate>",...],"next_steps":["<immediate action>",...]}
+
+Use short, specific phrases. Include timeframes and deliverables where they matter. Do not repeat information.
+"""
+
+# JSON fields of the compact plan, in the order of PLAN_AGENT_SECTIONS.
+PLAN_AGENT_HANDOFF_FIELDS = (
+	"overview",
+	"objectives",
+	"phases",
+	"research_priorities",
+	"next_steps",
+)
+
+# Writes the summaries that condense a very long request before the planner
+# reads it (INPUT_CONDENSE_THRESHOLD_TOKENS); see agent_runtime.condense.
+INPUT_CONDENSER_NAME = "Input-Condenser"
+INPUT_CONDENSER_INSTRUCTIONS = """
+You condense long user requests (pasted specifications, documents and notes) so that a planning agent can work from a short brief instead of the full text.
+
+You are given either an excerpt of the request or numbered summaries of its consecutive parts. Reply with a compact brief of that text only:
+- Keep what the user asks for, in their own words where possible, and any instructions addressed to the assistant.
+- Keep every requirement, constraint, deadline, number, name and open question.
+- Drop repetition, boilerplate, examples that add nothing and formatting.
+- Do not answer the request, plan, add information or comment on the text.
+
+Use short plain sentences or bullet points and nothing else.
+"""
+
 def _build_client() -> OpenAIChatClient:
 	base_url = os.environ.get("FOUNDRYLOCAL_ENDPOINT")
 	model_id = os.environ.get("FOUNDRYLOCAL_MODEL_DEPLOYMENT_NAME") 
 	api_key = "nokey"
+	# MODEL_CASSETTE_MODE=record|replay routes the traffic through a cassette file.
+	async_client = cassette_client("plan_agent", base_url, api_key)
+	if async_client is not None:
+		return OpenAIChatClient(model_id=model_id or "cassette-model", async_client=async_client)
 	if not base_url:
 		raise RuntimeError("No model endpoint configured. Set FOUNDRYLOCAL_ENDPOINT or GITHUB_ENDPOINT.")
+	# MODEL_HTTP2=true multiplexes all agents' generations over one HTTP/2 connection.
+	async_client = model_async_client(base_url, api_key)
+	if async_client is not None:
+		return OpenAIChatClient(model_id=model_id, async_client=async_client)
 	return OpenAIChatClient(base_url=base_url, api_key=api_key, model_id=model_id)
 
 try:
@@ -72,7 +127,17 @@ try:
 		instructions=PLAN_AGENT_INSTRUCTIONS,
 		name=PLAN_AGENT_NAME,
 	)
+	plan_agent_compact = _client.create_agent(
+		instructions=PLAN_AGENT_COMPACT_INSTRUCTIONS,
+		name=PLAN_AGENT_NAME,
+	)
+	input_condenser = _client.create_agent(
+		instructions=INPUT_CONDENSER_INSTRUCTIONS,
+		name=INPUT_CONDENSER_NAME,
+	)
 except Exception as e:  # pragma: no cover
 	print(f"[plan_agent] initialization warning: {e}")
 	plan_agent = None  # type: ignore
+	plan_agent_compact = None  # type: ignore
+	input_condenser = None  # type: ignore
 
@@ -1,3 +1,3 @@
-from .agent import researcher_agent
+from .agent import researcher_agent, researcher_agent_compact, RESEARCHER_AGENT_SECTIONS, RESEARCHER_AGENT_HANDOFF_FIELDS
 
-__all__ = ["researcher_agent"]
\ No newline at end of file
+__all__ = ["researcher_agent", "researcher_agent_compact", "RESEARCHER_AGENT_SECTIONS", "RESEARCHER_AGENT_HANDOFF_FIELDS"]
\ No newline at end of file
@@ -8,6 +8,10 @@ agent in the ghmodel example but with a different upstream signal.
 import os
 from dotenv import load_dotenv
 
+from agent_runtime.cassette import cassette_client
+from agent_runtime.retrieval import research_tools
+from agent_runtime.transport import model_async_client
+
 load_dotenv()
 
 try:
@@ -58,21 +62,73 @@ Assessment of plan feasibility with suggested improvements
 CRITICAL: Always complete your research response fully. Avoid repetitive loops. Provide comprehensive information in a single, complete response that the advisor can use for final recommendations.
 """
 
+# Ordered headings of the response skeleton above; the last one closes the answer.
+RESEARCHER_AGENT_SECTIONS = (
+	"RESEARCH SUMMARY",
+	"DETAILED FINDINGS",
+	"ADDITIONAL INSIGHTS",
+	"RESOURCES & REFERENCES",
+	"VALIDATION & RECOMMENDATIONS",
+)
+
+# Structured handoff mode (STRUCTURED_HANDOFF=true): the plan arrives as compact
+# JSON and the research is returned as compact JSON for the advisor.
+RESEARCHER_AGENT_COMPACT_INSTRUCTIONS = """
+You are a thorough research agent. The planning agent's plan is given as a JSON object (overview, objectives, phases, research_priorities, next_steps). Expand it with detailed, evidence-based, practical research that validates and enriches the plan.
+
+Respond with ONE JSON object and nothing else (no markdown, no code fences, no commentary):
+{"summary":"<1-2 sentences>","findings":{"<plan element>":["<insight, consideration or best practice>",...],...},"insights":["<relevant point not covered by the plan>",...],"resources":["<tool, guide or reference>",...],"validation":["<feasibility assessment or suggested improvement>",...]}
+
+Cover every phase and research priority of the plan. Use short, factual phrases. Do not repeat information.
+"""
+
+# JSON fields of the compact research, in the order of RESEARCHER_AGENT_SECTIONS.
+RESEARCHER_AGENT_HANDOFF_FIELDS = (
+	"summary",
+	"findings",
+	"insights",
+	"resources",
+	"validation",
+)
+
+# Appended to both instruction sets when a local document index is configured
+# (RESEARCH_INDEX_DIR); see agent_runtime.retrieval.
+RESEARCHER_AGENT_TOOL_INSTRUCTIONS = """
+You have a `search_documents` tool over the local document library. Search it for each plan element and research priority before answering, with short keyword queries. Base your findings on the passages it returns and cite their sources (the file names in brackets) under the resources. If a search finds nothing relevant, say that the library does not cover the topic instead of inventing facts.
+"""
+
 def _build_client() -> OpenAIChatClient:
 	base_url = os.environ.get("FOUNDRYLOCAL_ENDPOINT") 
 	model_id = os.environ.get("FOUNDRYLOCAL_MODEL_DEPLOYMENT_NAME")
 	api_key = "nokey"
+	# MODEL_CASSETTE_MODE=record|replay routes the traffic through a cassette file.
+	async_client = cassette_client("researcher_agent", base_url, api_key)
+	if async_client is not None:
+		return OpenAIChatClient(model_id=model_id or "cassette-model", async_client=async_client)
 	if not base_url:
 		raise RuntimeError("No model endpoint configured. Set FOUNDRYLOCAL_ENDPOINT or GITHUB_ENDPOINT.")
+	# MODEL_HTTP2=true multiplexes all agents' generations over one HTTP/2 connection.
+	async_client = model_async_client(base_url, api_key)
+	if async_client is not None:
+		return OpenAIChatClient(model_id=model_id, async_client=async_client)
 	return OpenAIChatClient(base_url=base_url, api_key=api_key, model_id=model_id)
 
 try:
 	_client = _build_client()
+	_tools = research_tools()
+	_tool_instructions = RESEARCHER_AGENT_TOOL_INSTRUCTIONS if _tools else ""
 	researcher_agent = _client.create_agent(
-		instructions=RESEARCHER_AGENT_INSTRUCTIONS,
+		instructions=RESEARCHER_AGENT_INSTRUCTIONS + _tool_instructions,
+		name=RESEARCHER_AGENT_NAME,
+		tools=_tools or None,
+	)
+	researcher_agent_compact = _client.create_agent(
+		instructions=RESEARCHER_AGENT_COMPACT_INSTRUCTIONS + _tool_instructions,
 		name=RESEARCHER_AGENT_NAME,
+		tools=_tools or None,
 	)
 except Exception as e:  # pragma: no cover
 	print(f"[researcher_agent] initialization warning: {e}")
 	researcher_agent = None  # type: ignore
+	researcher_agent_compact = None  # type: ignore
 
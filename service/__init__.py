@@ -0,0 +1,5 @@
+"""HTTP service entry point for calling the workflow without a UI."""
+
+from .api import create_app
+
+__all__ = ["create_app"]
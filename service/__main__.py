@@ -0,0 +1,45 @@
+"""Run the headless workflow API.
+
+Usage:
+	python -m service --port 8095 --workers 4
+"""
+
+import argparse
+import os
+
+from dotenv import load_dotenv
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(prog="python -m service", description="Headless HTTP API for the multi-agent workflow")
+	parser.add_argument("--host", default="127.0.0.1")
+	parser.add_argument("--port", type=int, default=8095)
+	parser.add_argument("--workers", type=int, default=1, help="Worker processes, each with its own event loop")
+	parser.add_argument(
+		"--job-workers",
+		type=int,
+		help="Also run this many queued jobs inside each API process (SERVICE_JOB_WORKERS), sharing its model scheduler",
+	)
+	parser.add_argument("--log-level", default="info")
+	args = parser.parse_args()
+
+	load_dotenv()
+	if args.job_workers is not None:
+		# Passed through the environment because uvicorn builds the app from an import string.
+		os.environ["SERVICE_JOB_WORKERS"] = str(args.job_workers)
+
+	import uvicorn
+
+	# An import string plus factory lets uvicorn build the app in every worker process.
+	uvicorn.run(
+		"service.api:create_app",
+		factory=True,
+		host=args.host,
+		port=args.port,
+		workers=args.workers,
+		log_level=args.log_level,
+	)
+
+
+if __name__ == "__main__":  # pragma: no cover
+	main()
@@ -0,0 +1,436 @@
+"""Headless HTTP API for the planner -> researcher -> advisor workflow.
+
+A small Starlette app for service-to-service calls, without the DevUI or
+Chainlit front ends:
+
+	GET  /health                  liveness plus whether the agents initialised
+	GET  /metrics                 Prometheus text (loop lag, handoff sizes, ...)
+	GET  /v1/stats/output-tokens  completion lengths and adaptive max_tokens per stage
+	POST /v1/workflow/runs        run the workflow in this process
+	POST /v1/jobs                 queue a run for the worker processes
+	GET  /v1/jobs/{id}            poll a job
+	GET  /v1/jobs/{id}/events     stream a job's progress (SSE)
+	DELETE /v1/jobs/{id}          cancel a job
+
+The run endpoint takes `{"prompt": "...", "stream": false}`. Without
+streaming it answers once with the final recommendation and every stage's
+output. With `"stream": true` it answers with Server-Sent Events:
+
+	event: stage_started    {"stage": "plan_agent"}
+	event: delta            {"stage": "plan_agent", "text": "..."}
+	event: stage_completed  {"stage": "plan_agent", "text": "...", "replayed": false}
+	event: completed        {"run_id": "...", "output": "...", ...}
+	event: error            {"run_id": "...", "error": "...", "next_stage": "..."}
+
+Runs go through `WorkflowRun`, so a failed run is checkpointed and is
+resumed by sending the same prompt again or `{"run_id": "..."}`. A request
+for a prompt that is already running joins that run and receives the same
+events (`"coalesce": false` opts out; see `WORKFLOW_SINGLE_FLIGHT`). Prompts
+with a current entry in the response cache are answered from it and report
+`"cached": true` (`"cache": false` forces a run; see `workflow.cache`). Both run
+and job requests accept `"priority": "interactive" | "batch"`; runs default
+to interactive and jobs to batch (see `agent_runtime.priority`). Runs take
+an optional `"deadline_seconds"` budget (default `DEADLINE_INTERACTIVE_SECONDS`
+or `DEADLINE_BATCH_SECONDS`); stages shortened or skipped to meet it are
+listed under `"deadline"` in the result (see `agent_runtime.deadline`). Under load a
+run may be served by a faster model or a shorter workflow; results, errors
+and the `X-Serving-Mode` header say which (see `agent_runtime.load_shedding`).
+
+The job endpoints never run the workflow in the web process. Jobs are stored
+in the SQLite queue of `service.jobs` and executed by `python -m service.worker`
+processes, so long runs survive web restarts and capacity grows with the
+number of workers. With `SERVICE_JOB_WORKERS` the API process also runs
+jobs itself, so that its interactive runs and the batch jobs share one model
+scheduler, and with `CACHE_WARM=true` it precomputes the curated prompts of
+`service.warmer` while idle. Job event streams use the same event names as above,
+plus `job_started`, `retrying` and `cancelled`, and can be resumed with the
+`Last-Event-ID` header.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+from starlette.types import Receive, Scope, Send
+
+from agent_runtime.config import env_flag, env_float, env_int
+from agent_runtime.deadline import default_budget, request_deadline
+from agent_runtime.load_shedding import load_shedder
+from agent_runtime.loop_watchdog import start_loop_watchdog
+from agent_runtime.metrics import REGISTRY, install_metrics
+from agent_runtime.output_stats import output_stats
+from agent_runtime.priority import BATCH, INTERACTIVE, PRIORITY_CLASSES, model_scheduler, priority_class
+from agent_runtime.profiling import install_profiling
+from workflow import STAGE_IDS, WorkflowRun, agents_ready
+from .events import progress_events, run_result
+from .jobs import FINISHED, JobQueue
+
+logger = logging.getLogger(__name__)
+
+RUNS = REGISTRY.counter("service_runs_total", "Workflow runs handled by the HTTP API, by mode and outcome")
+RUN_SECONDS = REGISTRY.summary("service_run_seconds", "Duration of workflow runs served by the HTTP API")
+JOBS = REGISTRY.counter("service_jobs_total", "Jobs submitted through the HTTP API, by priority class")
+ACTIVE = REGISTRY.gauge("service_active_runs", "Workflow runs currently executing in this process")
+
+
+def _sse(event: str, data: dict[str, Any]) -> str:
+	return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _error(status: int, message: str, **extra: Any) -> JSONResponse:
+	return JSONResponse({"error": message, **extra}, status_code=status)
+
+
+def _priority(body: dict[str, Any], default: str) -> str:
+	priority = body.get("priority") or default
+	if priority not in PRIORITY_CLASSES:
+		raise ValueError(f"'priority' must be one of {', '.join(PRIORITY_CLASSES)}")
+	return priority
+
+
+def _deadline(body: dict[str, Any], priority: str) -> float:
+	seconds = body.get("deadline_seconds")
+	if seconds is None:
+		return default_budget(priority)
+	if isinstance(seconds, bool) or not isinstance(seconds, (int, float)) or seconds < 0:
+		raise ValueError("'deadline_seconds' must be a non-negative number")
+	return float(seconds)
+
+
+class RunLimiter:
+	"""Cap concurrent runs per process (`SERVICE_MAX_CONCURRENT_RUNS`, 0 = no cap)."""
+
+	def __init__(self, limit: int) -> None:
+		self.limit = limit
+		self.active = 0
+
+	@property
+	def full(self) -> bool:
+		return bool(self.limit) and self.active >= self.limit
+
+	def acquire(self) -> None:
+		self.active += 1
+		ACTIVE.set(self.active)
+
+	def release(self) -> None:
+		self.active -= 1
+		ACTIVE.set(self.active)
+
+	def hold(self) -> Callable[[], None]:
+		"""Take a slot and return the function that gives it back; later calls of it do nothing."""
+		self.acquire()
+		held = [True]
+
+		def release() -> None:
+			if held:
+				held.clear()
+				self.release()
+
+		return release
+
+
+class _RunStreamResponse(StreamingResponse):
+	"""SSE response of a run that gives back its limiter slot however the response ends.
+
+	`_stream_run` releases the slot when the run ends; this covers a client
+	that disconnects before the body is started, when the generator never runs.
+	"""
+
+	def __init__(self, content: AsyncIterator[str], release: Callable[[], None], **kwargs: Any) -> None:
+		super().__init__(content, **kwargs)
+		self._release = release
+
+	async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+		try:
+			await super().__call__(scope, receive, send)
+		finally:
+			self._release()
+
+
+def _result(run: WorkflowRun, started: float) -> dict[str, Any]:
+	return {**run_result(run), "duration_s": round(time.perf_counter() - started, 3)}
+
+
+async def _stream_run(
+	run: WorkflowRun, release: Callable[[], None], keepalive: float, priority: str, deadline: float
+) -> AsyncIterator[str]:
+	"""Translate workflow events into SSE, with keep-alive comments during long silences.
+
+	`release` gives back the limiter slot the handler took for the run.
+	"""
+	queue: asyncio.Queue = asyncio.Queue()
+	done = object()
+	started = time.perf_counter()
+
+	async def produce() -> None:
+		try:
+			with priority_class(priority), request_deadline(deadline):
+				async for event in run.stream():
+					await queue.put(event)
+			await queue.put(done)
+		except Exception as exc:
+			await queue.put(exc)
+
+	producer = asyncio.create_task(produce())
+	outcome = "cancelled"
+	try:
+		while True:
+			try:
+				item = await asyncio.wait_for(queue.get(), timeout=keepalive)
+			except asyncio.TimeoutError:
+				yield ": keep-alive\n\n"
+				continue
+			if item is done:
+				outcome = "completed"
+				yield _sse("completed", _result(run, started))
+				return
+			if isinstance(item, Exception):
+				outcome = "failed"
+				yield _sse("error", {
+					"run_id": run.run_id,
+					"error": str(item) or type(item).__name__,
+					"next_stage": run.next_stage,
+					"serving_mode": run.mode,
+				})
+				return
+			for name, data in progress_events(run, item):
+				yield _sse(name, data)
+	finally:
+		# Also reached when the client disconnects: stop the run so it is checkpointed as failed.
+		if not producer.done():
+			producer.cancel()
+			try:
+				await producer
+			except (asyncio.CancelledError, Exception):
+				pass
+		release()
+		RUNS.inc(mode="stream", outcome=outcome)
+		RUN_SECONDS.observe(time.perf_counter() - started)
+
+
+def create_app() -> Starlette:
+	"""Build the API application."""
+	limiter = RunLimiter(env_int("SERVICE_MAX_CONCURRENT_RUNS", 0))
+	keepalive = env_float("SERVICE_SSE_KEEPALIVE_SECONDS", 15.0)
+	poll = env_float("JOB_POLL_INTERVAL_SECONDS", 0.5)
+
+	async def health(_: Request) -> JSONResponse:
+		ready = agents_ready()
+		scheduler = model_scheduler()
+		shedder = load_shedder()
+		return JSONResponse(
+			{
+				"status": "ok" if ready else "degraded",
+				"agents_ready": ready,
+				"stages": list(STAGE_IDS),
+				"active_runs": limiter.active,
+				"model_slots": scheduler.slots,
+				"waiting_stages": {name: scheduler.waiting(name) for name in PRIORITY_CLASSES},
+				"serving_mode": shedder.current,
+				"load_pressure": round(shedder.pressure(), 3),
+			},
+			status_code=200 if ready else 503,
+		)
+
+	async def create_run(request: Request):
+		try:
+			body = await request.json()
+		except ValueError:
+			return _error(400, "Request body must be JSON")
+		if not isinstance(body, dict):
+			return _error(400, "Request body must be a JSON object")
+		prompt = body.get("prompt")
+		run_id = body.get("run_id")
+		if prompt is not None and (not isinstance(prompt, str) or not prompt.strip()):
+			return _error(400, "'prompt' must be a non-empty string")
+		if run_id is not None and (not isinstance(run_id, str) or not run_id.strip()):
+			return _error(400, "'run_id' must be a non-empty string")
+		if not prompt and not run_id:
+			return _error(400, "Either 'prompt' or 'run_id' is required")
+		try:
+			priority = _priority(body, INTERACTIVE)
+			deadline = _deadline(body, priority)
+		except ValueError as exc:
+			return _error(400, str(exc))
+		if limiter.full:
+			RUNS.inc(mode="stream" if body.get("stream") else "json", outcome="rejected")
+			return JSONResponse({"error": "Too many concurrent runs"}, status_code=503, headers={"Retry-After": "5"})
+		# The slot is taken before the run is built, so a burst of requests
+		# cannot all pass the check above.
+		release = limiter.hold()
+		try:
+			# Looking up the response cache and the checkpoints reads files: keep it off the loop.
+			run = await asyncio.to_thread(
+				WorkflowRun,
+				prompt.strip() if prompt else None,
+				run_id=run_id,
+				resume=bool(body.get("resume", True)),
+				coalesce=bool(body["coalesce"]) if "coalesce" in body else None,
+				cache=bool(body.get("cache", True)),
+			)
+		except ValueError as exc:
+			release()
+			return _error(404, str(exc))
+		except RuntimeError as exc:
+			release()
+			return _error(409, str(exc))
+		except BaseException:
+			release()
+			raise
+
+		if body.get("stream"):
+			return _RunStreamResponse(
+				_stream_run(run, release, keepalive, priority, deadline),
+				release,
+				media_type="text/event-stream",
+				headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Run-Id": run.run_id, "X-Serving-Mode": run.mode},
+			)
+
+		started = time.perf_counter()
+		outcome = "failed"
+		try:
+			with priority_class(priority), request_deadline(deadline):
+				await run.run()
+			outcome = "completed"
+			return JSONResponse(_result(run, started), headers={"X-Serving-Mode": run.mode})
+		except Exception as exc:
+			logger.error("Workflow run %s failed: %s", run.run_id, exc)
+			return _error(502, str(exc) or type(exc).__name__, run_id=run.run_id, next_stage=run.next_stage, serving_mode=run.mode)
+		finally:
+			release()
+			RUNS.inc(mode="json", outcome=outcome)
+			RUN_SECONDS.observe(time.perf_counter() - started)
+
+	async def token_stats(_: Request) -> JSONResponse:
+		stats = output_stats()
+		return JSONResponse({
+			"path": str(stats.path),
+			"window": stats.window,
+			"multiplier": stats.multiplier,
+			"min_samples": stats.min_samples,
+			"stages": stats.snapshot(),
+		})
+
+	queues: list[JobQueue] = []
+
+	async def job_queue() -> JobQueue:
+		# Opened on first use so the plain run endpoints never touch the database.
+		if not queues:
+			queues.append(await asyncio.to_thread(JobQueue))
+		return queues[0]
+
+	async def submit_job(request: Request) -> JSONResponse:
+		try:
+			body = await request.json()
+		except ValueError:
+			return _error(400, "Request body must be JSON")
+		if not isinstance(body, dict):
+			return _error(400, "Request body must be a JSON object")
+		prompt = body.get("prompt")
+		if not isinstance(prompt, str) or not prompt.strip():
+			return _error(400, "'prompt' must be a non-empty string")
+		try:
+			priority = _priority(body, BATCH)
+		except ValueError as exc:
+			return _error(400, str(exc))
+		queue = await job_queue()
+		job = await asyncio.to_thread(queue.submit, prompt.strip(), priority=priority)
+		JOBS.inc(priority=priority)
+		return JSONResponse(
+			{**job.to_dict(), "links": {"self": f"/v1/jobs/{job.id}", "events": f"/v1/jobs/{job.id}/events"}},
+			status_code=202,
+			headers={"Location": f"/v1/jobs/{job.id}"},
+		)
+
+	async def get_job(request: Request) -> JSONResponse:
+		queue = await job_queue()
+		job = await asyncio.to_thread(queue.get, request.path_params["job_id"])
+		if job is None:
+			return _error(404, "Job not found")
+		return JSONResponse(job.to_dict())
+
+	async def cancel_job(request: Request) -> JSONResponse:
+		queue = await job_queue()
+		job = await asyncio.to_thread(queue.cancel, request.path_params["job_id"])
+		if job is None:
+			return _error(404, "Job not found")
+		return JSONResponse(job.to_dict(), status_code=202 if job.status not in FINISHED else 200)
+
+	async def job_events(request: Request):
+		queue = await job_queue()
+		job_id = request.path_params["job_id"]
+		if await asyncio.to_thread(queue.get, job_id) is None:
+			return _error(404, "Job not found")
+		try:
+			after = int(request.headers.get("last-event-id") or request.query_params.get("after") or 0)
+		except ValueError:
+			after = 0
+
+		async def stream() -> AsyncIterator[str]:
+			nonlocal after
+			idle = 0.0
+			while True:
+				events = await asyncio.to_thread(queue.events, job_id, after)
+				for seq, name, data in events:
+					after = seq
+					yield f"id: {seq}\n" + _sse(name, data)
+				if events:
+					idle = 0.0
+					continue
+				job = await asyncio.to_thread(queue.get, job_id)
+				if job is None or job.status in FINISHED:
+					# The final event may have been written after the read above,
+					# just before the status changed: read once more before ending.
+					for seq, name, data in await asyncio.to_thread(queue.events, job_id, after):
+						yield f"id: {seq}\n" + _sse(name, data)
+					return
+				await asyncio.sleep(poll)
+				idle += poll
+				if idle >= keepalive:
+					idle = 0.0
+					yield ": keep-alive\n\n"
+
+		return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+	@asynccontextmanager
+	async def lifespan(_: Starlette):
+		start_loop_watchdog()
+		stop = asyncio.Event()
+		background = []
+		job_workers = env_int("SERVICE_JOB_WORKERS", 0)
+		if job_workers > 0:
+			from .worker import JobWorker
+
+			background.append(asyncio.create_task(JobWorker(await job_queue(), concurrency=job_workers).serve(stop)))
+		if env_flag("CACHE_WARM"):
+			from .warmer import CacheWarmer
+
+			background.append(asyncio.create_task(CacheWarmer().serve(stop)))
+		try:
+			yield
+		finally:
+			stop.set()
+			await asyncio.gather(*background)
+
+	app = Starlette(
+		routes=[
+			Route("/health", health),
+			Route("/v1/workflow/runs", create_run, methods=["POST"]),
+			Route("/v1/stats/output-tokens", token_stats),
+			Route("/v1/jobs", submit_job, methods=["POST"]),
+			Route("/v1/jobs/{job_id}", get_job, methods=["GET"]),
+			Route("/v1/jobs/{job_id}", cancel_job, methods=["DELETE"]),
+			Route("/v1/jobs/{job_id}/events", job_events, methods=["GET"]),
+		],
+		lifespan=lifespan,
+	)
+	install_metrics(app)
+	install_profiling(app)
+	return app
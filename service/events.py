@@ -0,0 +1,44 @@
+"""Translation of workflow events into the API's per-stage progress events.
+
+Shared by the streaming run endpoint and the job workers, so a client sees
+the same event names whether it streams a run directly or follows a job.
+"""
+
+from typing import Any
+
+from agent_framework import AgentRunEvent, AgentRunUpdateEvent, ExecutorCompletedEvent, ExecutorInvokedEvent
+
+from workflow import STAGE_IDS, WorkflowRun
+
+
+def progress_events(run: WorkflowRun, event: Any) -> list[tuple[str, dict[str, Any]]]:
+	"""Map one workflow event to zero or more `(name, data)` progress events."""
+	if isinstance(event, ExecutorInvokedEvent):
+		return [("stage_started", {"stage": event.executor_id})]
+	if isinstance(event, AgentRunUpdateEvent):
+		if event.data is not None and event.data.text:
+			return [("delta", {"stage": event.executor_id, "text": event.data.text})]
+		return []
+	if isinstance(event, AgentRunEvent):
+		# Stages completed by an earlier attempt are replayed as whole responses.
+		return [("stage_completed", {"stage": event.executor_id, "text": run.outputs.get(event.executor_id, ""), "replayed": True})]
+	if isinstance(event, ExecutorCompletedEvent) and event.executor_id in STAGE_IDS:
+		return [("stage_completed", {"stage": event.executor_id, "text": run.outputs.get(event.executor_id, ""), "replayed": False})]
+	return []
+
+
+def run_result(run: WorkflowRun) -> dict[str, Any]:
+	"""Final payload of a completed run."""
+	return {
+		"run_id": run.run_id,
+		"status": "completed",
+		"output": run.final_text,
+		"stages": dict(run.outputs),
+		"resumed_from": run.resumed_from,
+		"shared": run.shared,
+		"cached": run.cached,
+		"serving_mode": run.mode,
+		"handoff": run.handoff_reports or None,
+		"deadline": run.deadline_reports or None,
+		"input": run.input_report or None,
+	}
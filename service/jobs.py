@@ -0,0 +1,327 @@
+"""Durable job queue for workflow runs, backed by SQLite.
+
+The web tier only inserts jobs and reads their state. Separate worker
+processes (`python -m service.worker`) claim queued jobs, run the workflow and
+append progress events that the web tier streams back to clients. Jobs live
+in one SQLite database (`JOB_QUEUE_DB`, WAL mode) so any number of processes
+on the host can share the queue, and they survive restarts of both tiers.
+
+A claimed job holds a lease that its worker renews while the run progresses.
+If the worker dies, the lease expires and another worker claims the job
+again. Because the job id doubles as the `WorkflowRun` id, the new attempt
+resumes from the last checkpointed stage instead of starting over.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Optional
+
+from agent_runtime.config import env_float, env_int
+from agent_runtime.priority import BATCH, INTERACTIVE
+
+DEFAULT_QUEUE_DB = ".jobs/jobs.db"
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+FINISHED = (JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+	id TEXT PRIMARY KEY,
+	prompt TEXT NOT NULL,
+	priority TEXT NOT NULL DEFAULT 'batch',
+	status TEXT NOT NULL,
+	attempts INTEGER NOT NULL DEFAULT 0,
+	max_attempts INTEGER NOT NULL,
+	worker TEXT,
+	lease_expires REAL,
+	cancel_requested INTEGER NOT NULL DEFAULT 0,
+	result TEXT,
+	error TEXT,
+	created_at REAL NOT NULL,
+	started_at REAL,
+	finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS job_events (
+	job_id TEXT NOT NULL,
+	seq INTEGER NOT NULL,
+	event TEXT NOT NULL,
+	data TEXT NOT NULL,
+	created_at REAL NOT NULL,
+	PRIMARY KEY (job_id, seq)
+);
+"""
+
+
+@dataclass
+class Job:
+	"""Snapshot of one row of the `jobs` table."""
+
+	id: str
+	prompt: str
+	priority: str
+	status: str
+	attempts: int
+	max_attempts: int
+	worker: Optional[str]
+	lease_expires: Optional[float]
+	cancel_requested: bool
+	result: Optional[dict[str, Any]]
+	error: Optional[str]
+	created_at: float
+	started_at: Optional[float]
+	finished_at: Optional[float]
+
+	@classmethod
+	def from_row(cls, row: sqlite3.Row) -> "Job":
+		data = dict(row)
+		data["cancel_requested"] = bool(data["cancel_requested"])
+		data["result"] = json.loads(data["result"]) if data["result"] else None
+		return cls(**data)
+
+	def to_dict(self) -> dict[str, Any]:
+		"""Public view returned by the API (the prompt is echoed, not the lease)."""
+		return {
+			"job_id": self.id,
+			"status": self.status,
+			"prompt": self.prompt,
+			"priority": self.priority,
+			"attempts": self.attempts,
+			"result": self.result,
+			"error": self.error,
+			"created_at": self.created_at,
+			"started_at": self.started_at,
+			"finished_at": self.finished_at,
+		}
+
+
+class JobQueue:
+	"""SQLite-backed queue shared by the API and worker processes.
+
+	Methods are synchronous; call them through `asyncio.to_thread` from an
+	event loop. Each thread gets its own connection.
+
+	Args:
+		path: Database file. Defaults to `JOB_QUEUE_DB`.
+		lease_seconds: How long a claim stays valid without renewal
+			(`JOB_LEASE_SECONDS`).
+		max_attempts: Claims allowed per job before it is marked failed
+			(`JOB_MAX_ATTEMPTS`).
+	"""
+
+	def __init__(self, path: Optional[str] = None, *, lease_seconds: Optional[float] = None, max_attempts: Optional[int] = None) -> None:
+		self.path = Path(path or os.environ.get("JOB_QUEUE_DB") or DEFAULT_QUEUE_DB)
+		self.lease_seconds = lease_seconds if lease_seconds is not None else env_float("JOB_LEASE_SECONDS", 60.0)
+		self.max_attempts = max_attempts if max_attempts is not None else env_int("JOB_MAX_ATTEMPTS", 3)
+		self._local = threading.local()
+		self.path.parent.mkdir(parents=True, exist_ok=True)
+		with self._connect() as conn:
+			conn.executescript(_SCHEMA)
+
+	def _connect(self) -> sqlite3.Connection:
+		conn = getattr(self._local, "conn", None)
+		if conn is None:
+			conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+			conn.row_factory = sqlite3.Row
+			conn.execute("PRAGMA journal_mode=WAL")
+			conn.execute("PRAGMA synchronous=NORMAL")
+			self._local.conn = conn
+		return conn
+
+	def _write(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+		conn = self._connect()
+		conn.execute("BEGIN IMMEDIATE")
+		try:
+			cursor = conn.execute(sql, params)
+			conn.execute("COMMIT")
+			return cursor
+		except BaseException:
+			conn.execute("ROLLBACK")
+			raise
+
+	# -- web tier -------------------------------------------------------------
+
+	def submit(self, prompt: str, job_id: Optional[str] = None, *, priority: str = BATCH) -> Job:
+		"""Queue a new job and return it.
+
+		Jobs are batch work by default; their class decides how their stages
+		are scheduled against interactive traffic (see `agent_runtime.priority`).
+		"""
+		job_id = job_id or uuid.uuid4().hex[:12]
+		self._write(
+			"INSERT INTO jobs (id, prompt, priority, status, max_attempts, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+			(job_id, prompt, priority, JOB_QUEUED, self.max_attempts, time.time()),
+		)
+		return self.get(job_id)  # type: ignore[return-value]
+
+	def get(self, job_id: str) -> Optional[Job]:
+		row = self._connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+		return Job.from_row(row) if row else None
+
+	def events(self, job_id: str, after: int = 0, limit: int = 500) -> list[tuple[int, str, dict[str, Any]]]:
+		"""Progress events of a job with a sequence number above `after`."""
+		rows = self._connect().execute(
+			"SELECT seq, event, data FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+			(job_id, after, limit),
+		).fetchall()
+		return [(row["seq"], row["event"], json.loads(row["data"])) for row in rows]
+
+	def cancel(self, job_id: str) -> Optional[Job]:
+		"""Cancel a queued job now, or ask the worker running it to stop.
+
+		A queued job gets its `cancelled` event here, in the same transaction;
+		a running one gets it from its worker once the run has stopped.
+		"""
+		now = time.time()
+		conn = self._connect()
+		conn.execute("BEGIN IMMEDIATE")
+		try:
+			cursor = conn.execute(
+				"UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status = ?",
+				(JOB_CANCELLED, now, job_id, JOB_QUEUED),
+			)
+			if cursor.rowcount == 1:
+				self._insert_events(conn, job_id, [("cancelled", {"job_id": job_id})])
+			conn.execute("COMMIT")
+		except BaseException:
+			conn.execute("ROLLBACK")
+			raise
+		self._write("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = ?", (job_id, JOB_RUNNING))
+		return self.get(job_id)
+
+	def counts(self) -> dict[str, int]:
+		rows = self._connect().execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+		return {row["status"]: row["n"] for row in rows}
+
+	# -- workers --------------------------------------------------------------
+
+	def claim(self, worker: str) -> Optional[Job]:
+		"""Take the oldest queued job, or one whose worker's lease expired; interactive jobs first."""
+		now = time.time()
+		conn = self._connect()
+		conn.execute("BEGIN IMMEDIATE")
+		try:
+			# Abandoned jobs that were cancelled, or ran out of attempts, are not retried.
+			# Their worker is gone, so the terminal `cancelled` or `error` event is written here.
+			abandoned = [r["id"] for r in conn.execute(
+				"SELECT id FROM jobs WHERE status = ? AND lease_expires < ? AND cancel_requested = 1", (JOB_RUNNING, now)
+			)]
+			for job_id in abandoned:
+				self._insert_events(conn, job_id, [("cancelled", {"job_id": job_id})])
+			conn.execute(
+				"UPDATE jobs SET status = ?, error = 'Cancelled', finished_at = ? "
+				"WHERE status = ? AND lease_expires < ? AND cancel_requested = 1",
+				(JOB_CANCELLED, now, JOB_RUNNING, now),
+			)
+			exhausted = conn.execute(
+				"SELECT id, COALESCE(error, 'Worker lost too many times') AS error FROM jobs "
+				"WHERE status = ? AND lease_expires < ? AND attempts >= max_attempts",
+				(JOB_RUNNING, now),
+			).fetchall()
+			for job in exhausted:
+				self._insert_events(conn, job["id"], [("error", {"job_id": job["id"], "error": job["error"]})])
+			conn.execute(
+				"UPDATE jobs SET status = ?, error = COALESCE(error, 'Worker lost too many times'), finished_at = ? "
+				"WHERE status = ? AND lease_expires < ? AND attempts >= max_attempts",
+				(JOB_FAILED, now, JOB_RUNNING, now),
+			)
+			row = conn.execute(
+				"SELECT id FROM jobs WHERE status = ? OR (status = ? AND lease_expires < ?) "
+				"ORDER BY priority = ? DESC, created_at LIMIT 1",
+				(JOB_QUEUED, JOB_RUNNING, now, INTERACTIVE),
+			).fetchone()
+			if row is None:
+				conn.execute("COMMIT")
+				return None
+			conn.execute(
+				"UPDATE jobs SET status = ?, worker = ?, lease_expires = ?, attempts = attempts + 1, "
+				"started_at = COALESCE(started_at, ?) WHERE id = ?",
+				(JOB_RUNNING, worker, now + self.lease_seconds, now, row["id"]),
+			)
+			conn.execute("COMMIT")
+		except BaseException:
+			conn.execute("ROLLBACK")
+			raise
+		return self.get(row["id"])
+
+	def renew(self, job_id: str, worker: str) -> bool:
+		"""Extend the lease. Returns False if the job was cancelled or taken over."""
+		cursor = self._write(
+			"UPDATE jobs SET lease_expires = ? WHERE id = ? AND worker = ? AND status = ? AND cancel_requested = 0",
+			(time.time() + self.lease_seconds, job_id, worker, JOB_RUNNING),
+		)
+		return cursor.rowcount == 1
+
+	@staticmethod
+	def _insert_events(conn: sqlite3.Connection, job_id: str, events: list[tuple[str, dict[str, Any]]]) -> None:
+		"""Append events within the caller's transaction."""
+		seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM job_events WHERE job_id = ?", (job_id,)).fetchone()[0]
+		now = time.time()
+		conn.executemany(
+			"INSERT INTO job_events (job_id, seq, event, data, created_at) VALUES (?, ?, ?, ?, ?)",
+			[(job_id, seq + i, event, json.dumps(data, ensure_ascii=False), now) for i, (event, data) in enumerate(events, 1)],
+		)
+
+	def append_events(self, job_id: str, events: list[tuple[str, dict[str, Any]]]) -> None:
+		if not events:
+			return
+		conn = self._connect()
+		conn.execute("BEGIN IMMEDIATE")
+		try:
+			self._insert_events(conn, job_id, events)
+			conn.execute("COMMIT")
+		except BaseException:
+			conn.execute("ROLLBACK")
+			raise
+
+	def finish(self, job_id: str, worker: str, status: str, *, result: Optional[dict[str, Any]] = None, error: Optional[str] = None) -> None:
+		self._write(
+			"UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, lease_expires = NULL "
+			"WHERE id = ? AND worker = ?",
+			(status, json.dumps(result, ensure_ascii=False) if result is not None else None, error, time.time(), job_id, worker),
+		)
+
+	def release(self, job_id: str, worker: str) -> None:
+		"""Put a job back in the queue (worker shutting down) without using up an attempt."""
+		self._write(
+			"UPDATE jobs SET status = ?, worker = NULL, lease_expires = NULL, attempts = MAX(attempts - 1, 0) "
+			"WHERE id = ? AND worker = ? AND status = ?",
+			(JOB_QUEUED, job_id, worker, JOB_RUNNING),
+		)
+
+	def release_for_retry(self, job_id: str, worker: str, error: str) -> None:
+		"""Queue a failed attempt again; the attempt still counts towards `max_attempts`."""
+		self._write(
+			"UPDATE jobs SET status = ?, worker = NULL, lease_expires = NULL, error = ? "
+			"WHERE id = ? AND worker = ? AND status = ?",
+			(JOB_QUEUED, error, job_id, worker, JOB_RUNNING),
+		)
+
+	def prune(self, retention_hours: Optional[float] = None) -> int:
+		"""Delete finished jobs (and their events) older than `JOB_RETENTION_HOURS`."""
+		hours = retention_hours if retention_hours is not None else env_float("JOB_RETENTION_HOURS", 24.0)
+		cutoff = time.time() - hours * 3600
+		conn = self._connect()
+		conn.execute("BEGIN IMMEDIATE")
+		try:
+			placeholders = ",".join("?" * len(FINISHED))
+			ids = [r["id"] for r in conn.execute(
+				f"SELECT id FROM jobs WHERE status IN ({placeholders}) AND finished_at < ?", (*FINISHED, cutoff)
+			)]
+			conn.executemany("DELETE FROM job_events WHERE job_id = ?", [(i,) for i in ids])
+			conn.executemany("DELETE FROM jobs WHERE id = ?", [(i,) for i in ids])
+			conn.execute("COMMIT")
+		except BaseException:
+			conn.execute("ROLLBACK")
+			raise
+		return len(ids)
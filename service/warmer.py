@@ -0,0 +1,184 @@
+"""Precompute answers for a curated prompt list into the response cache.
+
+The prompts offered as examples in the UIs are asked far more often than
+anything else. The warmer runs each of them through the full workflow while
+the model is idle, at batch priority, and stores the result in the response
+cache (`workflow.cache`), so those requests are answered instantly. Entries
+are refreshed when an agent's instructions or model change the workflow
+fingerprint, and when they are older than `CACHE_WARM_REFRESH_HOURS`.
+
+The prompt list is a text file with one prompt per line; blank lines and
+lines starting with `#` are ignored (`CACHE_WARM_PROMPTS_FILE`, default
+`warm_prompts.txt`). With `CACHE_WARM=true` the API process runs the warmer
+in the background; it can also be run once from the command line:
+
+	python -m service.warmer --prompts warm_prompts.txt
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+from agent_runtime.config import env_float
+from agent_runtime.load_shedding import FULL
+from agent_runtime.metrics import REGISTRY
+from agent_runtime.priority import BATCH, model_scheduler, priority_class
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROMPTS_FILE = "warm_prompts.txt"
+# A prompt whose warming run failed is not tried again for this long.
+_RETRY_SECONDS = 300.0
+
+WARM_RUNS = REGISTRY.counter("cache_warm_runs_total", "Cache warming runs, by outcome (stored, skipped, failed)")
+
+
+def load_prompts(path: Optional[str] = None) -> list[str]:
+	"""The prompts listed in `path` (`CACHE_WARM_PROMPTS_FILE`), without duplicates."""
+	path = Path(path or os.environ.get("CACHE_WARM_PROMPTS_FILE") or DEFAULT_PROMPTS_FILE)
+	try:
+		lines = path.read_text(encoding="utf-8").splitlines()
+	except OSError as exc:
+		logger.warning("Cannot read warm prompts from %s: %s", path, exc)
+		return []
+	prompts = [line.strip() for line in lines if line.strip() and not line.lstrip().startswith("#")]
+	return list(dict.fromkeys(prompts))
+
+
+class CacheWarmer:
+	"""Keep the response cache current for a list of prompts.
+
+	Args:
+		prompts: Prompts to precompute. Defaults to `load_prompts()`.
+		cache: Where results are stored. Defaults to the process-wide cache.
+		idle_seconds: How long the model scheduler must have had nothing
+			waiting before a prompt is run (`CACHE_WARM_IDLE_SECONDS`).
+		refresh_hours: Age at which an entry is recomputed even if the
+			workflow is unchanged (`CACHE_WARM_REFRESH_HOURS`).
+		poll_interval: Seconds between checks for stale entries and idleness.
+	"""
+
+	def __init__(
+		self,
+		prompts: Optional[list[str]] = None,
+		*,
+		cache: Any = None,
+		idle_seconds: Optional[float] = None,
+		refresh_hours: Optional[float] = None,
+		poll_interval: float = 1.0,
+	) -> None:
+		from workflow.cache import response_cache
+
+		self.prompts = prompts if prompts is not None else load_prompts()
+		self.cache = cache or response_cache()
+		self.idle_seconds = idle_seconds if idle_seconds is not None else env_float("CACHE_WARM_IDLE_SECONDS", 10.0)
+		self.refresh_seconds = 3600 * (refresh_hours if refresh_hours is not None else env_float("CACHE_WARM_REFRESH_HOURS", 12.0))
+		self.poll_interval = poll_interval
+		self._failed: dict[str, float] = {}
+
+	def stale(self) -> list[str]:
+		"""Prompts without a current warmed entry."""
+		from workflow.cache import SOURCE_WARM, workflow_fingerprint
+
+		fingerprint = workflow_fingerprint()
+		max_age = min(self.refresh_seconds, self.cache.ttl_seconds)
+		stale = []
+		for prompt in self.prompts:
+			entry = self.cache.entry(prompt)
+			if entry is None or entry.source != SOURCE_WARM or not self.cache.is_current(entry, fingerprint, max_age):
+				stale.append(prompt)
+		return stale
+
+	async def warm_one(self, prompt: str) -> bool:
+		"""Run `prompt` through the workflow and store the result; True if stored."""
+		# Imported here so the CLI loads `.env` before the agents are created.
+		from workflow import WorkflowRun
+		from workflow.cache import SOURCE_WARM
+
+		try:
+			# Fresh, unshared and uncached, so the stored answer is a real full run.
+			run = WorkflowRun(prompt, resume=False, coalesce=False, cache=False)
+			with priority_class(BATCH):
+				await run.run()
+		except Exception as exc:
+			logger.warning("Cache warming failed for %r: %s", prompt, exc)
+			self._failed[prompt] = time.monotonic()
+			WARM_RUNS.inc(outcome="failed")
+			return False
+		if run.mode != FULL or run.next_stage is not None or run.deadline_reports:
+			# A run shed to a faster model or a shorter workflow, or cut short, is not cached.
+			WARM_RUNS.inc(outcome="skipped")
+			return False
+		try:
+			await asyncio.to_thread(self.cache.put, prompt, run.outputs, source=SOURCE_WARM)
+		except OSError as exc:
+			# An unwritable or full cache directory must not end the warmer.
+			logger.warning("Could not store the warmed answer for %r: %s", prompt, exc)
+			self._failed[prompt] = time.monotonic()
+			WARM_RUNS.inc(outcome="failed")
+			return False
+		WARM_RUNS.inc(outcome="stored")
+		logger.info("Warmed the response cache for %r", prompt)
+		return True
+
+	async def warm(self, everything: bool = False) -> int:
+		"""Warm every stale prompt (or all of them) now, without waiting for idleness."""
+		return sum([await self.warm_one(prompt) for prompt in (self.prompts if everything else self.stale())])
+
+	async def _wait_idle(self, stop: asyncio.Event) -> bool:
+		"""Wait until nothing has been queued for the model for `idle_seconds`; False if stopped."""
+		idle_since: Optional[float] = None
+		while not stop.is_set():
+			if model_scheduler().pending:
+				idle_since = None
+			elif idle_since is None:
+				idle_since = time.monotonic()
+			elif time.monotonic() - idle_since >= self.idle_seconds:
+				return True
+			try:
+				await asyncio.wait_for(stop.wait(), timeout=self.poll_interval)
+			except asyncio.TimeoutError:
+				pass
+		return False
+
+	async def serve(self, stop: Optional[asyncio.Event] = None) -> None:
+		"""Warm stale prompts one at a time whenever the model is idle, until `stop` is set."""
+		stop = stop or asyncio.Event()
+		if not self.prompts:
+			logger.info("No prompts to warm; cache warmer not started")
+			return
+		logger.info("Cache warmer keeping %d prompts current in %s", len(self.prompts), self.cache.directory)
+		while not stop.is_set():
+			now = time.monotonic()
+			stale = [p for p in await asyncio.to_thread(self.stale) if now - self._failed.get(p, -_RETRY_SECONDS) >= _RETRY_SECONDS]
+			if not stale:
+				try:
+					await asyncio.wait_for(stop.wait(), timeout=max(self.poll_interval, 60.0))
+				except asyncio.TimeoutError:
+					pass
+				continue
+			if await self._wait_idle(stop):
+				await self.warm_one(stale[0])
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+	parser = argparse.ArgumentParser(prog="python -m service.warmer", description="Precompute cached answers for a prompt list")
+	parser.add_argument("--prompts", help=f"Prompt list file (CACHE_WARM_PROMPTS_FILE, default {DEFAULT_PROMPTS_FILE})")
+	parser.add_argument("--all", action="store_true", help="Recompute every prompt, not only stale ones")
+	args = parser.parse_args(argv)
+
+	from dotenv import load_dotenv
+
+	load_dotenv()
+	logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+	warmer = CacheWarmer(load_prompts(args.prompts))
+	stored = asyncio.run(warmer.warm(everything=args.all))
+	print(f"Warmed {stored} of {len(warmer.prompts)} prompts into {warmer.cache.directory}")
+
+
+if __name__ == "__main__":  # pragma: no cover
+	main()
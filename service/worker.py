@@ -0,0 +1,224 @@
+"""Worker processes that execute queued workflow jobs.
+
+Each worker process runs an asyncio loop that claims jobs from the
+`JobQueue`, runs them through `WorkflowRun` (so every attempt resumes from the
+last checkpointed stage) and appends progress events for the web tier to
+stream. Throughput scales by adding processes, and with `--endpoint` the
+processes are spread over several model backends.
+
+Usage:
+	python -m service.worker --processes 4 --concurrency 1
+	python -m service.worker --processes 2 --endpoint http://gpu-a:58123/v1/ --endpoint http://gpu-b:58123/v1/
+"""
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from typing import Any, Optional
+
+from agent_runtime.config import env_float, env_int
+from agent_runtime.loop_watchdog import start_loop_watchdog
+from agent_runtime.deadline import default_budget, request_deadline
+from agent_runtime.priority import priority_class
+from .jobs import JOB_CANCELLED, JOB_COMPLETED, JOB_FAILED, JOB_QUEUED, Job, JobQueue
+
+logger = logging.getLogger(__name__)
+
+
+class JobWorker:
+	"""Claim and run jobs, up to `concurrency` at a time in this process.
+
+	Args:
+		queue: The shared queue. Defaults to `JOB_QUEUE_DB`.
+		concurrency: Jobs run at once by this process (`JOB_WORKER_CONCURRENCY`).
+		poll_interval: Seconds between claims while the queue is empty
+			(`JOB_POLL_INTERVAL_SECONDS`).
+		name: Worker id recorded on claimed jobs.
+	"""
+
+	def __init__(
+		self,
+		queue: Optional[JobQueue] = None,
+		*,
+		concurrency: Optional[int] = None,
+		poll_interval: Optional[float] = None,
+		name: Optional[str] = None,
+	) -> None:
+		self.queue = queue or JobQueue()
+		self.concurrency = max(1, concurrency if concurrency is not None else env_int("JOB_WORKER_CONCURRENCY", 1))
+		self.poll_interval = poll_interval if poll_interval is not None else env_float("JOB_POLL_INTERVAL_SECONDS", 0.5)
+		self.flush_interval = env_float("JOB_EVENT_FLUSH_SECONDS", 0.25)
+		self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+		self._tasks: dict[str, asyncio.Task] = {}
+
+	async def _call(self, method: Any, *args: Any, **kwargs: Any) -> Any:
+		# SQLite calls block, so keep them off the event loop.
+		return await asyncio.to_thread(method, *args, **kwargs)
+
+	async def _keep_lease(self, job: Job, task: asyncio.Task) -> None:
+		while not task.done():
+			await asyncio.sleep(self.queue.lease_seconds / 3)
+			if not await self._call(self.queue.renew, job.id, self.name):
+				logger.info("Job %s was cancelled or taken over; stopping it", job.id)
+				task.cancel()
+				return
+
+	async def run_job(self, job: Job) -> str:
+		"""Run one claimed job to a final (or re-queued) state and return that status."""
+		from workflow import WorkflowRun
+		from .events import progress_events, run_result
+
+		pending: list[tuple[str, dict[str, Any]]] = []
+		last_flush = time.monotonic()
+
+		async def flush() -> None:
+			nonlocal last_flush
+			if pending:
+				batch = pending[:]
+				pending.clear()
+				await self._call(self.queue.append_events, job.id, batch)
+			last_flush = time.monotonic()
+
+		async def execute() -> dict[str, Any]:
+			run = await asyncio.to_thread(WorkflowRun, job.prompt, run_id=job.id)
+			pending.append(("job_started", {"job_id": job.id, "attempt": job.attempts, "worker": self.name}))
+			async for event in run.stream():
+				for name, data in progress_events(run, event):
+					pending.append((name, data))
+					# Token deltas are batched; stage boundaries are written immediately.
+					if name != "delta" or time.monotonic() - last_flush >= self.flush_interval:
+						await flush()
+			return run_result(run)
+
+		# The task copies the context, so every stage of the run is scheduled in the job's
+		# class and fitted into its deadline (DEADLINE_BATCH_SECONDS, per attempt).
+		with priority_class(job.priority), request_deadline(default_budget(job.priority)):
+			task = asyncio.create_task(execute())
+		lease = asyncio.create_task(self._keep_lease(job, task))
+		try:
+			result = await task
+		except asyncio.CancelledError:
+			current = await self._call(self.queue.get, job.id)
+			if current is not None and current.cancel_requested:
+				pending.append(("cancelled", {"job_id": job.id}))
+				await flush()
+				await self._call(self.queue.finish, job.id, self.name, JOB_CANCELLED, error="Cancelled")
+				return JOB_CANCELLED
+			# Shutting down: hand the job back; the next worker resumes from its checkpoint.
+			await asyncio.shield(self._call(self.queue.release, job.id, self.name))
+			raise
+		except Exception as exc:
+			error = str(exc) or type(exc).__name__
+			logger.error("Job %s attempt %d failed: %s", job.id, job.attempts, error)
+			if job.attempts < job.max_attempts:
+				pending.append(("retrying", {"job_id": job.id, "attempt": job.attempts, "error": error}))
+				await flush()
+				await self._call(self.queue.release_for_retry, job.id, self.name, error)
+				return JOB_QUEUED
+			pending.append(("error", {"job_id": job.id, "error": error}))
+			await flush()
+			await self._call(self.queue.finish, job.id, self.name, JOB_FAILED, error=error)
+			return JOB_FAILED
+		finally:
+			lease.cancel()
+
+		pending.append(("completed", result))
+		await flush()
+		await self._call(self.queue.finish, job.id, self.name, JOB_COMPLETED, result=result)
+		return JOB_COMPLETED
+
+	async def serve(self, stop: Optional[asyncio.Event] = None) -> None:
+		"""Claim jobs until `stop` is set, then hand running jobs back to the queue."""
+		stop = stop or asyncio.Event()
+		await self._call(self.queue.prune)
+		logger.info("Worker %s polling %s (concurrency %d)", self.name, self.queue.path, self.concurrency)
+		try:
+			while not stop.is_set():
+				job = None
+				if len(self._tasks) < self.concurrency:
+					job = await self._call(self.queue.claim, self.name)
+				if job is not None:
+					logger.info("Worker %s claimed job %s (attempt %d)", self.name, job.id, job.attempts)
+					task = asyncio.create_task(self.run_job(job))
+					self._tasks[job.id] = task
+					task.add_done_callback(lambda _, job_id=job.id: self._tasks.pop(job_id, None))
+					continue
+				try:
+					await asyncio.wait_for(stop.wait(), timeout=self.poll_interval)
+				except asyncio.TimeoutError:
+					pass
+		finally:
+			for task in list(self._tasks.values()):
+				task.cancel()
+			await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+
+async def _serve_until_signalled(worker: JobWorker) -> None:
+	stop = asyncio.Event()
+	loop = asyncio.get_running_loop()
+	for sig in (signal.SIGINT, signal.SIGTERM):
+		try:
+			loop.add_signal_handler(sig, stop.set)
+		except (NotImplementedError, RuntimeError):  # pragma: no cover - Windows
+			pass
+	start_loop_watchdog()
+	await worker.serve(stop)
+
+
+def _worker_process(concurrency: int) -> None:
+	from dotenv import load_dotenv
+
+	load_dotenv()
+	logging.basicConfig(level=logging.INFO, format="%(asctime)s %(processName)s %(message)s")
+	try:
+		asyncio.run(_serve_until_signalled(JobWorker(concurrency=concurrency)))
+	except KeyboardInterrupt:  # pragma: no cover
+		pass
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+	parser = argparse.ArgumentParser(prog="python -m service.worker", description="Run workflow job workers")
+	parser.add_argument("--processes", type=int, default=1, help="Worker processes to start")
+	parser.add_argument("--concurrency", type=int, default=env_int("JOB_WORKER_CONCURRENCY", 1), help="Jobs per process")
+	parser.add_argument(
+		"--endpoint",
+		action="append",
+		help="Model endpoint (FOUNDRYLOCAL_ENDPOINT) for the processes; repeat to spread processes over backends",
+	)
+	args = parser.parse_args(argv)
+
+	if args.processes <= 1 and not args.endpoint:
+		_worker_process(args.concurrency)
+		return
+
+	# Spawned children import the agents fresh, with the endpoint set below.
+	context = multiprocessing.get_context("spawn")
+	processes = []
+	original = os.environ.get("FOUNDRYLOCAL_ENDPOINT")
+	for index in range(max(1, args.processes)):
+		if args.endpoint:
+			os.environ["FOUNDRYLOCAL_ENDPOINT"] = args.endpoint[index % len(args.endpoint)]
+		process = context.Process(target=_worker_process, args=(args.concurrency,), name=f"worker-{index}")
+		process.start()
+		processes.append(process)
+	if original is None:
+		os.environ.pop("FOUNDRYLOCAL_ENDPOINT", None)
+	else:
+		os.environ["FOUNDRYLOCAL_ENDPOINT"] = original
+
+	signal.signal(signal.SIGTERM, lambda *_: [p.terminate() for p in processes])
+	try:
+		for process in processes:
+			process.join()
+	except KeyboardInterrupt:
+		for process in processes:
+			process.join()
+
+
+if __name__ == "__main__":  # pragma: no cover
+	main()
@@ -0,0 +1,142 @@
+"""Offline tests for the response cache and the idle-time cache warmer."""
+
+import asyncio
+import importlib
+import json
+from dataclasses import asdict
+
+from agent_framework import AgentRunResponseUpdate
+from starlette.testclient import TestClient
+
+import service.warmer as warmer_module
+import workflow.cache as cache_module
+from service import create_app
+from service.warmer import CacheWarmer, load_prompts
+from workflow import WorkflowRun
+from workflow.cache import ResponseCache
+
+workflow_module = importlib.import_module("workflow.workflow")
+
+
+class Options:
+    def __init__(self, instructions):
+        self.instructions = instructions
+
+
+class CountingAgent:
+    def __init__(self, name, text):
+        self.name = name
+        self.text = text
+        self.calls = 0
+        self.chat_options = Options(f"You are {name}.")
+
+    def get_new_thread(self):
+        return None
+
+    async def run_stream(self, messages=None, *, thread=None, **kwargs):
+        self.calls += 1
+        yield AgentRunResponseUpdate(text=self.text, role="assistant")
+
+
+class Backlog:
+    pending = 0
+
+
+def _install(monkeypatch, tmp_path):
+    monkeypatch.setenv("WORKFLOW_CHECKPOINT_DIR", str(tmp_path / "checkpoints"))
+    agents = [CountingAgent("Plan-Agent", "PLAN"), CountingAgent("Researcher-Agent", "RESEARCH"), CountingAgent("Advisor-Agent", "ADVICE")]
+    monkeypatch.setattr(workflow_module, "_STAGES", tuple(
+        (stage_id, agent, ()) for stage_id, agent in zip(("plan_agent", "researcher_agent", "advisor_agent"), agents)
+    ))
+    cache = ResponseCache(str(tmp_path / "cache"), ttl_hours=24)
+    monkeypatch.setattr(cache_module, "_cache", cache)
+    return agents, cache
+
+
+def test_warmed_prompt_is_served_without_calling_the_agents(monkeypatch, tmp_path):
+    agents, cache = _install(monkeypatch, tmp_path)
+    prompt = "Create a plan for building a web application"
+    warmer = CacheWarmer([prompt, "Plan a launch"], cache=cache)
+    assert warmer.stale() == [prompt, "Plan a launch"]
+    assert asyncio.run(warmer.warm()) == 2
+    assert warmer.stale() == [] and [a.calls for a in agents] == [2, 2, 2]
+
+    run = WorkflowRun(f"  {prompt} ")
+    assert run.cached and run.resumed_from is None
+    assert asyncio.run(run.run()) == "ADVICE"
+    assert [a.calls for a in agents] == [2, 2, 2]
+
+    # Ordinary runs are only cached with RESPONSE_CACHE=all.
+    asyncio.run(WorkflowRun("Something else").run())
+    assert not WorkflowRun("Something else").cached
+    monkeypatch.setenv("RESPONSE_CACHE", "all")
+    asyncio.run(WorkflowRun("Something else").run())
+    assert WorkflowRun("Something else").cached
+    monkeypatch.setenv("RESPONSE_CACHE", "off")
+    assert not WorkflowRun(prompt).cached
+
+
+def test_changed_instructions_retire_entries_and_the_warmer_refreshes_them(monkeypatch, tmp_path):
+    agents, cache = _install(monkeypatch, tmp_path)
+    prompt = "Plan a launch"
+    warmer = CacheWarmer([prompt], cache=cache, refresh_hours=12)
+    asyncio.run(warmer.warm())
+    assert WorkflowRun(prompt).cached
+
+    agents[2].chat_options = Options("You are a terser advisor.")
+    agents[2].text = "SHORTER ADVICE"
+    assert not WorkflowRun(prompt).cached
+    assert warmer.stale() == [prompt]
+    asyncio.run(warmer.warm())
+    assert cache.get(prompt).outputs["advisor_agent"] == "SHORTER ADVICE"
+
+    # Old entries are refreshed before they expire.
+    entry = cache.entry(prompt)
+    entry.created_at -= 13 * 3600
+    cache._path(prompt).write_text(json.dumps(asdict(entry)))
+    assert WorkflowRun(prompt).cached and warmer.stale() == [prompt]
+
+
+def test_warmer_waits_for_idle_and_api_reports_cached(monkeypatch, tmp_path):
+    agents, cache = _install(monkeypatch, tmp_path)
+    prompts_file = tmp_path / "prompts.txt"
+    prompts_file.write_text("# examples\nPlan a launch\n\nPlan a launch\nDevelop a roadmap\n")
+    assert load_prompts(str(prompts_file)) == ["Plan a launch", "Develop a roadmap"]
+
+    backlog = Backlog()
+    backlog.pending = 1
+    monkeypatch.setattr(warmer_module, "model_scheduler", lambda: backlog)
+    warmer = CacheWarmer(load_prompts(str(prompts_file)), cache=cache, idle_seconds=0.05, poll_interval=0.01)
+
+    async def serve():
+        stop = asyncio.Event()
+        task = asyncio.create_task(warmer.serve(stop))
+        await asyncio.sleep(0.2)
+        busy = agents[0].calls
+        backlog.pending = 0
+        while warmer.stale():
+            await asyncio.sleep(0.01)
+        stop.set()
+        await task
+        return busy
+
+    assert asyncio.run(serve()) == 0
+    assert agents[0].calls == 2
+
+    client = TestClient(create_app())
+    body = client.post("/v1/workflow/runs", json={"prompt": "Develop a roadmap"}).json()
+    assert body["cached"] and body["output"] == "ADVICE" and agents[0].calls == 2
+    body = client.post("/v1/workflow/runs", json={"prompt": "Develop a roadmap", "cache": False}).json()
+    assert not body["cached"] and agents[0].calls == 3
+
+
+def test_unwritable_cache_counts_as_a_failed_warm_and_is_retried_later(monkeypatch, tmp_path):
+    agents, cache = _install(monkeypatch, tmp_path)
+    warmer = CacheWarmer(["Plan a launch"], cache=cache)
+
+    def full_disk(*args, **kwargs):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(cache, "put", full_disk)
+    assert asyncio.run(warmer.warm()) == 0
+    assert "Plan a launch" in warmer._failed and agents[0].calls == 1
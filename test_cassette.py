@@ -0,0 +1,89 @@
+"""Offline tests for recording and replaying model traffic."""
+
+import asyncio
+import importlib
+import time
+
+import httpx
+import pytest
+from agent_framework.openai import OpenAIChatClient
+from openai import AsyncOpenAI
+
+from agent_runtime.cassette import CassetteMiss, CassetteTransport
+from loadtest.mock_server import create_app
+from workflow import WorkflowRun
+
+workflow_module = importlib.import_module("workflow.workflow")
+
+
+class Offline(httpx.AsyncBaseTransport):
+    async def handle_async_request(self, request):
+        raise AssertionError("replay must not reach the network")
+
+
+def _agent(transport, name="Advisor-Agent"):
+    client = AsyncOpenAI(base_url="http://model.test/v1/", api_key="nokey", http_client=httpx.AsyncClient(transport=transport))
+    return OpenAIChatClient(model_id="mock-model", async_client=client).create_agent(
+        instructions="You are a senior advisor.", name=name
+    )
+
+
+async def _ask(agent, prompt):
+    return "".join([u.text async for u in agent.run_stream(prompt)])
+
+
+def test_recorded_stream_replays_identically_offline(tmp_path):
+    path = tmp_path / "advisor_agent.json"
+    mock = httpx.ASGITransport(app=create_app(ttft=0, tokens_per_second=0, output_tokens=60))
+    recorded = asyncio.run(_ask(_agent(CassetteTransport(path, "record", inner=mock)), "Plan a project"))
+    assert "EXECUTIVE SUMMARY" in recorded and path.exists()
+
+    replay = CassetteTransport(path, "replay", inner=Offline())
+    assert asyncio.run(_ask(_agent(replay), "Plan a project")) == recorded
+
+    # A recording can be replayed again, e.g. by concurrent load-test sessions.
+    assert asyncio.run(_ask(_agent(replay), "Plan a project")) == recorded
+    with pytest.raises(CassetteMiss):
+        CassetteTransport(tmp_path / "missing.json", "replay").cassette.find("any")
+
+
+def test_unmatched_request_gets_next_exchange_in_order(tmp_path):
+    path = tmp_path / "advisor_agent.json"
+    mock = httpx.ASGITransport(app=create_app(ttft=0, tokens_per_second=0, output_tokens=20))
+    recorded = asyncio.run(_ask(_agent(CassetteTransport(path, "record", inner=mock)), "Plan a project"))
+    replay = CassetteTransport(path, "replay", inner=Offline())
+    assert asyncio.run(_ask(_agent(replay), "A different prompt")) == recorded
+
+
+def test_replay_keeps_original_timing_when_asked(tmp_path):
+    path = tmp_path / "advisor_agent.json"
+    mock = httpx.ASGITransport(app=create_app(ttft=0, tokens_per_second=0, output_tokens=20))
+    asyncio.run(_ask(_agent(CassetteTransport(path, "record", inner=mock)), "Plan a project"))
+    cassette = CassetteTransport(path, "replay").cassette
+    chunks = cassette.exchanges[0]["response"]["chunks"]
+    chunks[-1][0] = chunks[0][0] + 0.6
+    cassette.save()
+
+    for speed, low, high in ((0, 0, 0.3), (1, 0.6, 1.2), (2, 0.3, 0.6)):
+        started = time.perf_counter()
+        asyncio.run(_ask(_agent(CassetteTransport(path, "replay", speed=speed, inner=Offline())), "Plan a project"))
+        assert low <= time.perf_counter() - started < high
+
+
+def test_workflow_replays_from_cassettes_offline(monkeypatch, tmp_path):
+    monkeypatch.setenv("RESPONSE_CACHE", "off")
+    mock = httpx.ASGITransport(app=create_app(ttft=0, tokens_per_second=0, output_tokens=30))
+
+    def run_workflow(mode, inner):
+        monkeypatch.setenv("WORKFLOW_CHECKPOINT_DIR", str(tmp_path / mode))
+        monkeypatch.setattr(workflow_module, "_STAGES", tuple(
+            (stage_id, _agent(CassetteTransport(tmp_path / f"{stage_id}.json", mode, inner=inner), stage_id), ())
+            for stage_id in workflow_module.STAGE_IDS
+        ))
+        run = WorkflowRun("Plan a project")
+        output = asyncio.run(run.run())
+        return output, run.outputs
+
+    recorded = run_workflow("record", mock)
+    assert "EXECUTIVE SUMMARY" in recorded[0] and len(recorded[1]) == 3
+    assert run_workflow("replay", Offline()) == recorded
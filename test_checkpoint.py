@@ -0,0 +1,114 @@
+"""Offline tests for workflow checkpointing and resume.
+
+The three agents are replaced by fakes so a failure in the advisor stage can
+be simulated without Foundry Local.
+"""
+
+import asyncio
+import importlib
+import tempfile
+
+from agent_framework import AgentRunResponseUpdate
+
+from workflow import CheckpointStore, WorkflowRun
+from workflow.progress import resume_hint, start_notes
+
+# The package re-exports the `workflow` instance, which shadows the module name.
+workflow_module = importlib.import_module("workflow.workflow")
+
+
+class FakeStageAgent:
+    """Agent stand-in that streams a fixed answer or raises."""
+
+    def __init__(self, name, text, fail=False):
+        self.name = name
+        self.text = text
+        self.fail = fail
+        self.calls = 0
+        self.inputs = []
+
+    def get_new_thread(self):
+        return None
+
+    async def run_stream(self, messages=None, *, thread=None, **kwargs):
+        self.calls += 1
+        self.inputs.append([m.text for m in messages])
+        if self.fail:
+            raise TimeoutError("advisor timed out")
+        yield AgentRunResponseUpdate(text=self.text, role="assistant")
+
+
+def _install_fakes(monkeypatch, advisor_fails):
+    planner = FakeStageAgent("Plan-Agent", "PLAN")
+    researcher = FakeStageAgent("Researcher-Agent", "RESEARCH")
+    advisor = FakeStageAgent("Advisor-Agent", "ADVICE", fail=advisor_fails)
+    monkeypatch.setattr(workflow_module, "_STAGES", (
+        ("plan_agent", planner, ()),
+        ("researcher_agent", researcher, ()),
+        ("advisor_agent", advisor, ()),
+    ))
+    return planner, researcher, advisor
+
+
+def test_failed_run_resumes_from_last_completed_stage(monkeypatch):
+    store = CheckpointStore(tempfile.mkdtemp())
+    planner, researcher, _ = _install_fakes(monkeypatch, advisor_fails=True)
+
+    first = WorkflowRun("Plan a launch", store=store)
+    try:
+        asyncio.run(first.run())
+    except TimeoutError:
+        pass
+    saved = store.load(first.run_id)
+    assert saved.status == "failed"
+    assert saved.outputs == {"plan_agent": "PLAN", "researcher_agent": "RESEARCH"}
+
+    planner, researcher, advisor = _install_fakes(monkeypatch, advisor_fails=False)
+    retry = WorkflowRun("Plan a launch", store=store)
+    assert retry.run_id == first.run_id
+    assert retry.resumed_from == "advisor_agent"
+    assert asyncio.run(retry.run()) == "ADVICE"
+    assert planner.calls == 0 and researcher.calls == 0
+    assert advisor.inputs == [["Plan a launch", "PLAN", "RESEARCH"]]
+    assert store.load(first.run_id).status == "completed"
+
+
+def test_explicit_resume_by_run_id(monkeypatch):
+    store = CheckpointStore(tempfile.mkdtemp())
+    _install_fakes(monkeypatch, advisor_fails=True)
+    first = WorkflowRun("Plan a launch", store=store, run_id="myrun")
+    try:
+        asyncio.run(first.run())
+    except TimeoutError:
+        pass
+
+    _install_fakes(monkeypatch, advisor_fails=False)
+    resumed = WorkflowRun(run_id="myrun", store=store)
+    assert resumed.prompt == "Plan a launch"
+    assert asyncio.run(resumed.run()) == "ADVICE"
+
+
+def test_completed_run_is_not_auto_resumed(monkeypatch):
+    store = CheckpointStore(tempfile.mkdtemp())
+    _install_fakes(monkeypatch, advisor_fails=False)
+    first = WorkflowRun("Plan a launch", store=store)
+    asyncio.run(first.run())
+    second = WorkflowRun("Plan a launch", store=store)
+    assert second.run_id != first.run_id
+    assert second.resumed_from is None
+
+
+def test_chainlit_progress_notes_offer_the_resume(monkeypatch):
+    store = CheckpointStore(tempfile.mkdtemp())
+    _install_fakes(monkeypatch, advisor_fails=True)
+    first = WorkflowRun("Plan a launch", store=store)
+    try:
+        asyncio.run(first.run())
+    except TimeoutError:
+        pass
+    hint = resume_hint(first)
+    assert f"/resume {first.run_id}" in hint and "**Advisor Agent**" in hint
+
+    second = WorkflowRun("Plan a launch", store=store)
+    assert start_notes(second)[0] == f"♻️ Resuming run `{first.run_id}` from **Advisor Agent**..."
+    assert resume_hint(None) == ""
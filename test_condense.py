@@ -0,0 +1,123 @@
+"""Offline tests for condensing long requests before the planner reads them."""
+
+import asyncio
+import importlib
+
+from agent_framework import AgentRunResponse, AgentRunResponseUpdate, ChatMessage, Role
+from starlette.testclient import TestClient
+
+from agent_runtime.condense import InputCondenser, split_chunks
+from agent_runtime.tokens import Tokenizer
+from service import create_app
+
+workflow_module = importlib.import_module("workflow.workflow")
+
+
+def _document(sections=6, words=60):
+    return "\n\n".join(f"Section{n} " + " ".join(["lorem"] * words) for n in range(sections))
+
+
+class SummaryAgent:
+    """Summarizes any text to its first word and tracks how many calls overlap."""
+
+    def __init__(self, delay=0.01):
+        self.delay = delay
+        self.calls = []
+        self.active = 0
+        self.peak = 0
+
+    async def run(self, messages=None, **kwargs):
+        self.calls.append(messages)
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(self.delay)
+        self.active -= 1
+        text = messages.split("\n\n", 1)[1]
+        return AgentRunResponse(messages=[ChatMessage(role=Role.ASSISTANT, text=f"summary of {text.split()[0]}")])
+
+
+class RecordingAgent:
+    def __init__(self, name, text):
+        self.name = name
+        self.text = text
+        self.received = []
+
+    def get_new_thread(self):
+        return None
+
+    async def run_stream(self, messages=None, *, thread=None, **kwargs):
+        self.received.append([m.text for m in messages])
+        yield AgentRunResponseUpdate(text=self.text, role="assistant")
+
+
+def test_chunks_keep_paragraphs_and_split_oversized_ones():
+    tokenizer = Tokenizer()
+    chunks = list(split_chunks(_document(sections=5, words=20), 100, tokenizer))
+    assert [len(c.split()) for c in chunks] == [42, 42, 21]
+    assert all(c.startswith(f"Section{2 * n} ") for n, c in enumerate(chunks))
+    long = list(split_chunks(" ".join(["word"] * 500), 100, tokenizer))
+    assert len(long) == 5 and all(tokenizer.count(c) <= 100 for c in long)
+
+
+class DecodingTokenizer(Tokenizer):
+    """Like a model tokenizer, `head` decodes ids and does not keep the spacing of the text."""
+
+    def head(self, text, max_tokens):
+        return " ".join(super().head(text, max_tokens).split())
+
+
+def test_pieces_of_a_paragraph_never_repeat_or_drop_text():
+    paragraph = "  ".join(f"w{n}" for n in range(500))
+    chunks = list(split_chunks(paragraph, 100, DecodingTokenizer()))
+    assert len(chunks) > 1 and " ".join(chunks).split() == paragraph.split()
+
+
+def test_failed_cache_writes_do_not_fail_the_run(tmp_path):
+    blocked = tmp_path / "not-a-directory"
+    blocked.write_text("")
+    condenser = InputCondenser(SummaryAgent(), threshold=200, chunk_tokens=150, concurrency=2, cache_dir=str(blocked))
+    assert asyncio.run(condenser.condense(_document())).text == "summary of [1]"
+
+
+def test_long_requests_are_condensed_in_bounded_parallel_with_cached_chunks(tmp_path):
+    agent = SummaryAgent()
+    condenser = InputCondenser(agent, threshold=200, chunk_tokens=150, concurrency=2, cache_dir=str(tmp_path))
+    assert asyncio.run(condenser.condense("A short request")).report is None
+
+    document = _document()
+    condensed = asyncio.run(condenser.condense(document))
+    # Six parts are summarized two at a time, then reduced into one brief.
+    assert condensed.report == {"tokens": condenser.tokenizer.count(document), "chunks": 6, "cached": 0, "brief_tokens": 6}
+    assert len(agent.calls) == 7 and agent.peak == 2
+    assert condensed.text == "summary of [1]"
+    assert "summary of Section5" in agent.calls[-1] and "Combine these summaries" in agent.calls[-1]
+
+    # The same document again comes entirely from the cache.
+    again = asyncio.run(condenser.condense(document))
+    assert again.text == condensed.text and again.report["cached"] == 7 and len(agent.calls) == 7
+
+    # An edited document only summarizes the part that changed, and the new brief.
+    edited = document.replace("Section3", "Changed3")
+    assert asyncio.run(condenser.condense(edited)).report["cached"] == 5
+    assert len(agent.calls) == 9 and agent.calls[7].split("\n\n", 1)[1].startswith("Changed3")
+
+
+def test_planner_reads_the_brief_and_the_result_reports_it(monkeypatch, tmp_path):
+    monkeypatch.setenv("WORKFLOW_CHECKPOINT_DIR", str(tmp_path / "checkpoints"))
+    monkeypatch.setenv("INPUT_CONDENSE_CACHE_DIR", str(tmp_path / "chunks"))
+    monkeypatch.setenv("INPUT_CONDENSE_THRESHOLD_TOKENS", "200")
+    monkeypatch.setenv("INPUT_CONDENSE_CHUNK_TOKENS", "150")
+    agents = [RecordingAgent("Plan-Agent", "plan"), RecordingAgent("Researcher-Agent", "research"), RecordingAgent("Advisor-Agent", "advice")]
+    monkeypatch.setattr(workflow_module, "_STAGES", tuple(
+        (stage_id, agent, ()) for stage_id, agent in zip(("plan_agent", "researcher_agent", "advisor_agent"), agents)
+    ))
+    monkeypatch.setattr(workflow_module, "_CONDENSER", SummaryAgent())
+    client = TestClient(create_app())
+
+    body = client.post("/v1/workflow/runs", json={"prompt": _document()}).json()
+    assert body["output"] == "advice" and body["input"]["chunks"] == 6
+    assert agents[0].received == [["summary of [1]"]]
+    assert agents[2].received[0][0] == "summary of [1]"
+
+    body = client.post("/v1/workflow/runs", json={"prompt": "Plan a short launch"}).json()
+    assert body["input"] is None and agents[0].received[1] == ["Plan a short launch"]
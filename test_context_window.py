@@ -0,0 +1,74 @@
+"""Offline tests for pre-flight prompt counting and context-window trimming."""
+
+import asyncio
+
+import pytest
+from agent_framework import AgentRunResponseUpdate, ChatMessage, Role
+
+from agent_runtime import StageAgent
+from agent_runtime.context_window import ContextBudget, ContextWindowExceeded, fit_prompt, prompt_tokens
+from agent_runtime.tokens import Tokenizer
+
+TOKENIZER = Tokenizer()
+PLAN = "PLAN " + "phase " * 200 + "END-OF-PLAN"
+RESEARCH = "RESEARCH " + "finding " * 600 + "END-OF-RESEARCH"
+
+
+def _conversation():
+    return [
+        ChatMessage(role=Role.USER, text="Plan a product launch"),
+        ChatMessage(role=Role.ASSISTANT, text=PLAN, author_name="plan_agent"),
+        ChatMessage(role=Role.ASSISTANT, text=RESEARCH, author_name="researcher_agent"),
+    ]
+
+
+def test_tokenizer_head_and_tail_respect_budget():
+    text = "alpha beta gamma delta epsilon"
+    assert TOKENIZER.head(text, 4) == "alpha beta"
+    assert TOKENIZER.tail(text, 2) == "epsilon"
+    assert TOKENIZER.head(text, 100) == text
+
+
+@pytest.mark.parametrize("policy, shrunk", [("largest", 2), ("oldest", 1)])
+def test_oversized_prompt_is_trimmed_by_policy(policy, shrunk):
+    messages = _conversation()
+    total = prompt_tokens("Be brief.", messages, TOKENIZER)
+    budget = ContextBudget(window=total - 100 + 50, reserve=50, policy=policy)
+
+    fitted, report = fit_prompt(messages, "Be brief.", tokenizer=TOKENIZER, budget=budget, stage="advisor")
+    assert report["prompt_tokens"] <= budget.limit and report["trimmed_tokens"] >= 100
+    assert fitted[0].text == "Plan a product launch"
+    trimmed = fitted[shrunk].text
+    assert "tokens trimmed to fit the context window" in trimmed
+    assert trimmed.startswith(messages[shrunk].text[:10]) and trimmed.endswith(messages[shrunk].text[-10:])
+    assert fitted[3 - shrunk].text == messages[3 - shrunk].text
+    assert fitted[shrunk].author_name == messages[shrunk].author_name
+
+
+def test_stage_fails_fast_when_prompt_cannot_fit(monkeypatch):
+    calls = []
+
+    class FakeAgent:
+        name = "Advisor-Agent"
+
+        async def run_stream(self, messages=None, *, thread=None, **kwargs):
+            calls.append(messages)
+            yield AgentRunResponseUpdate(text="ok", role="assistant")
+
+    monkeypatch.setenv("MODEL_CONTEXT_WINDOW", "100")
+    monkeypatch.setenv("CONTEXT_OUTPUT_RESERVE", "20")
+    monkeypatch.setenv("CONTEXT_TRIM_POLICY", "fail")
+
+    async def collect(messages):
+        return [u.text async for u in StageAgent(FakeAgent()).run_stream(messages)]
+
+    with pytest.raises(ContextWindowExceeded, match="Advisor-Agent prompt needs"):
+        asyncio.run(collect(_conversation()))
+    assert calls == []
+
+    # The user's request is never trimmed, so trimming cannot rescue a huge one.
+    monkeypatch.setenv("CONTEXT_TRIM_POLICY", "largest")
+    with pytest.raises(ContextWindowExceeded):
+        asyncio.run(collect("word " * 500))
+    assert asyncio.run(collect(_conversation())) == ["ok"]
+    assert "tokens trimmed" in calls[-1][2].text
@@ -0,0 +1,114 @@
+"""Offline tests for continuing answers cut off by the token limit."""
+
+import asyncio
+
+from agent_framework import AgentRunResponse, AgentRunResponseUpdate, ChatMessage, Role
+
+from agent_runtime import StageAgent
+from agent_runtime.context_window import prompt_tokens
+from agent_runtime.stage import CONTINUE_PROMPT
+from agent_runtime.tokens import Tokenizer
+from plan_agent import PLAN_AGENT_SECTIONS
+
+PLAN_TEXT = (
+    "### 📋 PLAN OVERVIEW\nBuild a web app.\n\n"
+    "### 🎯 KEY OBJECTIVES\n1. Ship it\n\n"
+    "### 📅 STRUCTURED APPROACH\n**Phase 1: Setup**\n- Step 1: repo\n\n"
+    "### 🔍 RESEARCH PRIORITIES\nHosting options\n\n"
+    "### ⚡ NEXT STEPS\n- Create the repository\n- Invite the team\n"
+)
+
+
+class Finish:
+    def __init__(self, reason):
+        self.finish_reason = reason
+
+
+class TruncatingAgent:
+    """Answers in pieces, stopping with finish_reason "length" until the last one."""
+
+    name = "Fake-Agent"
+
+    def __init__(self, pieces, fail_on=None):
+        self.pieces = pieces
+        self.fail_on = fail_on
+        self.requests = []
+
+    def _reason(self, index):
+        return "length" if index < len(self.pieces) - 1 else "stop"
+
+    async def run_stream(self, messages=None, *, thread=None, **kwargs):
+        index = len(self.requests)
+        self.requests.append((messages, kwargs))
+        if index == self.fail_on:
+            raise ConnectionError("model went away")
+        text = self.pieces[index]
+        for i in range(0, len(text), 9):
+            yield AgentRunResponseUpdate(text=text[i:i + 9], role="assistant")
+        yield AgentRunResponseUpdate(text="", role="assistant", raw_representation=Finish(self._reason(index)))
+
+    async def run(self, messages=None, *, thread=None, **kwargs):
+        index = len(self.requests)
+        self.requests.append((messages, kwargs))
+        response = AgentRunResponse(messages=[ChatMessage(role=Role.ASSISTANT, text=self.pieces[index])])
+        response.raw_representation = Finish(self._reason(index))
+        return response
+
+
+def _stream(stage, prompt="Plan a web app"):
+    async def collect():
+        return "".join([u.text async for u in stage.run_stream(prompt)])
+
+    return asyncio.run(collect())
+
+
+def test_truncated_answer_is_continued_and_repeated_text_dropped():
+    # The second piece starts by repeating the end of the first one.
+    cut = PLAN_TEXT.index("### 🔍")
+    repeat = PLAN_TEXT[cut - 40:cut]
+    agent = TruncatingAgent([PLAN_TEXT[:cut], repeat + PLAN_TEXT[cut:]])
+    stage = StageAgent(agent, required_sections=PLAN_AGENT_SECTIONS, early_stop=True, max_continuations=2)
+    assert _stream(stage) == PLAN_TEXT
+
+    messages, kwargs = agent.requests[1]
+    assert [m.role for m in messages] == [Role.USER, Role.ASSISTANT, Role.USER]
+    assert messages[0].text == "Plan a web app" and messages[1].text == PLAN_TEXT[:cut]
+    assert messages[2].text == CONTINUE_PROMPT
+
+
+def test_continuations_are_capped_and_failures_keep_the_partial_answer():
+    pieces = ["A" * 30, "B" * 30, "C" * 30, "D" * 30]
+    agent = TruncatingAgent(pieces)
+    assert _stream(StageAgent(agent, max_continuations=2)) == "A" * 30 + "B" * 30 + "C" * 30
+    assert len(agent.requests) == 3
+
+    agent = TruncatingAgent(pieces, fail_on=1)
+    assert _stream(StageAgent(agent, max_continuations=2)) == "A" * 30
+
+    agent = TruncatingAgent(pieces)
+    assert _stream(StageAgent(agent, max_continuations=0)) == "A" * 30
+    assert len(agent.requests) == 1
+
+
+def test_non_streaming_run_is_continued_too():
+    agent = TruncatingAgent(["First half, ", "second half."])
+    response = asyncio.run(StageAgent(agent, max_continuations=1).run("Plan"))
+    assert response.text == "First half, second half."
+
+
+def test_continuation_request_keeps_the_end_of_a_long_answer_within_the_window(monkeypatch):
+    monkeypatch.setenv("MODEL_CONTEXT_WINDOW", "400")
+    first = " ".join(f"w{n}" for n in range(300))
+    agent = TruncatingAgent([first, " done."])
+    stage = StageAgent(agent, max_continuations=1)
+
+    async def collect():
+        return "".join([u.text async for u in stage.run_stream("Plan a web app", max_tokens=200)])
+
+    assert asyncio.run(collect()) == first + " done."
+    messages, _ = agent.requests[1]
+    tokenizer = Tokenizer()
+    # The answer so far alone is over the 200 prompt tokens left: its start is dropped.
+    assert tokenizer.count(first) > 200 >= prompt_tokens(None, messages, tokenizer)
+    assert messages[0].text == "Plan a web app" and messages[2].text == CONTINUE_PROMPT
+    assert messages[1].text.startswith("[... start of the answer omitted ...]") and messages[1].text.endswith("w298 w299")
@@ -0,0 +1,142 @@
+"""Offline tests for request deadlines carried through the workflow."""
+
+import asyncio
+import importlib
+import time
+
+from agent_framework import AgentRunResponseUpdate
+from starlette.testclient import TestClient
+
+import agent_runtime.deadline as deadline_module
+from agent_runtime import StageAgent
+from agent_runtime.deadline import DecodeRate, remaining, request_deadline, until
+from agent_runtime.stage import SKIPPED_NOTE
+from service import create_app
+
+workflow_module = importlib.import_module("workflow.workflow")
+
+
+class Finish:
+    def __init__(self, reason):
+        self.finish_reason = reason
+
+
+class SlowAgent:
+    """Streams `chunks` pieces of text, `delay` seconds apart."""
+
+    def __init__(self, name, text, chunks=1, delay=0.0, finish="stop"):
+        self.name = name
+        self.text = text
+        self.chunks = chunks
+        self.delay = delay
+        self.finish = finish
+        self.calls = []
+
+    def get_new_thread(self):
+        return None
+
+    async def run_stream(self, messages=None, *, thread=None, **kwargs):
+        self.calls.append(kwargs)
+        for n in range(self.chunks):
+            await asyncio.sleep(self.delay)
+            yield AgentRunResponseUpdate(text=f"{self.text}{n} ", role="assistant")
+        yield AgentRunResponseUpdate(text="", role="assistant", raw_representation=Finish(self.finish))
+
+
+def test_deadlines_nest_and_until_abandons_a_stalled_stream():
+    assert remaining() is None
+    with request_deadline(10):
+        with request_deadline(60):
+            assert 9 < remaining() <= 10
+        with request_deadline(1):
+            assert remaining() <= 1
+        with request_deadline(0):
+            assert remaining() > 9
+    assert remaining() is None
+
+    closed = []
+
+    async def stalls():
+        try:
+            yield "a"
+            yield "b"
+            await asyncio.sleep(30)
+            yield "never"
+        finally:
+            closed.append(True)
+
+    async def collect():
+        started = time.monotonic()
+        items = [item async for item in until(stalls(), time.monotonic() + 0.2)]
+        return items, time.monotonic() - started
+
+    items, elapsed = asyncio.run(collect())
+    assert items == ["a", "b"] and elapsed < 1 and closed == [True]
+
+
+def test_known_decode_rate_lowers_max_tokens_and_skips_continuation(monkeypatch):
+    rate = DecodeRate()
+    rate.observe("phi", 1.0, 200, 10.0)
+    assert rate.max_tokens("phi", 6.0) == 100 and rate.max_tokens("other", 6.0) is None
+    monkeypatch.setattr(deadline_module, "_rate", rate)
+    monkeypatch.setenv("DEADLINE_MIN_STAGE_SECONDS", "1")
+
+    agent = SlowAgent("Advisor-Agent", "advice", finish="length")
+    stage = StageAgent(agent, model_id="phi", max_continuations=2)
+
+    async def collect():
+        with request_deadline(6):
+            return [u async for u in stage.run_stream("Plan")]
+
+    updates = asyncio.run(collect())
+    assert len(agent.calls) == 1 and 90 <= agent.calls[0]["max_tokens"] <= 100
+    report = updates[-1].additional_properties["deadline"]
+    assert report["max_tokens"] == agent.calls[0]["max_tokens"] and not report.get("cut")
+
+
+def test_shared_stage_keeps_each_runs_deadline_to_itself(monkeypatch):
+    monkeypatch.setenv("DEADLINE_MIN_STAGE_SECONDS", "0.1")
+    monkeypatch.setattr(deadline_module, "_rate", DecodeRate())
+    # One wrapper serves every run, like the stages of the workflow built for DevUI.
+    stage = StageAgent(SlowAgent("Plan-Agent", "plan", chunks=10, delay=0.05))
+
+    async def collect(seconds, start_after):
+        await asyncio.sleep(start_after)
+        with request_deadline(seconds):
+            return [u async for u in stage.run_stream("Plan")]
+
+    async def both():
+        return await asyncio.gather(collect(None, 0), collect(0.2, 0.1))
+
+    unlimited, limited = asyncio.run(both())
+    assert "plan9" in "".join(u.text for u in unlimited)
+    assert not any((u.additional_properties or {}).get("deadline") for u in unlimited)
+    assert "plan9" not in "".join(u.text for u in limited) and limited[-1].additional_properties["deadline"]["cut"]
+
+
+def test_run_returns_partial_result_within_budget(monkeypatch, tmp_path):
+    monkeypatch.setenv("WORKFLOW_CHECKPOINT_DIR", str(tmp_path))
+    monkeypatch.setenv("DEADLINE_MIN_STAGE_SECONDS", "0.4")
+    monkeypatch.setattr(deadline_module, "_rate", DecodeRate())
+    agents = [
+        SlowAgent("Plan-Agent", "plan", chunks=40, delay=0.05),
+        SlowAgent("Researcher-Agent", "research"),
+        SlowAgent("Advisor-Agent", "advice"),
+    ]
+    monkeypatch.setattr(workflow_module, "_STAGES", tuple(
+        (stage_id, agent, ()) for stage_id, agent in zip(("plan_agent", "researcher_agent", "advisor_agent"), agents)
+    ))
+    client = TestClient(create_app())
+    assert client.post("/v1/workflow/runs", json={"prompt": "Plan", "deadline_seconds": "soon"}).status_code == 400
+
+    started = time.monotonic()
+    body = client.post("/v1/workflow/runs", json={"prompt": "Plan a launch", "deadline_seconds": 1.0}).json()
+    assert time.monotonic() - started < 1.5
+    assert body["output"] == "advice0 "
+    assert body["deadline"]["plan_agent"]["cut"] and body["deadline"]["researcher_agent"]["skipped"]
+    assert 3 <= len(body["stages"]["plan_agent"].split()) < 12
+    assert body["stages"]["researcher_agent"] == SKIPPED_NOTE and not agents[1].calls
+
+    # Without a deadline every stage runs to completion.
+    body = client.post("/v1/workflow/runs", json={"prompt": "Plan another launch"}).json()
+    assert body["deadline"] is None and len(body["stages"]["plan_agent"].split()) == 40
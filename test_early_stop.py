@@ -0,0 +1,90 @@
+"""Offline tests for structure-aware early stopping.
+
+These tests do not need Foundry Local: a fake agent streams a canned
+planner answer so the section tracking in `agent_runtime` can be checked.
+"""
+
+import asyncio
+
+from agent_framework import AgentRunResponseUpdate
+
+from agent_runtime import SectionTracker, StageAgent
+from plan_agent import PLAN_AGENT_SECTIONS
+
+PLAN_TEXT = (
+    "### 📋 PLAN OVERVIEW\nBuild a web app.\n\n"
+    "### 🎯 KEY OBJECTIVES\n1. Ship it\n\n"
+    "### 📅 STRUCTURED APPROACH\n**Phase 1: Setup**\n- Step 1: repo\n\n"
+    "### 🔍 RESEARCH PRIORITIES\nHosting options\n\n"
+    "### ⚡ NEXT STEPS\n- Create the repository\n- Invite the team\n\n"
+    "### Extra Thoughts\nI hope this helps! Let me also repeat the plan...\n"
+)
+
+
+class FakeAgent:
+    """Streams canned text in small chunks, like a chat model would."""
+
+    name = "Fake-Agent"
+
+    def __init__(self, text: str, chunk: int = 7):
+        self.text = text
+        self.chunk = chunk
+        self.closed = False
+        self.produced = 0
+
+    async def run_stream(self, messages=None, *, thread=None, **kwargs):
+        try:
+            for i in range(0, len(self.text), self.chunk):
+                self.produced = i + self.chunk
+                yield AgentRunResponseUpdate(text=self.text[i:i + self.chunk], role="assistant", message_id="m1")
+        finally:
+            self.closed = True
+
+
+def test_tracker_cuts_before_trailing_heading():
+    tracker = SectionTracker(PLAN_AGENT_SECTIONS)
+    tracker.feed(PLAN_TEXT)
+    assert tracker.complete
+    kept = tracker.text[:tracker.cut]
+    assert kept.rstrip().endswith("- Invite the team")
+    assert tracker.missing == []
+
+
+def test_tracker_ignores_headings_inside_think_blocks():
+    tracker = SectionTracker(["NEXT STEPS"])
+    tracker.feed("<think>\n### NEXT STEPS\n### Other\n</think>\n### NEXT STEPS\n- a\n")
+    assert not tracker.complete
+    tracker.feed("## Bonus\n")
+    assert tracker.complete
+
+
+def test_tracker_grace_limit_stops_at_paragraph_break():
+    tracker = SectionTracker(["NEXT STEPS"], grace_chars=20)
+    tracker.feed("### NEXT STEPS\n- one\n- two\n- three\n\nRambling on and on")
+    assert tracker.complete
+    assert tracker.text[:tracker.cut].endswith("- three\n")
+
+
+def test_stage_agent_stops_stream_and_closes_model():
+    fake = FakeAgent(PLAN_TEXT + "x" * 5000)
+    stage = StageAgent(fake, required_sections=PLAN_AGENT_SECTIONS, early_stop=True)
+
+    async def collect():
+        return "".join([u.text async for u in stage.run_stream([])])
+
+    text = asyncio.run(collect())
+    assert "Extra Thoughts" not in text
+    assert text.rstrip().endswith("- Invite the team")
+    assert fake.closed
+    assert fake.produced < len(fake.text)
+
+
+def test_stage_agent_passthrough_when_disabled():
+    fake = FakeAgent(PLAN_TEXT)
+    stage = StageAgent(fake, required_sections=PLAN_AGENT_SECTIONS, early_stop=False)
+
+    async def collect():
+        return "".join([u.text async for u in stage.run_stream([])])
+
+    assert asyncio.run(collect()) == PLAN_TEXT
+    assert stage.name == "Fake-Agent"
@@ -0,0 +1,77 @@
+"""Offline tests for the compact structured handoff between stages."""
+
+import asyncio
+import json
+
+from agent_framework import AgentRunResponseUpdate
+
+from agent_runtime import StageAgent
+from agent_runtime.handoff import markdown_to_handoff, parse_handoff, to_handoff
+
+SECTIONS = ("PLAN OVERVIEW", "KEY OBJECTIVES", "STRUCTURED APPROACH", "RESEARCH PRIORITIES", "NEXT STEPS")
+FIELDS = ("overview", "objectives", "phases", "research_priorities", "next_steps")
+
+MARKDOWN_PLAN = """### 📋 PLAN OVERVIEW
+Launch a **mobile app** in Q3.
+
+### 🎯 KEY OBJECTIVES
+1. Ship the MVP
+2. Reach 1,000 users
+
+### 📅 STRUCTURED APPROACH
+**Phase 1: Discovery**
+- Step 1: Interview 10 customers
+- Step 2: Define the MVP scope
+
+**Phase 2: Build**
+- Step 1: Implement core features
+
+### ⚡ NEXT STEPS
+- Book customer interviews
+"""
+
+
+class FakeAgent:
+    name = "Plan-Agent"
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    async def run_stream(self, messages=None, *, thread=None, **kwargs):
+        for chunk in self.chunks:
+            yield AgentRunResponseUpdate(text=chunk, role="assistant")
+
+
+def test_parse_json_answer_with_fence_and_reasoning():
+    text = '<think>plan it</think>```json\n{"overview": " Launch  app ", "objectives": ["MVP", ""], "extra": 1}\n```'
+    assert parse_handoff(text, FIELDS) == {"overview": "Launch app", "objectives": ["MVP"]}
+    assert parse_handoff("### PLAN OVERVIEW\nno json here", FIELDS) is None
+
+
+def test_markdown_answer_is_converted_by_section():
+    data = markdown_to_handoff(MARKDOWN_PLAN, SECTIONS, FIELDS)
+    assert data["overview"] == "Launch a mobile app in Q3."
+    assert data["objectives"] == ["Ship the MVP", "Reach 1,000 users"]
+    assert data["phases"] == {
+        "Phase 1: Discovery": ["Step 1: Interview 10 customers", "Step 2: Define the MVP scope"],
+        "Phase 2: Build": ["Step 1: Implement core features"],
+    }
+    assert "research_priorities" not in data
+
+    compact, report = to_handoff(MARKDOWN_PLAN, SECTIONS, FIELDS)
+    assert json.loads(compact)["next_steps"] == "Book customer interviews"
+    assert report["source"] == "markdown"
+    assert report["compact_tokens"] < report["markdown_tokens"]
+
+
+def test_stage_forwards_single_compact_update():
+    chunks = ['{"overview": "Launch', ' an app", "objectives": ["MVP"]}']
+    stage = StageAgent(FakeAgent(chunks), required_sections=SECTIONS, handoff_fields=FIELDS)
+
+    async def collect():
+        return [u async for u in stage.run_stream("Plan a launch")]
+
+    updates = asyncio.run(collect())
+    assert len(updates) == 1
+    assert updates[0].text == '{"overview":"Launch an app","objectives":["MVP"]}'
+    assert updates[0].additional_properties["handoff"]["source"] == "json"
@@ -0,0 +1,122 @@
+"""Offline tests for the job queue, the worker and the job endpoints.
+
+The agents are replaced by fakes, as in `test_service.py`.
+"""
+
+import asyncio
+
+from starlette.testclient import TestClient
+
+from service import create_app
+from service.jobs import JOB_CANCELLED, JOB_COMPLETED, JOB_FAILED, JOB_QUEUED, JOB_RUNNING, JobQueue
+from service.worker import JobWorker
+from test_service import _events, _install_fakes
+
+
+def test_queue_claims_reclaims_expired_leases_and_gives_up(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"), lease_seconds=60, max_attempts=2)
+    first = queue.submit("Plan a launch")
+    second = queue.submit("Plan a party")
+    assert queue.cancel(second.id).status == JOB_CANCELLED
+    assert queue.events(second.id) == [(1, "cancelled", {"job_id": second.id})]
+
+    claimed = queue.claim("worker-a")
+    assert claimed.id == first.id and claimed.attempts == 1
+    assert queue.claim("worker-b") is None
+    assert queue.renew(first.id, "worker-a") and not queue.renew(first.id, "worker-b")
+
+    # worker-a dies: once the lease runs out another worker takes the job over.
+    queue.lease_seconds = -1
+    queue.renew(first.id, "worker-a")
+    assert queue.claim("worker-b").attempts == 2
+    queue.renew(first.id, "worker-b")
+    assert queue.claim("worker-c") is None
+    assert queue.get(first.id).status == JOB_FAILED
+    assert queue.counts() == {JOB_FAILED: 1, JOB_CANCELLED: 1}
+
+
+def test_job_that_loses_its_workers_too_often_ends_with_an_error_event(monkeypatch, tmp_path):
+    monkeypatch.setenv("JOB_QUEUE_DB", str(tmp_path / "jobs.db"))
+    queue = JobQueue(lease_seconds=-1, max_attempts=2)
+    job = queue.submit("Plan a launch")
+    assert queue.claim("worker-a").attempts == 1
+    assert queue.claim("worker-b").attempts == 2
+    assert queue.claim("worker-c") is None
+
+    error = {"job_id": job.id, "error": "Worker lost too many times"}
+    assert queue.events(job.id) == [(1, "error", error)]
+    assert _events(TestClient(create_app()).get(f"/v1/jobs/{job.id}/events").text) == [("error", error)]
+
+
+def test_interactive_jobs_are_claimed_before_earlier_batch_jobs(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    first = queue.submit("Plan a launch")
+    second = queue.submit("Plan a party")
+    urgent = queue.submit("Plan a demo", priority="interactive")
+    assert [queue.claim("worker-a").id for _ in range(3)] == [urgent.id, first.id, second.id]
+
+
+def test_worker_retries_from_checkpoint_and_completes(monkeypatch, tmp_path):
+    _install_fakes(monkeypatch, tmp_path, advisor_fails=True)
+    queue = JobQueue(str(tmp_path / "jobs.db"), max_attempts=2)
+    worker = JobWorker(queue, name="worker-a")
+    job = queue.submit("Plan a launch")
+
+    assert asyncio.run(worker.run_job(queue.claim(worker.name))) == JOB_QUEUED
+    assert queue.get(job.id).error == "advisor timed out"
+
+    _install_fakes(monkeypatch, tmp_path)
+    assert asyncio.run(worker.run_job(queue.claim(worker.name))) == JOB_COMPLETED
+    finished = queue.get(job.id)
+    assert finished.status == JOB_COMPLETED and finished.result["output"] == "ADVICE"
+
+    names = [name for _, name, _ in queue.events(job.id)]
+    assert names.count("job_started") == 2 and "retrying" in names
+    replayed = [data["stage"] for _, name, data in queue.events(job.id) if name == "stage_completed" and data["replayed"]]
+    assert replayed == ["plan_agent", "researcher_agent"]
+
+
+def test_api_submits_polls_and_streams_job_events(monkeypatch, tmp_path):
+    _install_fakes(monkeypatch, tmp_path)
+    monkeypatch.setenv("JOB_QUEUE_DB", str(tmp_path / "jobs.db"))
+    client = TestClient(create_app())
+
+    response = client.post("/v1/jobs", json={"prompt": "Plan a launch"})
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+    assert client.get(f"/v1/jobs/{job_id}").json()["status"] == JOB_QUEUED
+    assert client.get("/v1/jobs/missing").status_code == 404
+    assert client.post("/v1/jobs", json={"prompt": " "}).status_code == 400
+
+    queue = JobQueue()
+    worker = JobWorker(queue, name="worker-a")
+    asyncio.run(worker.run_job(queue.claim(worker.name)))
+
+    assert client.get(f"/v1/jobs/{job_id}").json()["result"]["output"] == "ADVICE"
+    events = _events(client.get(f"/v1/jobs/{job_id}/events").text)
+    assert events[0][0] == "job_started" and events[-1][0] == "completed"
+
+    # Resuming after the last seen event only returns what came later.
+    last = len(queue.events(job_id))
+    resumed = _events(client.get(f"/v1/jobs/{job_id}/events", headers={"Last-Event-ID": str(last - 1)}).text)
+    assert [name for name, _ in resumed] == ["completed"]
+
+
+def test_job_stream_delivers_a_final_event_written_during_its_last_poll(monkeypatch, tmp_path):
+    monkeypatch.setenv("JOB_QUEUE_DB", str(tmp_path / "jobs.db"))
+    queue = JobQueue()
+    job = queue.submit("Plan a launch")
+    queue.claim("worker-a")
+    read = JobQueue.events
+
+    def events(self, job_id, after=0, limit=500):
+        found = read(self, job_id, after, limit)
+        if not found and queue.get(job_id).status == JOB_RUNNING:
+            # The worker finishes between this read and the stream's status check.
+            queue.append_events(job_id, [("completed", {"output": "ADVICE"})])
+            queue.finish(job_id, "worker-a", JOB_COMPLETED, result={"output": "ADVICE"})
+        return found
+
+    monkeypatch.setattr(JobQueue, "events", events)
+    client = TestClient(create_app())
+    assert _events(client.get(f"/v1/jobs/{job.id}/events").text) == [("completed", {"output": "ADVICE"})]
@@ -0,0 +1,131 @@
+"""Offline tests for load shedding to a fast model or the short workflow."""
+
+import asyncio
+import importlib
+
+from agent_framework import AgentRunResponse, AgentRunResponseUpdate, ChatMessage, Role
+from starlette.testclient import TestClient
+
+import agent_runtime.load_shedding as load_shedding_module
+from agent_runtime import StageAgent
+from agent_runtime.load_shedding import LoadShedder
+from service import create_app
+from workflow import WorkflowRun
+
+workflow_module = importlib.import_module("workflow.workflow")
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class Backlog:
+    pending = 0
+
+
+class RecordingAgent:
+    def __init__(self, name, text):
+        self.name = name
+        self.text = text
+        self.calls = []
+
+    def get_new_thread(self):
+        return None
+
+    async def run(self, messages=None, *, thread=None, **kwargs):
+        self.calls.append(kwargs)
+        return AgentRunResponse(messages=[ChatMessage(role=Role.ASSISTANT, text=self.text)])
+
+    async def run_stream(self, messages=None, *, thread=None, **kwargs):
+        self.calls.append(kwargs)
+        yield AgentRunResponseUpdate(text=self.text, role="assistant")
+
+
+def _install(monkeypatch, tmp_path, **shedder):
+    monkeypatch.setenv("WORKFLOW_CHECKPOINT_DIR", str(tmp_path))
+    agents = [RecordingAgent("Plan-Agent", "PLAN"), RecordingAgent("Researcher-Agent", "RESEARCH"), RecordingAgent("Advisor-Agent", "ADVICE")]
+    monkeypatch.setattr(workflow_module, "_STAGES", tuple(
+        (stage_id, agent, ()) for stage_id, agent in zip(("plan_agent", "researcher_agent", "advisor_agent"), agents)
+    ))
+    backlog = Backlog()
+    monkeypatch.setattr(load_shedding_module, "model_scheduler", lambda: backlog)
+    monkeypatch.setattr(load_shedding_module, "_shedder", LoadShedder(**shedder))
+    return agents, backlog
+
+
+def test_mode_follows_latency_and_queue_depth_with_hysteresis(monkeypatch):
+    monkeypatch.setenv("LOAD_SHED_RECOVER_SECONDS", "30")
+    monkeypatch.setenv("LOAD_SHED_WINDOW_SECONDS", "60")
+    backlog = Backlog()
+    monkeypatch.setattr(load_shedding_module, "model_scheduler", lambda: backlog)
+    clock = Clock()
+    shedder = LoadShedder(queue_depth=8, latency=10.0, fast_model="phi-mini", clock=clock)
+    assert shedder.action == "fast" and shedder.mode() == "full"
+
+    for seconds in (2.0, 3.0, 12.0):
+        shedder.observe(seconds)
+    assert shedder.mode() == "fast"
+
+    # Latency ages out of the window, but the queue is still long.
+    clock.now += 61
+    backlog.pending = 8
+    assert shedder.mode() == "fast"
+    backlog.pending = 6
+    clock.now += 60
+    assert shedder.mode() == "fast"  # 75% of the threshold is not calm enough
+
+    backlog.pending = 2
+    assert shedder.mode() == "fast"
+    clock.now += 29
+    assert shedder.mode() == "fast"
+    clock.now += 2
+    assert shedder.mode() == "full"
+    assert LoadShedder(queue_depth=0, latency=0).mode() == "full"
+
+
+def test_fast_mode_routes_selected_stages_to_the_fast_model(monkeypatch, tmp_path):
+    agents, backlog = _install(monkeypatch, tmp_path, queue_depth=2, fast_model="phi-mini", stages=("researcher_agent",))
+    backlog.pending = 3
+    run = WorkflowRun("Plan a launch")
+    assert run.mode == "fast"
+    assert WorkflowRun("Another request").mode == "fast"
+
+    assert asyncio.run(run.run()) == "ADVICE"
+    assert [agent.calls[0].get("model_id") for agent in agents] == [None, "phi-mini", None]
+    assert run.checkpoint.status == "completed"
+
+
+def test_short_mode_skips_the_researcher_and_is_reported(monkeypatch, tmp_path):
+    agents, backlog = _install(monkeypatch, tmp_path, queue_depth=2)
+    backlog.pending = 5
+    client = TestClient(create_app())
+    assert client.get("/health").json()["load_pressure"] == 2.5
+
+    response = client.post("/v1/workflow/runs", json={"prompt": "Plan a launch"})
+    body = response.json()
+    assert response.headers["X-Serving-Mode"] == "short"
+    assert body["serving_mode"] == "short" and body["output"] == "ADVICE"
+    assert body["stages"] == {"plan_agent": "PLAN", "advisor_agent": "ADVICE"}
+    assert not agents[1].calls
+
+    # The load has dropped, but the mode only recovers after a calm period.
+    backlog.pending = 0
+    assert client.post("/v1/workflow/runs", json={"prompt": "Plan a launch"}).json()["serving_mode"] == "short"
+
+
+def test_only_streamed_stages_feed_the_latency_signal(monkeypatch, tmp_path):
+    _install(monkeypatch, tmp_path, latency=10.0, fast_model="phi-mini")
+    stage = StageAgent(RecordingAgent("Plan-Agent", "PLAN"))
+    # A whole non-streamed generation is not a time to first token.
+    assert asyncio.run(stage.run("Plan a launch")).text == "PLAN"
+    assert len(load_shedding_module.load_shedder()._samples) == 0
+
+    async def stream():
+        return [u async for u in stage.run_stream("Plan a launch")]
+
+    asyncio.run(stream())
+    assert len(load_shedding_module.load_shedder()._samples) == 1
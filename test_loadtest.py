@@ -0,0 +1,47 @@
+"""Offline tests for the load-test harness and the mock model server."""
+
+import json
+
+from starlette.testclient import TestClient
+
+from loadtest.harness import percentile, start_offsets
+from loadtest.mock_server import create_app
+
+
+def test_ramp_profiles():
+    assert start_offsets("constant", 3, 10) == [0.0, 0.0, 0.0]
+    assert start_offsets("linear", 4, 8) == [0.0, 2.0, 4.0, 6.0]
+    assert start_offsets("step", 4, 10, steps=2) == [0.0, 0.0, 5.0, 5.0]
+    spike = start_offsets("spike", 4, 10)
+    assert spike[:2] == [0.0, 5.0] and spike[2:] == [10, 10]
+
+
+def test_percentile_nearest_rank():
+    values = [float(v) for v in range(1, 101)]
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 95) == 95.0
+    assert percentile(values, 99) == 99.0
+    assert percentile([], 50) is None
+
+
+def test_mock_server_streams_agent_skeleton():
+    client = TestClient(create_app(ttft=0, tokens_per_second=0, output_tokens=40))
+    body = {
+        "model": "mock-model",
+        "stream": True,
+        "messages": [
+            {"role": "system", "content": "You are a senior advisor."},
+            {"role": "user", "content": "Plan a project"},
+        ],
+    }
+    response = client.post("/v1/chat/completions", json=body)
+    chunks = [json.loads(line[6:]) for line in response.text.splitlines() if line.startswith("data: {")]
+    text = "".join(c["choices"][0]["delta"].get("content", "") for c in chunks)
+    assert "EXECUTIVE SUMMARY" in text and "ADDITIONAL CONSIDERATIONS" in text
+    assert chunks[-1]["choices"][0]["finish_reason"] == "stop"
+
+    body["stream"] = False
+    body["max_tokens"] = 5
+    result = client.post("/v1/chat/completions", json=body).json()
+    assert result["choices"][0]["finish_reason"] == "length"
+    assert result["usage"]["completion_tokens"] == 5
@@ -0,0 +1,53 @@
+"""Offline tests for the event-loop watchdog and the metrics export."""
+
+import asyncio
+import time
+
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from agent_runtime.loop_watchdog import BLOCKED, LoopWatchdog
+from agent_runtime.metrics import MetricsRegistry, install_metrics
+
+
+def blocking_call_on_the_loop():
+    time.sleep(0.3)
+
+
+def test_watchdog_logs_stack_of_blocking_call():
+    async def scenario():
+        watchdog = LoopWatchdog(interval=0.01, threshold=0.1)
+        watchdog.start()
+        await asyncio.sleep(0.05)
+        blocking_call_on_the_loop()
+        await asyncio.sleep(0.05)
+        await watchdog.stop()
+        return watchdog
+
+    before = BLOCKED.value()
+    watchdog = asyncio.run(scenario())
+    assert len(watchdog.blocked_stacks) == 1
+    assert "blocking_call_on_the_loop" in watchdog.blocked_stacks[0]
+    assert BLOCKED.value() == before + 1
+
+
+def test_summary_quantiles_in_prometheus_text():
+    registry = MetricsRegistry()
+    lag = registry.summary("lag_seconds", "Loop lag")
+    for value in range(1, 101):
+        lag.observe(value / 1000)
+    registry.counter("runs_total", "Runs").inc(entry="chainlit")
+    text = registry.render()
+    assert 'lag_seconds{quantile="0.95"} 0.095' in text
+    assert "lag_seconds_count 100" in text
+    assert 'runs_total{entry="chainlit"} 1' in text
+
+
+def test_metrics_route_precedes_catch_all():
+    app = Starlette(routes=[Route("/{path:path}", lambda request: PlainTextResponse("frontend"))])
+    install_metrics(app)
+    response = TestClient(app).get("/metrics")
+    assert response.status_code == 200
+    assert response.text != "frontend"
@@ -0,0 +1,105 @@
+"""Offline tests for completion-length statistics and adaptive max_tokens."""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from agent_framework import AgentRunResponseUpdate
+from starlette.testclient import TestClient
+
+import agent_runtime.output_stats as output_stats_module
+from agent_runtime import StageAgent
+from agent_runtime.output_stats import OutputStats, record_completion
+from service import create_app
+from test_service import _install_fakes
+
+
+class RecordingAgent:
+    name = "Advisor-Agent"
+
+    def __init__(self, words):
+        self.words = words
+        self.kwargs = []
+
+    async def run_stream(self, messages=None, *, thread=None, **kwargs):
+        self.kwargs.append(kwargs)
+        for _ in range(self.words):
+            yield AgentRunResponseUpdate(text="word ", role="assistant")
+
+
+def _stats(monkeypatch, tmp_path, **env):
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    stats = OutputStats(str(tmp_path / "stats.json"))
+    monkeypatch.setattr(output_stats_module, "_stats", stats)
+    return stats
+
+
+def test_limit_follows_p95_and_survives_restart(monkeypatch, tmp_path):
+    stats = _stats(monkeypatch, tmp_path, ADAPTIVE_MAX_TOKENS_MIN_SAMPLES="5", ADAPTIVE_MAX_TOKENS_FLOOR="10")
+    for tokens in (100, 200, 300, 400):
+        stats.observe("Plan-Agent", "phi", tokens)
+    assert stats.limit("Plan-Agent", "phi") is None
+    stats.observe("Plan-Agent", "phi", 1000)
+    assert stats.limit("Plan-Agent", "phi") == 1500
+    assert stats.limit("Plan-Agent", "qwen") is None
+
+    stats.save()
+    monkeypatch.setenv("ADAPTIVE_MAX_TOKENS_CEILING", "1200")
+    reloaded = OutputStats(str(tmp_path / "stats.json"))
+    assert reloaded.p95("Plan-Agent", "phi") == 1000
+    assert reloaded.limit("Plan-Agent", "phi") == 1200
+
+
+def test_stage_records_lengths_and_applies_adaptive_limit(monkeypatch, tmp_path):
+    stats = _stats(monkeypatch, tmp_path, ADAPTIVE_MAX_TOKENS_MIN_SAMPLES="2", ADAPTIVE_MAX_TOKENS_FLOOR="1")
+    agent = RecordingAgent(words=40)
+    stage = StageAgent(agent)
+
+    async def run(**kwargs):
+        return [u async for u in stage.run_stream("Advise me", **kwargs)]
+
+    monkeypatch.setenv("ADAPTIVE_MAX_TOKENS", "true")
+    for _ in range(3):
+        asyncio.run(run())
+    assert "max_tokens" not in agent.kwargs[0] and "max_tokens" not in agent.kwargs[1]
+    assert agent.kwargs[2]["max_tokens"] == 60
+    assert stats.snapshot()[0]["samples"] == 3
+
+    asyncio.run(run(max_tokens=500))
+    assert agent.kwargs[3]["max_tokens"] == 500
+
+    monkeypatch.setenv("ADAPTIVE_MAX_TOKENS", "false")
+    asyncio.run(run())
+    assert "max_tokens" not in agent.kwargs[4]
+
+
+def test_statistics_are_listed_by_the_api(monkeypatch, tmp_path):
+    _install_fakes(monkeypatch, tmp_path)
+    stats = _stats(monkeypatch, tmp_path)
+    stats.observe("Plan-Agent", "phi", 120)
+    body = TestClient(create_app()).get("/v1/stats/output-tokens").json()
+    assert body["stages"] == [
+        {"stage": "Plan-Agent", "model": "phi", "samples": 1, "p50": 120, "p95": 120, "max": 120, "max_tokens": None}
+    ]
+
+
+def test_saves_are_debounced_and_do_not_clash(monkeypatch, tmp_path):
+    stats = _stats(monkeypatch, tmp_path, MAX_TOKENS_SAVE_SECONDS="0.05")
+    save = stats.save
+    saves = []
+    monkeypatch.setattr(stats, "save", lambda: (saves.append(1), save()))
+
+    async def completions():
+        for tokens in range(1, 11):
+            record_completion("Plan-Agent", "phi", tokens * 100)
+        await asyncio.sleep(0.3)
+
+    asyncio.run(completions())
+    assert len(saves) == 1
+    assert OutputStats(str(tmp_path / "stats.json")).p95("Plan-Agent", "phi") == 1000
+
+    # Saves from several threads each use their own temporary file.
+    with ThreadPoolExecutor(4) as pool:
+        for future in [pool.submit(save) for _ in range(200)]:
+            future.result()
+    assert [p.name for p in tmp_path.iterdir()] == ["stats.json"]
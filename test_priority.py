@@ -0,0 +1,71 @@
+"""Offline tests for interactive/batch priority scheduling of model calls."""
+
+import asyncio
+
+from starlette.testclient import TestClient
+
+from agent_runtime.metrics import REGISTRY
+from agent_runtime.priority import BATCH, INTERACTIVE, ModelScheduler, current_priority, priority_class
+from service import create_app
+from test_service import _install_fakes
+
+
+async def _grant_order(scheduler, holder, arrivals):
+    """Queue `arrivals` behind a held slot and return the order they are served in."""
+    order = []
+    release = asyncio.Event()
+
+    async def hold():
+        async with scheduler.slot(holder):
+            await release.wait()
+
+    async def use(name, priority):
+        async with scheduler.slot(priority):
+            order.append(name)
+
+    holding = asyncio.create_task(hold())
+    await asyncio.sleep(0)
+    waiting = [asyncio.create_task(use(name, priority)) for name, priority in arrivals]
+    await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(holding, *waiting)
+    return order
+
+
+def test_interactive_overtakes_queued_batch_work():
+    scheduler = ModelScheduler(1, batch_min_share=0.2)
+    arrivals = [("b1", BATCH), ("i1", INTERACTIVE), ("i2", INTERACTIVE)]
+    assert asyncio.run(_grant_order(scheduler, BATCH, arrivals)) == ["i1", "i2", "b1"]
+    assert scheduler.active == 0
+
+    with priority_class(BATCH):
+        assert current_priority() == BATCH
+    assert current_priority() == INTERACTIVE
+
+
+def test_batch_keeps_its_minimum_share():
+    scheduler = ModelScheduler(1, batch_min_share=0.5)
+    arrivals = [("b1", BATCH), ("b2", BATCH), ("i1", INTERACTIVE), ("i2", INTERACTIVE), ("i3", INTERACTIVE)]
+    assert asyncio.run(_grant_order(scheduler, INTERACTIVE, arrivals)) == ["b1", "i1", "b2", "i2", "i3"]
+
+
+def test_cancelled_waiter_frees_its_place_and_waits_are_reported(monkeypatch, tmp_path):
+    scheduler = ModelScheduler(1)
+
+    async def scenario():
+        async with scheduler.slot(INTERACTIVE):
+            waiter = asyncio.create_task(scheduler.slot(BATCH).__aenter__())
+            await asyncio.sleep(0)
+            assert scheduler.waiting(BATCH) == 1
+            waiter.cancel()
+            await asyncio.gather(waiter, return_exceptions=True)
+        assert scheduler.waiting(BATCH) == 0 and scheduler.active == 0
+
+    asyncio.run(scenario())
+    assert REGISTRY.get("model_queue_wait_seconds").count(priority=INTERACTIVE) >= 1
+
+    _install_fakes(monkeypatch, tmp_path)
+    monkeypatch.setenv("JOB_QUEUE_DB", str(tmp_path / "jobs.db"))
+    client = TestClient(create_app())
+    assert client.post("/v1/workflow/runs", json={"prompt": "Plan", "priority": "urgent"}).status_code == 400
+    assert client.post("/v1/jobs", json={"prompt": "Plan"}).json()["priority"] == BATCH
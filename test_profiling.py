@@ -0,0 +1,79 @@
+"""Offline tests for the on-demand request profiler."""
+
+import asyncio
+import threading
+import time
+
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from agent_runtime.profiling import IDLE_FRAME, RequestProfile, install_profiling, should_profile
+
+
+def busy_python_work(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        sum(range(100))
+
+
+def test_modes(monkeypatch):
+    monkeypatch.delenv("PROFILE_MODE", raising=False)
+    assert not should_profile({"x-profile": "1"})
+    monkeypatch.setenv("PROFILE_MODE", "header")
+    assert should_profile({"X-Profile": "1"})
+    assert should_profile({"HTTP_X_PROFILE": "true"})
+    assert not should_profile({})
+    monkeypatch.setenv("PROFILE_MODE", "always")
+    assert should_profile(None)
+
+
+def test_profile_separates_python_work_from_waiting(tmp_path):
+    async def request():
+        busy_python_work(0.1)
+        await asyncio.sleep(0.1)
+
+    with RequestProfile("unit test", directory=str(tmp_path), interval=0.002) as profile:
+        asyncio.run(request())
+
+    lines = profile.path.read_text().splitlines()
+    assert profile.path.suffix == ".folded"
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+    assert any("busy_python_work" in line for line in lines)
+    assert any(IDLE_FRAME in line for line in lines)
+    assert 0 < profile.profiler.idle_samples < profile.profiler.samples
+
+
+def test_async_profile_writes_its_file_off_the_event_loop(monkeypatch, tmp_path):
+    writers = []
+    write_text = type(tmp_path).write_text
+
+    def record_writer(path, *args, **kwargs):
+        writers.append(threading.current_thread() is threading.main_thread())
+        return write_text(path, *args, **kwargs)
+
+    async def request():
+        async with RequestProfile("async test", directory=str(tmp_path), interval=0.002) as profile:
+            busy_python_work(0.05)
+        return profile
+
+    monkeypatch.setattr(type(tmp_path), "write_text", record_writer)
+    profile = asyncio.run(request())
+    assert writers == [False] and profile.path.exists()
+    assert "busy_python_work" in profile.path.read_text()
+
+
+def test_middleware_only_installed_when_enabled(monkeypatch, tmp_path):
+    app = Starlette(routes=[Route("/", lambda request: PlainTextResponse("ok"))])
+    monkeypatch.delenv("PROFILE_MODE", raising=False)
+    assert not install_profiling(app)
+
+    monkeypatch.setenv("PROFILE_MODE", "header")
+    monkeypatch.setenv("PROFILE_DIR", str(tmp_path))
+    assert install_profiling(app)
+    client = TestClient(app)
+    client.get("/")
+    assert not list(tmp_path.iterdir())
+    client.get("/", headers={"X-Profile": "1"})
+    assert len(list(tmp_path.glob("*.folded"))) == 1
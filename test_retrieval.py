@@ -0,0 +1,102 @@
+"""Offline tests for the memory-mapped document index and the researcher's retrieval tool."""
+
+import asyncio
+import os
+
+import agent_runtime.retrieval as retrieval
+from agent_runtime.retrieval import DocumentIndex, build_index, chunk_text, research_tools
+
+ZERO_TRUST = (
+    "# Zero trust rollout\n\n"
+    "Start with an inventory of identities and devices before any microsegmentation.\n\n"
+    "Enforce multi-factor authentication on every administrative account."
+)
+MARKETING = "# Launch plan\n\nA product launch needs a positioning statement, pricing research and a channel plan."
+
+
+def _corpus(tmp_path):
+    docs = tmp_path / "docs"
+    (docs / "security").mkdir(parents=True)
+    (docs / "security" / "zero-trust.md").write_text(ZERO_TRUST)
+    (docs / "marketing.txt").write_text(MARKETING)
+    (docs / "image.png").write_bytes(b"\x89PNG")
+    for n in range(20):
+        (docs / f"filler-{n}.md").write_text(f"Weekly status note {n}.\n\nNothing notable happened this week.")
+    return docs
+
+
+def test_chunks_keep_whole_paragraphs():
+    text = "\n\n".join(" ".join(f"p{n}w{i}" for i in range(40)) for n in range(5))
+    chunks = list(chunk_text(text, 100))
+    assert [len(c.split()) for c in chunks] == [80, 80, 40]
+    assert all(c.split()[0].endswith("w0") for c in chunks)
+    assert [len(c.split()) for c in chunk_text(" ".join(["x"] * 250), 100)] == [100, 100, 50]
+
+
+def test_index_ranks_relevant_passages_and_reloads_after_rebuild(tmp_path):
+    docs = _corpus(tmp_path)
+    meta = build_index(str(docs), str(tmp_path / "index"), chunk_words=50)
+    assert meta["documents"] == 22 and meta["chunks"] == 22
+
+    index = DocumentIndex(str(tmp_path / "index"))
+    [hit] = index.search("microsegmentation inventory", top_k=3)
+    assert hit.source == "security/zero-trust.md" and "multi-factor" in hit.text
+    assert [h.source for h in index.search("launch pricing", top_k=1)] == ["marketing.txt"]
+    assert index.search("kubernetes") == []
+
+    # A rebuild replaces the directory; the open index keeps working.
+    (docs / "marketing.txt").write_text(MARKETING + "\n\nKubernetes hosting for the launch site.")
+    build_index(str(docs), str(tmp_path / "index"), chunk_words=50)
+    assert index.search("launch pricing", top_k=1)[0].source == "marketing.txt"
+    assert DocumentIndex(str(tmp_path / "index")).search("kubernetes")[0].source == "marketing.txt"
+    assert not list(tmp_path.glob("index.*"))
+
+
+def test_tool_finds_an_index_built_after_it_was_registered(monkeypatch, tmp_path):
+    monkeypatch.delenv("RESEARCH_INDEX_DIR", raising=False)
+    assert research_tools() == []
+    monkeypatch.setenv("RESEARCH_INDEX_DIR", str(tmp_path / "index"))
+    [tool] = research_tools()
+    assert tool.name == "search_documents"
+    assert asyncio.run(retrieval.search_documents("authentication")).startswith("The local document library is not available")
+
+    build_index(str(_corpus(tmp_path)), chunk_words=50)
+    result = asyncio.run(retrieval.search_documents("multi-factor authentication", top_k=1))
+    assert result.startswith("[1] security/zero-trust.md\n# Zero trust rollout")
+    assert asyncio.run(retrieval.search_documents("kubernetes")).startswith("No matching passages")
+
+
+def test_unreadable_index_is_skipped_and_a_rebuild_retires_cached_answers(monkeypatch, tmp_path):
+    from workflow.cache import workflow_fingerprint
+
+    monkeypatch.setenv("RESEARCH_INDEX_DIR", str(tmp_path / "index"))
+    docs = _corpus(tmp_path)
+    build_index(str(docs), chunk_words=50)
+    before = workflow_fingerprint()
+    build_index(str(docs), chunk_words=50)
+    assert workflow_fingerprint() != before
+
+    # Half-swapped by a rebuild, then from an incompatible version: no index, no error.
+    (tmp_path / "index" / "chunks.bin").unlink()
+    os.utime(tmp_path / "index" / "meta.json", (1, 1))
+    assert retrieval.document_index() is None
+    (tmp_path / "index" / "meta.json").write_text('{"version": -1}')
+    assert retrieval.document_index() is None
+
+
+def test_passages_are_capped_by_tokens(monkeypatch):
+    from agent_runtime.tokens import get_tokenizer
+
+    tokenizer = get_tokenizer()
+    hits = [retrieval.SearchHit(n, 1.0, f"doc-{n}.md", " ".join(f"word{n}x{i}" for i in range(200))) for n in range(5)]
+    assert retrieval.format_hits(hits) == retrieval.format_hits(hits, 0, tokenizer)
+    one = tokenizer.count(retrieval.format_hits(hits[:1]))
+
+    capped = retrieval.format_hits(hits, one + 100, tokenizer)
+    assert capped.startswith("[1] doc-0.md") and "[2] doc-1.md" in capped and "[3]" not in capped
+    assert capped.endswith("(3 more passages left out to stay within the token budget.)")
+    assert tokenizer.count(capped) < one + 150
+
+    monkeypatch.setenv("RESEARCH_MAX_TOKENS", "4000")
+    monkeypatch.setenv("MODEL_CONTEXT_WINDOW", "4096")
+    assert retrieval.result_tokens() == 1024
@@ -0,0 +1,139 @@
+"""Offline tests for the headless HTTP API.
+
+The agents are replaced by fakes, as in `test_checkpoint.py`.
+"""
+
+import asyncio
+import importlib
+import json
+import threading
+
+import pytest
+from agent_framework import AgentRunResponseUpdate
+from starlette.requests import ClientDisconnect, Request
+from starlette.testclient import TestClient
+
+import service.api as api_module
+from service import create_app
+from workflow import WorkflowRun
+
+workflow_module = importlib.import_module("workflow.workflow")
+
+
+class FakeStageAgent:
+    def __init__(self, name, chunks, fail=False):
+        self.name = name
+        self.chunks = chunks
+        self.fail = fail
+
+    def get_new_thread(self):
+        return None
+
+    async def run_stream(self, messages=None, *, thread=None, **kwargs):
+        if self.fail:
+            raise TimeoutError("advisor timed out")
+        for chunk in self.chunks:
+            yield AgentRunResponseUpdate(text=chunk, role="assistant")
+
+
+def _install_fakes(monkeypatch, tmp_path, advisor_fails=False):
+    monkeypatch.setenv("WORKFLOW_CHECKPOINT_DIR", str(tmp_path))
+    monkeypatch.setattr(workflow_module, "_STAGES", (
+        ("plan_agent", FakeStageAgent("Plan-Agent", ["PL", "AN"]), ()),
+        ("researcher_agent", FakeStageAgent("Researcher-Agent", ["RESEARCH"]), ()),
+        ("advisor_agent", FakeStageAgent("Advisor-Agent", ["ADV", "ICE"], fail=advisor_fails), ()),
+    ))
+
+
+def _events(text):
+    events = []
+    for block in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":"))
+        if lines:
+            events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_json_mode_returns_all_stages(monkeypatch, tmp_path):
+    _install_fakes(monkeypatch, tmp_path)
+    client = TestClient(create_app())
+    assert client.get("/health").json()["agents_ready"] is True
+
+    response = client.post("/v1/workflow/runs", json={"prompt": "Plan a launch"})
+    body = response.json()
+    assert response.status_code == 200
+    assert body["output"] == "ADVICE"
+    assert body["stages"] == {"plan_agent": "PLAN", "researcher_agent": "RESEARCH", "advisor_agent": "ADVICE"}
+
+
+def test_sse_mode_streams_per_stage_and_reports_errors(monkeypatch, tmp_path):
+    _install_fakes(monkeypatch, tmp_path, advisor_fails=True)
+    client = TestClient(create_app())
+    response = client.post("/v1/workflow/runs", json={"prompt": "Plan a launch", "stream": True})
+    events = _events(response.text)
+    names = [name for name, _ in events]
+    assert names[:4] == ["stage_started", "delta", "delta", "stage_completed"]
+    assert ("delta", {"stage": "plan_agent", "text": "PL"}) in events
+    assert names[-1] == "error"
+    assert events[-1][1]["next_stage"] == "advisor_agent"
+
+    _install_fakes(monkeypatch, tmp_path)
+    retry = _events(client.post("/v1/workflow/runs", json={"prompt": "Plan a launch", "stream": True}).text)
+    replayed = [data["stage"] for name, data in retry if name == "stage_completed" and data["replayed"]]
+    assert replayed == ["plan_agent", "researcher_agent"]
+    assert retry[-1][0] == "completed" and retry[-1][1]["output"] == "ADVICE"
+
+
+def test_rejects_invalid_requests(monkeypatch, tmp_path):
+    _install_fakes(monkeypatch, tmp_path)
+    client = TestClient(create_app())
+    assert client.post("/v1/workflow/runs", json={"prompt": ""}).status_code == 400
+    assert client.post("/v1/workflow/runs", content=b"nope").status_code == 400
+    assert client.post("/v1/workflow/runs", json={"run_id": "missing"}).status_code == 404
+    assert client.post("/v1/workflow/runs", json={"run_id": 42}).status_code == 400
+
+
+def _request(body):
+    payload = json.dumps(body).encode()
+
+    async def receive():
+        return {"type": "http.request", "body": payload, "more_body": False}
+
+    return Request({"type": "http", "method": "POST", "path": "/v1/workflow/runs", "headers": []}, receive)
+
+
+def test_stream_runs_hold_their_slot_from_the_handler(monkeypatch, tmp_path):
+    _install_fakes(monkeypatch, tmp_path)
+    monkeypatch.setenv("SERVICE_MAX_CONCURRENT_RUNS", "1")
+    built = []
+
+    def workflow_run(*args, **kwargs):
+        built.append(threading.current_thread())
+        return WorkflowRun(*args, **kwargs)
+
+    monkeypatch.setattr(api_module, "WorkflowRun", workflow_run)
+    app = create_app()
+    create_run = next(route.endpoint for route in app.routes if route.path == "/v1/workflow/runs")
+
+    async def disconnected():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        raise OSError("connection reset")
+
+    async def scenario():
+        first = await create_run(_request({"prompt": "Plan a launch", "stream": True}))
+        # The first body has not started, yet its run already counts.
+        second = await create_run(_request({"prompt": "Plan a product", "stream": True}))
+        # Rejected before any checkpoint or cache lookup.
+        assert second.status_code == 503 and len(built) == 1
+        # The client goes away before the body starts: the slot is given back.
+        with pytest.raises(ClientDisconnect):
+            await first({"type": "http", "asgi": {"spec_version": "2.4"}}, disconnected, send)
+        third = await create_run(_request({"prompt": "Plan a product"}))
+        assert third.status_code == 200
+
+    asyncio.run(scenario())
+    assert TestClient(app).get("/health").json()["active_runs"] == 0
+    # Runs are built off the event loop's thread.
+    assert len(built) == 2 and threading.main_thread() not in built
@@ -0,0 +1,175 @@
+"""Offline tests for single-flight coalescing of identical concurrent runs."""
+
+import asyncio
+import importlib
+
+import httpx
+from agent_framework import AgentRunResponseUpdate
+
+from agent_runtime.priority import BATCH, priority_class
+from agent_runtime.singleflight import REQUESTS
+from agent_runtime.stage import SKIPPED_NOTE
+from service import create_app
+from workflow import WorkflowRun
+
+workflow_module = importlib.import_module("workflow.workflow")
+
+
+class GatedAgent:
+    """Streams its chunks once `gate` is set, counting how often it runs."""
+
+    def __init__(self, name, chunks, gate, fail=False):
+        self.name = name
+        self.chunks = chunks
+        self.gate = gate
+        self.fail = fail
+        self.calls = 0
+
+    def get_new_thread(self):
+        return None
+
+    async def run_stream(self, messages=None, *, thread=None, **kwargs):
+        self.calls += 1
+        await self.gate.wait()
+        if self.fail:
+            raise TimeoutError("advisor timed out")
+        for chunk in self.chunks:
+            yield AgentRunResponseUpdate(text=chunk, role="assistant")
+
+
+def _install(monkeypatch, tmp_path, advisor_fails=False):
+    monkeypatch.setenv("WORKFLOW_CHECKPOINT_DIR", str(tmp_path))
+    gates = [asyncio.Event() for _ in range(3)]
+    agents = [
+        GatedAgent("Plan-Agent", ["PL", "AN"], gates[0]),
+        GatedAgent("Researcher-Agent", ["RESEARCH"], gates[1]),
+        GatedAgent("Advisor-Agent", ["ADV", "ICE"], gates[2], fail=advisor_fails),
+    ]
+    monkeypatch.setattr(workflow_module, "_STAGES", tuple(
+        (stage_id, agent, ()) for stage_id, agent in zip(("plan_agent", "researcher_agent", "advisor_agent"), agents)
+    ))
+    return gates, agents
+
+
+def _describe(event):
+    data = getattr(event, "data", None)
+    return type(event).__name__, getattr(event, "executor_id", None), getattr(data, "text", None)
+
+
+async def _collect(run):
+    return [_describe(event) async for event in run.stream()]
+
+
+def test_concurrent_identical_requests_share_one_run(monkeypatch, tmp_path):
+    async def scenario():
+        gates, agents = _install(monkeypatch, tmp_path)
+        followers = REQUESTS.value(group="workflow", role="follower")
+        leader = WorkflowRun("Plan a launch")
+        first = asyncio.create_task(_collect(leader))
+        gates[0].set()
+        await asyncio.sleep(0.05)
+        # Joins after the planner finished and still sees every event.
+        late = WorkflowRun("  Plan a launch ")
+        second = asyncio.create_task(_collect(late))
+        await asyncio.sleep(0.05)
+        gates[1].set()
+        gates[2].set()
+        return await first, await second, leader, late, agents, followers
+
+    events, late_events, leader, late, agents, followers = asyncio.run(scenario())
+    assert late_events == events
+    assert ("AgentRunUpdateEvent", "plan_agent", "PL") in late_events
+    assert [agent.calls for agent in agents] == [1, 1, 1]
+    assert late.shared and not leader.shared
+    assert late.run_id == leader.run_id and late.final_text == "ADVICE"
+    assert REQUESTS.value(group="workflow", role="follower") == followers + 1
+
+
+def test_shared_run_outlives_a_disconnected_caller_and_propagates_errors(monkeypatch, tmp_path):
+    async def scenario():
+        gates, agents = _install(monkeypatch, tmp_path, advisor_fails=True)
+        first = asyncio.create_task(_collect(WorkflowRun("Plan a launch")))
+        await asyncio.sleep(0.01)
+        follower = WorkflowRun("Plan a launch")
+        second = asyncio.create_task(_collect(follower))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        for gate in gates:
+            gate.set()
+        try:
+            await second
+        except TimeoutError as exc:
+            return follower, agents, exc
+
+    follower, agents, error = asyncio.run(scenario())
+    assert str(error) == "advisor timed out"
+    assert [agent.calls for agent in agents] == [1, 1, 1]
+    assert follower.outputs == {"plan_agent": "PLAN", "researcher_agent": "RESEARCH"}
+    assert follower.checkpoint.status == "failed"
+
+
+def test_last_caller_leaving_cancels_the_run_and_opt_out_runs_alone(monkeypatch, tmp_path):
+    async def cancelled():
+        gates, agents = _install(monkeypatch, tmp_path)
+        run = WorkflowRun("Plan a launch")
+        task = asyncio.create_task(_collect(run))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.sleep(0.01)
+        return run
+
+    run = asyncio.run(cancelled())
+    assert run.checkpoint.status == "failed" and run.next_stage == "plan_agent"
+
+    async def separate():
+        gates, agents = _install(monkeypatch, tmp_path)
+        for gate in gates:
+            gate.set()
+        runs = [WorkflowRun("Plan a launch", resume=False, coalesce=False) for _ in range(2)]
+        await asyncio.gather(*(_collect(r) for r in runs))
+        return runs, agents
+
+    runs, agents = asyncio.run(separate())
+    assert [agent.calls for agent in agents] == [2, 2, 2]
+    assert runs[0].run_id != runs[1].run_id and not any(r.shared for r in runs)
+
+
+def test_requests_with_different_deadlines_do_not_share_a_run(monkeypatch, tmp_path):
+    async def scenario():
+        gates, agents = _install(monkeypatch, tmp_path)
+        transport = httpx.ASGITransport(app=create_app())
+        async with httpx.AsyncClient(transport=transport, base_url="http://api") as client:
+            # One second leaves no time for the optional research step.
+            hurried = asyncio.create_task(client.post("/v1/workflow/runs", json={"prompt": "Plan a launch", "deadline_seconds": 1}))
+            await asyncio.sleep(0.05)
+            patient = asyncio.create_task(client.post("/v1/workflow/runs", json={"prompt": "Plan a launch"}))
+            await asyncio.sleep(0.05)
+            for gate in gates:
+                gate.set()
+            return (await hurried).json(), (await patient).json(), agents
+
+    hurried, patient, agents = asyncio.run(scenario())
+    assert agents[0].calls == 2 and not hurried["shared"] and not patient["shared"]
+    assert hurried["stages"]["researcher_agent"] == SKIPPED_NOTE and hurried["deadline"]["researcher_agent"]["skipped"]
+    assert patient["stages"]["researcher_agent"] == "RESEARCH" and patient["deadline"] is None
+    assert patient["run_id"] != hurried["run_id"]
+
+
+def test_interactive_request_does_not_join_a_batch_run(monkeypatch, tmp_path):
+    async def scenario():
+        gates, agents = _install(monkeypatch, tmp_path)
+        with priority_class(BATCH):
+            batch = WorkflowRun("Plan a launch")
+            first = asyncio.create_task(_collect(batch))
+        await asyncio.sleep(0.01)
+        interactive = WorkflowRun("Plan a launch")
+        second = asyncio.create_task(_collect(interactive))
+        await asyncio.sleep(0.01)
+        for gate in gates:
+            gate.set()
+        await asyncio.gather(first, second)
+        return batch, interactive, agents
+
+    batch, interactive, agents = asyncio.run(scenario())
+    assert agents[0].calls == 2 and not interactive.shared
+    assert interactive.run_id != batch.run_id and interactive.final_text == batch.final_text == "ADVICE"
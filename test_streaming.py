@@ -0,0 +1,62 @@
+"""Offline tests for the coalescing UI stream adapter."""
+
+import asyncio
+
+from agent_runtime.streaming import CoalescingStream
+
+
+class Recorder:
+    def __init__(self):
+        self.sent = []
+
+    async def __call__(self, text):
+        self.sent.append(text)
+
+
+def test_tokens_are_batched_by_interval_and_flushed_at_boundary():
+    recorder = Recorder()
+
+    async def scenario():
+        stream = CoalescingStream(recorder, interval=0.05, max_chars=0)
+        for _ in range(3):
+            for token in ("a", "b", "c"):
+                await stream.push(token)
+            await asyncio.sleep(0.07)
+        await stream.push("tail")
+        await stream.aclose()
+        return stream
+
+    stream = asyncio.run(scenario())
+    assert "".join(recorder.sent) == "abcabcabctail"
+    assert recorder.sent[-1].endswith("tail")
+    assert stream.updates == len(recorder.sent) <= 5
+
+
+def test_size_threshold_flushes_early_and_zero_interval_passes_through():
+    recorder = Recorder()
+
+    async def scenario():
+        async with CoalescingStream(recorder, interval=10, max_chars=4) as stream:
+            for token in ("ab", "cd", "ef"):
+                await stream.push(token)
+        async with CoalescingStream(recorder, interval=0) as stream:
+            await stream.push("x")
+            await stream.push("y")
+
+    asyncio.run(scenario())
+    assert recorder.sent == ["abcd", "ef", "x", "y"]
+
+
+def test_many_tokens_give_bounded_updates():
+    recorder = Recorder()
+
+    async def scenario():
+        stream = CoalescingStream(recorder, interval=0.02, max_chars=0)
+        for _ in range(2000):
+            await stream.push("tok ")
+        await asyncio.sleep(0.03)
+        await stream.aclose()
+
+    asyncio.run(scenario())
+    assert "".join(recorder.sent) == "tok " * 2000
+    assert len(recorder.sent) <= 3
@@ -0,0 +1,101 @@
+"""Offline tests for sampled tracing with ring-buffer retention."""
+
+import json
+import threading
+
+from opentelemetry import trace
+from opentelemetry.sdk.trace import SpanLimits, TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor, SpanExporter, SpanExportResult
+from opentelemetry.trace import Status, StatusCode
+
+from agent_runtime.tracing import SamplingSpanProcessor, TraceBuffer
+
+
+class Collector(SpanExporter):
+    def __init__(self):
+        self.names = []
+
+    def export(self, spans):
+        self.names.extend(span.name for span in spans)
+        return SpanExportResult.SUCCESS
+
+
+def _tracer(buffer, rate=1.0, max_pending=256, max_spans=512, attribute_chars=0):
+    processor = SamplingSpanProcessor(
+        buffer, rate=rate, max_pending=max_pending, max_spans=max_spans, attribute_chars=attribute_chars
+    )
+    provider = TracerProvider(
+        active_span_processor=processor, span_limits=SpanLimits(max_attribute_length=attribute_chars or None)
+    )
+    return provider.get_tracer("test"), processor
+
+
+def _run(tracer, fail=False, payload="x"):
+    with tracer.start_as_current_span("workflow.run"):
+        with tracer.start_as_current_span("invoke_agent") as span:
+            span.set_attribute("gen_ai.output.messages", payload)
+            if fail:
+                span.set_status(Status(StatusCode.ERROR, "advisor timed out"))
+
+
+def test_unsampled_traces_are_dropped_but_failures_are_kept():
+    buffer = TraceBuffer(10)
+    tracer, processor = _tracer(buffer, rate=0.0)
+    collector = Collector()
+    processor.add_span_processor(SimpleSpanProcessor(collector))
+    for _ in range(5):
+        _run(tracer)
+    assert len(buffer) == 0 and collector.names == []
+
+    _run(tracer, fail=True)
+    [kept] = buffer.snapshot()
+    assert kept["status"] == "ERROR" and kept["root"] == "workflow.run"
+    assert [s["name"] for s in kept["spans"]] == ["invoke_agent", "workflow.run"]
+    assert kept["spans"][0]["error"] == "advisor timed out"
+    assert collector.names == ["invoke_agent", "workflow.run"]
+    assert not processor._pending
+
+
+def test_ring_buffer_stays_bounded_truncates_and_spills(monkeypatch, tmp_path):
+    spill = tmp_path / "traces.jsonl"
+    buffer = TraceBuffer(3, str(spill), spill_max_bytes=1500)
+    writers = set()
+    append = buffer._append
+
+    def record_writer(record):
+        writers.add(threading.current_thread().name)
+        append(record)
+
+    monkeypatch.setattr(buffer, "_append", record_writer)
+    tracer, processor = _tracer(buffer, attribute_chars=100)
+    for _ in range(20):
+        _run(tracer, payload="y" * 5000)
+    assert len(buffer) == 3
+    attribute = buffer.snapshot(1)[0]["spans"][0]["attributes"]["gen_ai.output.messages"]
+    assert len(attribute) == 100
+
+    # Spans end on the caller's thread; the file is written by the spill thread.
+    buffer.flush()
+    assert writers == {"trace-spill"}
+    rotated = tmp_path / "traces.jsonl.1"
+    assert rotated.exists() and spill.stat().st_size <= 1500
+    assert json.loads(spill.read_text().splitlines()[-1])["root"] == "workflow.run"
+
+
+def test_pending_traces_are_capped_and_finished_processors_detached():
+    buffer = TraceBuffer(10)
+    tracer, processor = _tracer(buffer, max_pending=2, max_spans=1)
+    # Roots that never end leave pending traces behind.
+    open_roots = [tracer.start_span("workflow.run") for _ in range(5)]
+    for root in open_roots:
+        with trace.use_span(root, end_on_exit=False):
+            with tracer.start_as_current_span("a"), tracer.start_as_current_span("b"):
+                pass
+    assert len(processor._pending) == 2
+    assert all(len(spans) == 1 for spans in processor._pending.values())
+
+    request_processor = SimpleSpanProcessor(Collector())
+    processor.add_span_processor(request_processor)
+    assert request_processor in processor._span_processors
+    request_processor.shutdown()
+    assert request_processor not in processor._span_processors
@@ -0,0 +1,71 @@
+"""Offline tests for the optional HTTP/2 transport of the model clients."""
+
+import asyncio
+import sys
+
+import httpx
+import pytest
+
+import agent_runtime.transport as transport_module
+from agent_runtime.transport import MultiplexedTransport, _Lane, model_async_client, model_http_client
+
+
+def _streaming(request):
+    return httpx.Response(200, stream=httpx.ByteStream(b"data: [DONE]\n\n"))
+
+
+def test_requests_spread_over_connections_by_stream_limit(monkeypatch):
+    transport = MultiplexedTransport("http://model.local/v1/", max_streams=2, max_connections=2)
+
+    def open_lane():
+        lane = _Lane(httpx.MockTransport(_streaming))
+        transport.lanes.append(lane)
+        return lane
+
+    monkeypatch.setattr(transport, "_open_lane", open_lane)
+
+    async def scenario():
+        client = httpx.AsyncClient(transport=transport)
+        opened = []
+        for n in range(5):
+            opened.append(await client.send(client.build_request("POST", "http://model.local/v1/chat/completions"), stream=True))
+            yield [lane.streams for lane in transport.lanes]
+        # A stream ends when its body is closed; the freed slot is reused first.
+        await opened[0].aclose()
+        yield [lane.streams for lane in transport.lanes]
+        await client.send(client.build_request("GET", "http://model.local/v1/models"))
+        yield [lane.streams for lane in transport.lanes]
+        for response in opened[1:]:
+            await response.aclose()
+        yield [lane.streams for lane in transport.lanes]
+
+    async def collect():
+        return [counts async for counts in scenario()]
+
+    # A second connection opens once the first has two streams; beyond two
+    # connections the least busy one takes the request.
+    assert asyncio.run(collect()) == [[1], [2], [2, 1], [2, 2], [3, 2], [2, 2], [2, 2], [0, 0]]
+
+
+def test_http2_is_off_by_default_and_falls_back_without_h2(monkeypatch):
+    monkeypatch.setattr(transport_module, "_clients", {})
+    monkeypatch.delenv("MODEL_HTTP2", raising=False)
+    assert model_async_client("http://127.0.0.1:5273/v1/", "nokey") is None
+
+    monkeypatch.setenv("MODEL_HTTP2", "true")
+    monkeypatch.setitem(sys.modules, "h2", None)
+    assert model_http_client("http://127.0.0.1:5273/v1/") is None
+
+
+def test_agents_share_one_http2_client(monkeypatch):
+    pytest.importorskip("h2")
+    monkeypatch.setattr(transport_module, "_clients", {})
+    monkeypatch.setenv("MODEL_HTTP2", "true")
+    monkeypatch.setenv("MODEL_HTTP2_MAX_STREAMS", "500")
+    monkeypatch.setenv("MODEL_HTTP2_MAX_CONNECTIONS", "3")
+    first = model_async_client("http://127.0.0.1:5273/v1/", "nokey")
+    second = model_async_client("http://127.0.0.1:5273/v1/", "nokey")
+    assert first is not second and first._client is second._client
+    transport = first._client._transport
+    # The client library never runs more than 100 streams on one connection.
+    assert isinstance(transport, MultiplexedTransport) and (transport.max_streams, transport.max_connections) == (100, 3)
@@ -1,3 +1,5 @@
-from .workflow import workflow
+from .workflow import workflow, create_workflow, agents_ready, STAGE_IDS
+from .checkpoint import CheckpointStore, RunCheckpoint
+from .runner import WorkflowRun
 
-__all__ = ["workflow"]
\ No newline at end of file
+__all__ = ["workflow", "create_workflow", "agents_ready", "STAGE_IDS", "CheckpointStore", "RunCheckpoint", "WorkflowRun"]
\ No newline at end of file
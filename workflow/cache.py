@@ -0,0 +1,143 @@
+"""On-disk cache of completed workflow results.
+
+A cached result is stored per prompt (ignoring surrounding whitespace)
+together with a fingerprint of everything that shapes the answer: each
+agent's instructions and model (the input condenser's included), the
+output flags (`STRUCTURED_HANDOFF`, `EARLY_STOP_SECTIONS`), the
+condensing threshold and the build time of the researcher's document
+index. A result is only served
+while its fingerprint matches the running configuration and it is younger
+than `RESPONSE_CACHE_TTL_HOURS`, so changing an agent's instructions or
+model retires the old answers at once.
+
+`RESPONSE_CACHE` selects what is served:
+
+- `warmed` (default): only results precomputed by the cache warmer for the
+  curated prompt list (see `service.warmer`);
+- `all`: also the result of every completed run;
+- `off`: nothing.
+"""
+
+import hashlib
+import json
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Optional
+
+from agent_runtime.config import env_flag, env_float, env_int
+from agent_runtime.metrics import REGISTRY
+from .checkpoint import prompt_hash
+
+DEFAULT_CACHE_DIR = ".cache/responses"
+CACHE_MODES = ("off", "warmed", "all")
+
+SOURCE_WARM = "warm"
+SOURCE_RUN = "run"
+
+LOOKUPS = REGISTRY.counter("response_cache_requests_total", "Response cache lookups, by outcome (hit, miss, stale)")
+
+
+def cache_mode() -> str:
+	mode = (os.environ.get("RESPONSE_CACHE") or "warmed").strip().lower()
+	return mode if mode in CACHE_MODES else "warmed"
+
+
+def _describe(agent: Any) -> list[Any]:
+	options = getattr(agent, "chat_options", None)
+	client = getattr(agent, "chat_client", None)
+	return [getattr(agent, "name", None), getattr(options, "instructions", None), getattr(client, "model_id", None)]
+
+
+def workflow_fingerprint() -> str:
+	"""Hash of the agents' instructions and models, the flags that change answers and the document index."""
+	from agent_runtime.retrieval import index_version
+	from .workflow import _COMPACT_STAGES, _CONDENSER, _STAGES
+
+	parts: list[Any] = [env_flag("STRUCTURED_HANDOFF"), env_flag("EARLY_STOP_SECTIONS")]
+	# A rebuilt corpus changes the researcher's sources.
+	parts.append(["research_index", index_version()])
+	parts.append(["input_condenser", _describe(_CONDENSER), env_int("INPUT_CONDENSE_THRESHOLD_TOKENS", 3000)])
+	for stage_id, agent, sections in _STAGES:
+		compact = _COMPACT_STAGES.get(stage_id, (None, ()))[0]
+		parts.append([stage_id, _describe(agent), _describe(compact) if compact is not None else None, list(sections)])
+	canonical = json.dumps(parts, sort_keys=True, default=str)
+	return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+@dataclass
+class CacheEntry:
+	"""A cached workflow result.
+
+	Attributes:
+		prompt: The request the result answers.
+		outputs: Every stage's output keyed by executor id.
+		fingerprint: `workflow_fingerprint()` when the result was computed.
+		source: "warm" (precomputed by the warmer) or "run" (a user's run).
+	"""
+
+	prompt: str
+	outputs: dict[str, str]
+	fingerprint: str
+	source: str = SOURCE_RUN
+	created_at: float = field(default_factory=time.time)
+
+
+class ResponseCache:
+	"""Directory of cached results, one JSON file per prompt."""
+
+	def __init__(self, directory: Optional[str] = None, *, ttl_hours: Optional[float] = None) -> None:
+		self.directory = Path(directory or os.environ.get("RESPONSE_CACHE_DIR") or DEFAULT_CACHE_DIR)
+		self.ttl_seconds = 3600 * (ttl_hours if ttl_hours is not None else env_float("RESPONSE_CACHE_TTL_HOURS", 24.0))
+
+	def _path(self, prompt: str) -> Path:
+		return self.directory / f"{prompt_hash(prompt)}.json"
+
+	def entry(self, prompt: str) -> Optional[CacheEntry]:
+		"""The stored entry for `prompt`, current or not."""
+		try:
+			return CacheEntry(**json.loads(self._path(prompt).read_text(encoding="utf-8")))
+		except (OSError, ValueError, TypeError):
+			return None
+
+	def is_current(self, entry: Optional[CacheEntry], fingerprint: str, max_age: Optional[float] = None) -> bool:
+		if entry is None or entry.fingerprint != fingerprint:
+			return False
+		return time.time() - entry.created_at < (max_age if max_age is not None else self.ttl_seconds)
+
+	def get(self, prompt: str) -> Optional[CacheEntry]:
+		"""A servable result for `prompt` under the current `RESPONSE_CACHE` mode."""
+		mode = cache_mode()
+		if mode == "off":
+			return None
+		entry = self.entry(prompt)
+		if entry is None or (mode == "warmed" and entry.source != SOURCE_WARM):
+			LOOKUPS.inc(outcome="miss")
+			return None
+		if not self.is_current(entry, workflow_fingerprint()):
+			LOOKUPS.inc(outcome="stale")
+			return None
+		LOOKUPS.inc(outcome="hit")
+		return entry
+
+	def put(self, prompt: str, outputs: dict[str, str], *, source: str = SOURCE_RUN) -> CacheEntry:
+		"""Store a completed result atomically, replacing the previous one."""
+		entry = CacheEntry(prompt=prompt.strip(), outputs=dict(outputs), fingerprint=workflow_fingerprint(), source=source)
+		self.directory.mkdir(parents=True, exist_ok=True)
+		path = self._path(prompt)
+		tmp = path.with_suffix(f".{os.getpid()}.tmp")
+		tmp.write_text(json.dumps(asdict(entry), ensure_ascii=False), encoding="utf-8")
+		os.replace(tmp, path)
+		return entry
+
+
+_cache: Optional[ResponseCache] = None
+
+
+def response_cache() -> ResponseCache:
+	"""The process-wide cache, configured from the environment on first use."""
+	global _cache
+	if _cache is None:
+		_cache = ResponseCache()
+	return _cache
@@ -0,0 +1,144 @@
+"""Crash-safe, on-disk checkpoints for workflow runs.
+
+After each executor finishes, its output is written to
+`<WORKFLOW_CHECKPOINT_DIR>/<run_id>.json` using an atomic replace, so a
+timeout or restart in a later stage never loses the minutes spent on the
+earlier ones. A failed run can be resumed from the first stage that has no
+saved output, either explicitly by run id or automatically when the same
+prompt is submitted again.
+"""
+
+import hashlib
+import json
+import os
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from agent_runtime.config import env_float
+
+DEFAULT_CHECKPOINT_DIR = ".checkpoints"
+
+STATUS_RUNNING = "running"
+STATUS_FAILED = "failed"
+STATUS_COMPLETED = "completed"
+
+# Identifies checkpoints written by this process, so a run that is still in
+# progress here is not mistaken for one abandoned by a crashed process.
+PROCESS_TOKEN = uuid.uuid4().hex
+
+
+def prompt_hash(prompt: str) -> str:
+	"""Stable key used to find an unfinished run for the same prompt."""
+	return hashlib.sha256(prompt.strip().encode("utf-8")).hexdigest()[:16]
+
+
+def new_run_id() -> str:
+	return uuid.uuid4().hex[:12]
+
+
+@dataclass
+class RunCheckpoint:
+	"""Saved progress of one workflow run.
+
+	Attributes:
+		run_id: Identifier shown to users so they can resume the run.
+		prompt: The original user request.
+		outputs: Completed stage outputs keyed by executor id, in stage order.
+		status: One of "running", "failed" or "completed".
+		error: Message of the exception that stopped the run, if any.
+		mode: Serving mode the run started in ("full", "fast" or "short").
+	"""
+
+	run_id: str
+	prompt: str
+	outputs: dict[str, str] = field(default_factory=dict)
+	status: str = STATUS_RUNNING
+	error: Optional[str] = None
+	mode: str = "full"
+	prompt_hash: str = ""
+	owner: str = PROCESS_TOKEN
+	created_at: float = field(default_factory=time.time)
+	updated_at: float = field(default_factory=time.time)
+
+	def __post_init__(self) -> None:
+		if not self.prompt_hash:
+			self.prompt_hash = prompt_hash(self.prompt)
+
+	@property
+	def resumable(self) -> bool:
+		"""Failed runs, and runs left "running" by a process that no longer owns them."""
+		if self.status == STATUS_FAILED:
+			return True
+		return self.status == STATUS_RUNNING and self.owner != PROCESS_TOKEN
+
+
+class CheckpointStore:
+	"""Directory of JSON checkpoints, one file per run."""
+
+	def __init__(self, directory: Optional[str] = None, *, ttl_hours: Optional[float] = None) -> None:
+		self.directory = Path(directory or os.environ.get("WORKFLOW_CHECKPOINT_DIR") or DEFAULT_CHECKPOINT_DIR)
+		self.ttl_seconds = 3600 * (ttl_hours if ttl_hours is not None else env_float("WORKFLOW_CHECKPOINT_TTL_HOURS", 24.0))
+
+	def _path(self, run_id: str) -> Path:
+		if not run_id or any(ch in run_id for ch in "/\\."):
+			raise ValueError(f"Invalid run id: {run_id!r}")
+		return self.directory / f"{run_id}.json"
+
+	def load(self, run_id: str) -> Optional[RunCheckpoint]:
+		"""Return the checkpoint for `run_id`, or None if there is none."""
+		try:
+			data = json.loads(self._path(run_id).read_text(encoding="utf-8"))
+		except (OSError, ValueError):
+			return None
+		return RunCheckpoint(**data)
+
+	def save(self, checkpoint: RunCheckpoint) -> None:
+		"""Write the checkpoint atomically (temp file + fsync + replace)."""
+		checkpoint.updated_at = time.time()
+		self.directory.mkdir(parents=True, exist_ok=True)
+		path = self._path(checkpoint.run_id)
+		tmp = path.with_suffix(".json.tmp")
+		with open(tmp, "w", encoding="utf-8") as handle:
+			json.dump(asdict(checkpoint), handle, ensure_ascii=False)
+			handle.flush()
+			os.fsync(handle.fileno())
+		os.replace(tmp, path)
+
+	def delete(self, run_id: str) -> None:
+		try:
+			self._path(run_id).unlink()
+		except FileNotFoundError:
+			pass
+
+	def _iter(self) -> list[RunCheckpoint]:
+		if not self.directory.is_dir():
+			return []
+		checkpoints = []
+		for path in self.directory.glob("*.json"):
+			checkpoint = self.load(path.stem)
+			if checkpoint is not None:
+				checkpoints.append(checkpoint)
+		return checkpoints
+
+	def find_resumable(self, prompt: str) -> Optional[RunCheckpoint]:
+		"""Most recent unfinished run of the same prompt that is still within the TTL."""
+		key = prompt_hash(prompt)
+		cutoff = time.time() - self.ttl_seconds
+		candidates = [
+			c for c in self._iter()
+			if c.prompt_hash == key and c.resumable and c.outputs and c.updated_at >= cutoff
+		]
+		return max(candidates, key=lambda c: c.updated_at, default=None)
+
+	def prune(self) -> int:
+		"""Delete checkpoints older than the TTL. Returns the number removed."""
+		cutoff = time.time() - self.ttl_seconds
+		removed = 0
+		for checkpoint in self._iter():
+			if checkpoint.updated_at < cutoff:
+				self.delete(checkpoint.run_id)
+				removed += 1
+		return removed
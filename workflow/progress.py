@@ -0,0 +1,97 @@
+"""Progress of a workflow run as shown by the Chainlit apps.
+
+Both Chainlit frontends (`chainlit_app.py`, `chainlit_app_simple.py`) stream
+the agents and report on a run the same way; only their welcome and
+completion texts differ. The API's equivalent is `service.events`.
+Chainlit is imported when a run is streamed, so this module can be
+imported without it.
+"""
+
+from typing import Optional
+
+from agent_framework import AgentRunEvent, AgentRunUpdateEvent, ExecutorCompletedEvent, ExecutorInvokedEvent
+
+from agent_runtime.streaming import CoalescingStream
+from .runner import WorkflowRun
+
+STAGE_LABELS = {
+	"plan_agent": "Planning Agent",
+	"researcher_agent": "Research Agent",
+	"advisor_agent": "Advisor Agent",
+}
+FINAL_STAGE = "advisor_agent"
+
+
+def resume_hint(run: Optional[WorkflowRun]) -> str:
+	"""Explain how to continue a run whose completed stages were checkpointed."""
+	if run is None or not run.outputs or run.next_stage is None:
+		return ""
+	done = ", ".join(STAGE_LABELS[s] for s in run.outputs)
+	return (
+		f"💾 Progress was saved (completed: {done}). Send the same request again, "
+		f"or `/resume {run.run_id}`, to continue from the **{STAGE_LABELS[run.next_stage]}**.\n\n"
+	)
+
+
+def start_notes(run: WorkflowRun) -> list[str]:
+	"""Notes shown before a run starts: resumed, served in a cheaper mode, condensing its input."""
+	notes = []
+	if run.resumed_from:
+		notes.append(f"♻️ Resuming run `{run.run_id}` from **{STAGE_LABELS[run.resumed_from]}**...")
+	if run.mode == "fast":
+		notes.append("⚡ The model is busy right now, so this request is answered with a faster model.")
+	elif run.mode == "short":
+		notes.append("⚡ The model is busy right now, so this request skips the research step.")
+	if run.condenses_input:
+		notes.append("📄 Your message is long, so it is summarized in parts before planning...")
+	return notes
+
+
+def finish_notes(run: WorkflowRun) -> list[str]:
+	"""Notes shown after a run: steps shortened or skipped for the deadline."""
+	if run.deadline_reports:
+		return ["⏱️ Some steps were shortened or skipped to answer within the response time budget."]
+	return []
+
+
+async def stream_workflow(run: WorkflowRun, header: str) -> bool:
+	"""Run the workflow in a Chainlit session, streaming each agent's output while it is generated.
+
+	Planning and research stream into collapsible steps, the advisor's answer
+	into the final message. Tokens go through a `CoalescingStream`, so each
+	session sends a bounded number of websocket updates per second and every
+	stage is flushed completely when it ends. Returns True once the advisor's
+	answer has been streamed, False when it came from a saved run or the cache.
+	"""
+	import chainlit as cl
+
+	target = stream = None
+	streamed = False
+	try:
+		async for event in run.stream():
+			stage = getattr(event, "executor_id", None)
+			if stage not in STAGE_LABELS:
+				continue
+			if isinstance(event, ExecutorInvokedEvent):
+				if stage == FINAL_STAGE:
+					target = cl.Message(content=header)
+				else:
+					target = cl.Step(name=STAGE_LABELS[stage], type="llm")
+					await target.send()
+				stream = CoalescingStream(target.stream_token)
+			elif isinstance(event, AgentRunUpdateEvent) and stream is not None and event.data is not None:
+				await stream.push(event.data.text)
+			elif isinstance(event, ExecutorCompletedEvent) and stream is not None:
+				await stream.aclose()
+				await (target.send() if stage == FINAL_STAGE else target.update())
+				streamed = streamed or stage == FINAL_STAGE
+				target = stream = None
+			elif isinstance(event, AgentRunEvent):
+				source = "served from the response cache" if run.cached else "restored from the saved run"
+				await cl.Message(content=f"♻️ **{STAGE_LABELS[stage]}** {source}").send()
+	finally:
+		# Keep whatever a failed stage produced visible above the error message.
+		if stream is not None:
+			await stream.aclose()
+			await (target.send() if isinstance(target, cl.Message) else target.update())
+	return streamed
@@ -0,0 +1,302 @@
+"""Checkpointed execution of the planner -> researcher -> advisor workflow.
+
+`WorkflowRun` drives a fresh workflow instance with `run_stream`, collects
+the text each executor produces and saves it to the `CheckpointStore` as
+soon as the executor completes. If a run fails, the next attempt (the same
+prompt again, or an explicit run id) starts at the first stage without a
+saved output and replays the saved ones as `AgentRunEvent`s, so callers
+see the same event sequence as a run that never failed.
+
+Identical requests that arrive while a run of the same prompt is in
+progress in this process join that run instead of starting another one
+(`WORKFLOW_SINGLE_FLIGHT`, on by default): every caller receives the full
+event sequence of the shared execution, which keeps running until the
+last of them disconnects. Only requests of the same priority class and
+deadline budget share a run, as the execution is scheduled in its first
+caller's class and fitted into its deadline.
+
+A prompt with a current result in the response cache (see `workflow.cache`)
+is answered from it: the cached stage outputs are replayed like a resumed
+run's and no model is called.
+
+A run inside `agent_runtime.deadline.request_deadline` fits its stages
+into the time left: what each stage changed to get there (a lower token
+limit, a cut-off answer, a skipped research step) is kept in
+`deadline_reports`, and such partial results are never cached.
+
+A very long request is condensed into a brief before the first stage
+reads it (see `agent_runtime.condense`); `input_report` tells how.
+"""
+
+import asyncio
+import logging
+import math
+from typing import AsyncIterator, Optional
+
+from agent_framework import (
+	AgentRunEvent,
+	AgentRunResponse,
+	AgentRunUpdateEvent,
+	ChatMessage,
+	ExecutorCompletedEvent,
+	Role,
+	WorkflowEvent,
+)
+
+from agent_runtime.config import env_flag
+from agent_runtime.deadline import REMAINING, remaining
+from agent_runtime.load_shedding import FULL, load_shedder
+from agent_runtime.priority import current_priority
+from agent_runtime.singleflight import Flight, SingleFlight
+from .cache import SOURCE_RUN, cache_mode, response_cache
+from .checkpoint import (
+	PROCESS_TOKEN,
+	STATUS_COMPLETED,
+	STATUS_FAILED,
+	STATUS_RUNNING,
+	CheckpointStore,
+	RunCheckpoint,
+	new_run_id,
+)
+from .workflow import condenser, create_workflow, stages_for
+
+logger = logging.getLogger(__name__)
+
+# In-flight runs of this process, keyed by prompt hash.
+_FLIGHTS = SingleFlight("workflow")
+
+
+class WorkflowRun:
+	"""One checkpointed execution of the workflow.
+
+	Args:
+		prompt: The user request. May be omitted when resuming by `run_id`.
+		run_id: Resume this run if a checkpoint exists, otherwise start a new
+			run under this id.
+		resume: When no `run_id` is given, continue the latest unfinished run
+			of the same prompt instead of starting over.
+		store: Where checkpoints are kept. Defaults to `WORKFLOW_CHECKPOINT_DIR`.
+			Checkpointing is skipped entirely when `WORKFLOW_CHECKPOINTS=false`.
+		coalesce: Share an in-flight run of the same prompt (or run id)
+			instead of starting another one. Defaults to `WORKFLOW_SINGLE_FLIGHT`.
+		cache: Answer from the response cache when it holds a current result
+			for the prompt (see `workflow.cache`). Defaults to True.
+	"""
+
+	def __init__(
+		self,
+		prompt: Optional[str] = None,
+		*,
+		run_id: Optional[str] = None,
+		resume: bool = True,
+		store: Optional[CheckpointStore] = None,
+		coalesce: Optional[bool] = None,
+		cache: bool = True,
+	) -> None:
+		self.coalesce = coalesce if coalesce is not None else env_flag("WORKFLOW_SINGLE_FLIGHT", True)
+		self.store = store if store is not None else (CheckpointStore() if env_flag("WORKFLOW_CHECKPOINTS", True) else None)
+		checkpoint = None
+		# True when the result comes from the response cache
+		self.cached = False
+		if cache and prompt and not run_id:
+			entry = response_cache().get(prompt)
+			if entry is not None:
+				checkpoint = RunCheckpoint(run_id=new_run_id(), prompt=prompt, outputs=dict(entry.outputs), status=STATUS_COMPLETED)
+				self.cached = True
+		if checkpoint is None and self.store is not None:
+			if run_id:
+				checkpoint = self.store.load(run_id)
+			elif resume and prompt:
+				checkpoint = self.store.find_resumable(prompt)
+		if checkpoint is None:
+			if not prompt:
+				raise ValueError(f"No checkpoint found for run '{run_id}' and no prompt given")
+			checkpoint = RunCheckpoint(run_id=run_id or new_run_id(), prompt=prompt)
+		elif checkpoint.status == STATUS_RUNNING and checkpoint.owner == PROCESS_TOKEN and not (self.coalesce and _find_flight(checkpoint)):
+			raise RuntimeError(f"Run '{checkpoint.run_id}' is already in progress")
+		checkpoint.owner = PROCESS_TOKEN
+		if not checkpoint.outputs:
+			# New work is routed by the current load; a resumed run keeps its mode.
+			checkpoint.mode = load_shedder().mode()
+		self.checkpoint = checkpoint
+		self.resumed_from: Optional[str] = self.next_stage if checkpoint.outputs and not self.cached else None
+		# Per-stage token report of the compact handoff (STRUCTURED_HANDOFF=true)
+		self.handoff_reports: dict[str, dict] = {}
+		# Stages shortened or skipped to meet the request deadline
+		self.deadline_reports: dict[str, dict] = {}
+		# How a long request was condensed before the first stage (empty if it was not)
+		self.input_report: dict = {}
+		# True when this run joined another caller's in-flight execution
+		self.shared = False
+		# The caller asked for this run by id, rather than for its prompt
+		self._requested_by_id = bool(run_id)
+
+	@property
+	def run_id(self) -> str:
+		return self.checkpoint.run_id
+
+	@property
+	def prompt(self) -> str:
+		return self.checkpoint.prompt
+
+	@property
+	def mode(self) -> str:
+		"""Serving mode of the run: "full", or "fast"/"short" when started under load."""
+		return self.checkpoint.mode
+
+	@property
+	def stages(self) -> tuple[str, ...]:
+		"""Executor ids this run goes through, in order."""
+		return stages_for(self.checkpoint.mode)
+
+	@property
+	def condenses_input(self) -> bool:
+		"""True when the request is long enough to be condensed before the first stage."""
+		if self.next_stage is None:
+			return False
+		input_condenser = condenser()
+		return input_condenser is not None and input_condenser.needed(self.prompt)
+
+	@property
+	def outputs(self) -> dict[str, str]:
+		"""Text of every completed stage, keyed by executor id."""
+		return self.checkpoint.outputs
+
+	@property
+	def next_stage(self) -> Optional[str]:
+		"""First stage without a saved output, or None when all are done."""
+		return next((s for s in self.stages if s not in self.checkpoint.outputs), None)
+
+	@property
+	def final_text(self) -> str:
+		"""Output of the last stage (the advisor's recommendation)."""
+		return self.checkpoint.outputs.get(self.stages[-1], "")
+
+	async def _save(self) -> None:
+		if self.store is not None:
+			await asyncio.to_thread(self.store.save, self.checkpoint)
+
+	async def _request(self) -> str:
+		"""The request as the stages read it: condensed into a brief when very long."""
+		input_condenser = condenser()
+		if input_condenser is None:
+			return self.prompt
+		condensed = await input_condenser.condense(self.prompt)
+		if condensed.report:
+			self.input_report.update(condensed.report)
+		return condensed.text
+
+	def _conversation(self, start_at: str, request: str) -> list[ChatMessage]:
+		"""Messages the `start_at` executor would have received from its upstream."""
+		messages = [ChatMessage(role=Role.USER, text=request)]
+		for stage_id in self.stages[:self.stages.index(start_at)]:
+			messages.append(ChatMessage(role=Role.ASSISTANT, text=self.outputs[stage_id], author_name=stage_id))
+		return messages
+
+	async def stream(self) -> AsyncIterator[WorkflowEvent]:
+		"""Run the remaining stages, yielding workflow events as they happen."""
+		if not self.coalesce or self.cached:
+			async for event in self._execute():
+				yield event
+			return
+		key = _flight_key(self.checkpoint.prompt_hash)
+		existing = _FLIGHTS.find(lambda f: f.owner.run_id == self.run_id)
+		if existing is not None and existing.key != key:
+			if self._requested_by_id:
+				# Asked for by id: follow that very run, whatever it runs under.
+				key = existing.key
+			else:
+				self._fork()
+		flight, leader = _FLIGHTS.join(key, self._execute, owner=self)
+		if not leader:
+			self._join(flight.owner)
+		async for event in flight.subscribe():
+			yield event
+
+	def _fork(self) -> None:
+		"""Go on from the saved stages under a new run id, instead of sharing a run executed under other terms."""
+		self.checkpoint = RunCheckpoint(
+			run_id=new_run_id(), prompt=self.prompt, outputs=dict(self.outputs), mode=self.mode
+		)
+		logger.info("Run of the same prompt is in flight under other terms; starting run %s", self.run_id)
+
+	def _join(self, leader: "WorkflowRun") -> None:
+		"""Follow `leader`'s execution: its checkpoint and reports become ours."""
+		logger.info("Request for run %s joins in-flight run %s", self.run_id, leader.run_id)
+		self.checkpoint = leader.checkpoint
+		self.resumed_from = leader.resumed_from
+		self.handoff_reports = leader.handoff_reports
+		self.deadline_reports = leader.deadline_reports
+		self.input_report = leader.input_report
+		self.shared = True
+
+	async def _execute(self) -> AsyncIterator[WorkflowEvent]:
+		for stage_id in self.stages:
+			if stage_id in self.outputs:
+				yield AgentRunEvent(stage_id, AgentRunResponse(messages=[ChatMessage(role=Role.ASSISTANT, text=self.outputs[stage_id])]))
+
+		start_at = self.next_stage
+		if start_at is None:
+			return
+		if self.resumed_from:
+			logger.info("Resuming run %s at %s", self.run_id, start_at)
+		if self.mode != FULL:
+			logger.info("Run %s is served in %s mode", self.run_id, self.mode)
+
+		self.checkpoint.status = STATUS_RUNNING
+		self.checkpoint.error = None
+		await self._save()
+
+		texts: dict[str, list[str]] = {}
+		try:
+			# Summaries are cached, so a resumed run condenses again quickly.
+			request = await self._request()
+			message = request if start_at == self.stages[0] else self._conversation(start_at, request)
+			async for event in create_workflow(start_at, mode=self.mode).run_stream(message):
+				if isinstance(event, AgentRunUpdateEvent) and event.data is not None:
+					texts.setdefault(event.executor_id, []).append(event.data.text)
+					properties = event.data.additional_properties or {}
+					if properties.get("handoff"):
+						self.handoff_reports[event.executor_id] = properties["handoff"]
+					if properties.get("deadline"):
+						self.deadline_reports[event.executor_id] = properties["deadline"]
+				elif isinstance(event, AgentRunEvent) and event.data is not None:
+					texts[event.executor_id] = [event.data.text]
+				elif isinstance(event, ExecutorCompletedEvent) and event.executor_id in texts:
+					self.outputs[event.executor_id] = "".join(texts.pop(event.executor_id))
+					await self._save()
+				yield event
+		except BaseException as exc:
+			self.checkpoint.status = STATUS_FAILED
+			self.checkpoint.error = str(exc) or type(exc).__name__
+			await asyncio.shield(self._save())
+			raise
+
+		self.checkpoint.status = STATUS_COMPLETED if self.next_stage is None else STATUS_FAILED
+		await self._save()
+		left = remaining()
+		if left is not None:
+			REMAINING.observe(left)
+		if self.checkpoint.status == STATUS_COMPLETED and self.mode == FULL and not self.deadline_reports and cache_mode() == "all":
+			await asyncio.to_thread(response_cache().put, self.prompt, self.outputs, source=SOURCE_RUN)
+
+	async def run(self) -> str:
+		"""Run to completion and return the final recommendation."""
+		async for _ in self.stream():
+			pass
+		return self.final_text
+
+
+def _flight_key(prompt_hash: str) -> str:
+	"""Single-flight key of the current request: its prompt, priority class and deadline budget.
+
+	The budget is rounded up to whole seconds, so identical requests of a
+	burst still share one run.
+	"""
+	left = remaining()
+	return f"{prompt_hash}:{current_priority()}:{math.ceil(left) if left is not None else '-'}"
+
+
+def _find_flight(checkpoint: RunCheckpoint) -> Optional[Flight]:
+	"""The in-flight execution of the same run or of the same prompt, if any."""
+	return _FLIGHTS.find(lambda f: f.owner.run_id == checkpoint.run_id or f.owner.checkpoint.prompt_hash == checkpoint.prompt_hash)
@@ -9,35 +9,136 @@ The workflow uses WorkflowBuilder for better DevUI compatibility and
 to avoid serialization issues with ChatMessage types.
 """
 
+from typing import Optional
+
 from agent_framework import (
 	AgentExecutor,
 	WorkflowBuilder,
 )
 
-from plan_agent import plan_agent
-from researcher_agent import researcher_agent
-from advisor_agent import advisor_agent
+from agent_runtime import StageAgent
+from agent_runtime.condense import InputCondenser
+from agent_runtime.config import env_flag
+from agent_runtime.load_shedding import FULL, SHORT, load_shedder
+from plan_agent import plan_agent, plan_agent_compact, input_condenser, PLAN_AGENT_SECTIONS, PLAN_AGENT_HANDOFF_FIELDS
+from researcher_agent import (
+	researcher_agent,
+	researcher_agent_compact,
+	RESEARCHER_AGENT_SECTIONS,
+	RESEARCHER_AGENT_HANDOFF_FIELDS,
+)
+from advisor_agent import advisor_agent, ADVISOR_AGENT_SECTIONS
+
+
+# Stages in execution order: (executor id, agent, required output sections)
+_STAGES = (
+	("plan_agent", plan_agent, PLAN_AGENT_SECTIONS),
+	("researcher_agent", researcher_agent, RESEARCHER_AGENT_SECTIONS),
+	("advisor_agent", advisor_agent, ADVISOR_AGENT_SECTIONS),
+)
+STAGE_IDS = tuple(stage_id for stage_id, _, _ in _STAGES)
+
+
+def agents_ready() -> bool:
+	"""Whether every stage's agent was created (an agent module sets it to None when it fails)."""
+	return all(agent is not None for _, agent, _ in _STAGES)
+
+# Stages left out of the shorter workflow served under load (LOAD_SHED_ACTION=short)
+_SHORT_SKIPPED = ("researcher_agent",)
+
+
+# Relative share of a request deadline each stage plans with (see
+# agent_runtime.deadline); a stage may use its weight's fraction of the time
+# left for itself and the stages after it. The researcher may be skipped.
+_STAGE_WEIGHTS = {"plan_agent": 1.0, "researcher_agent": 1.5, "advisor_agent": 1.5}
+_OPTIONAL_STAGES = ("researcher_agent",)
+
+
+def stages_for(mode: str = FULL) -> tuple[str, ...]:
+	"""Executor ids a run in the given serving mode goes through, in order."""
+	if mode == SHORT:
+		return tuple(stage_id for stage_id in STAGE_IDS if stage_id not in _SHORT_SKIPPED)
+	return STAGE_IDS
+
+# Intermediate stages that can hand off compact JSON instead of markdown
+# (STRUCTURED_HANDOFF=true): executor id -> (agent, JSON fields per section)
+_COMPACT_STAGES = {
+	"plan_agent": (plan_agent_compact, PLAN_AGENT_HANDOFF_FIELDS),
+	"researcher_agent": (researcher_agent_compact, RESEARCHER_AGENT_HANDOFF_FIELDS),
+}
 
 
+# Summarizes very long requests before the first stage reads them
+# (INPUT_CONDENSE_THRESHOLD_TOKENS); see agent_runtime.condense.
+_CONDENSER = input_condenser
 
 
-# Create agent executors
-planner_executor = AgentExecutor(plan_agent, id="plan_agent")  # type: ignore
-research_executor = AgentExecutor(researcher_agent, id="researcher_agent")  # type: ignore
-advisor_executor = AgentExecutor(advisor_agent, id="advisor_agent")  # type: ignore
+def condenser() -> Optional[InputCondenser]:
+	"""Condenser for long requests, or None when its agent is unavailable."""
+	return InputCondenser(_CONDENSER) if _CONDENSER is not None else None
+
+
+def _budget_share(stage_id: str, stages: tuple[str, ...]) -> float:
+	"""Fraction of the time left at `stage_id` that it may use, the rest going to later stages."""
+	later = stages[stages.index(stage_id):]
+	return _STAGE_WEIGHTS[stage_id] / sum(_STAGE_WEIGHTS[s] for s in later)
+
+
+def _stage_agent(stage_id: str, agent, sections, structured: bool, mode: str = FULL) -> StageAgent:
+	options = {
+		"model_id": load_shedder().stage_model(stage_id, mode),
+		"budget_share": _budget_share(stage_id, stages_for(mode)),
+		"optional": stage_id in _OPTIONAL_STAGES,
+	}
+	compact_agent, fields = _COMPACT_STAGES.get(stage_id, (None, ()))
+	if structured and compact_agent is not None:
+		return StageAgent(compact_agent, required_sections=sections, handoff_fields=fields, **options)
+	return StageAgent(agent, required_sections=sections, **options)
+
+
+def _create_executors(
+	start_at: str = STAGE_IDS[0], structured: Optional[bool] = None, mode: str = FULL
+) -> list[AgentExecutor]:
+	# Each agent is wrapped in a StageAgent so per-stage policies
+	# (e.g. EARLY_STOP_SECTIONS, STRUCTURED_HANDOFF) apply without changing the agents.
+	stages = stages_for(mode)
+	if start_at not in stages:
+		raise ValueError(f"Unknown stage '{start_at}'. Expected one of {', '.join(stages)}")
+	if structured is None:
+		structured = env_flag("STRUCTURED_HANDOFF")
+	first = stages.index(start_at)
+	return [
+		AgentExecutor(_stage_agent(stage_id, agent, sections, structured, mode), id=stage_id)  # type: ignore
+		for stage_id, agent, sections in _STAGES
+		if stage_id in stages[first:]
+	]
+
+
+def _build_workflow(executors: list[AgentExecutor]):
+	builder = WorkflowBuilder()
+	for executor in executors:
+		builder.add_agent(executor)
+	for upstream, downstream in zip(executors, executors[1:]):
+		builder.add_edge(upstream, downstream)
+	return builder.set_start_executor(executors[0]).build()
+
+
+def create_workflow(start_at: str = STAGE_IDS[0], *, structured: Optional[bool] = None, mode: str = FULL):
+	"""Build a fresh planner -> researcher -> advisor workflow.
+
+	Every call creates new executors (and agent threads), so separate runs do
+	not share conversation state and can execute concurrently. `start_at`
+	drops the stages before it, which is how a checkpointed run resumes.
+	`structured` selects the compact JSON handoff between stages and
+	defaults to the `STRUCTURED_HANDOFF` environment variable. `mode` is
+	the serving mode of the run (see `agent_runtime.load_shedding`): `fast`
+	points the shed stages at the fast model, `short` leaves out the
+	researcher.
+	"""
+	return _build_workflow(_create_executors(start_at, structured, mode))
 
 
 # Create a simple workflow using WorkflowBuilder for better DevUI compatibility
 # Flow: planner -> researcher -> advisor
-workflow = (
-	WorkflowBuilder()
-	.add_agent(planner_executor)
-	.add_agent(research_executor)
-	.add_agent(advisor_executor)
-	.add_edge(planner_executor, research_executor)
-	.add_edge(research_executor, advisor_executor)
-	.set_start_executor(planner_executor)
-	.build()
-)
-
-    
\ No newline at end of file
+planner_executor, research_executor, advisor_executor = _create_executors()
+workflow = _build_workflow([planner_executor, research_executor, advisor_executor])